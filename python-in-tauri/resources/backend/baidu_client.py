@@ -0,0 +1,276 @@
+"""
+百度翻译API的异步客户端
+所有请求共用一个带连接池的 httpx.AsyncClient：保持长连接（keep-alive），分段请求不再每次重新建立TCP连接，
+请求在事件循环中异步等待，不阻塞本地模型推理和其他接口
+参数放在POST表单正文中（不受URL长度限制）；一个请求的 q 可以包含多行，百度按行翻译并为每行返回一条 trans_result，
+多个分段按UTF-8字节数打包到同一个请求中，再按顺序拆回各段
+每个 appid 按账户的QPS限额经令牌桶发送请求；限流（54003）和服务端临时错误按带随机抖动的指数退避重试
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+from hashlib import md5
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINT = "http://api.fanyi.baidu.com"
+TRANSLATE_PATH = "/api/trans/vip/translate"
+
+# 默认值（可通过配置覆盖）
+DEFAULT_TIMEOUT = 10.0  # 读写超时（秒）
+DEFAULT_CONNECT_TIMEOUT = 5.0  # 建立连接的超时（秒）
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_MAX_KEEPALIVE = 5
+
+DEFAULT_QPS = 1.0  # 标准版账户的QPS限额
+DEFAULT_MAX_RETRIES = 3
+
+# 重试的退避时间（秒）：第n次重试等待 base * 2^n 的一半到全部（随机抖动），不超过上限
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# 访问频率受限
+RATE_LIMIT_CODE = "54003"
+# 可以重试的错误码：请求超时、系统错误、访问频率受限
+RETRYABLE_CODES = {"52001", "52002", RATE_LIMIT_CODE}
+
+# 单个请求的 q 的上限（UTF-8字节数，百度建议不超过6000字节）
+MAX_QUERY_BYTES = 6000
+
+
+class BaiduAPIError(Exception):
+    """
+    百度翻译请求失败；code 为百度返回的错误码（网络错误等没有错误码时为 None）
+    retryable 表示稍后重试可能成功（限流、服务端临时错误）
+    """
+
+    def __init__(self, message: str, code: Optional[str] = None, retryable: bool = False):
+        super().__init__(message)
+        self.code = code
+        self.retryable = retryable or code in RETRYABLE_CODES
+
+
+def make_sign(appid: str, query: str, salt: str, appkey: str) -> str:
+    """请求签名：MD5(appid + q + salt + 密钥)"""
+    return md5((appid + query + salt + appkey).encode("utf-8")).hexdigest()
+
+
+def backoff_delay(attempt: int, rate: float) -> float:
+    """第 attempt 次重试前的等待时间（不短于当前速率下两个请求的间隔）"""
+    delay = min(RETRY_MAX_DELAY, max(RETRY_BASE_DELAY, 1 / rate) * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def utf8_len(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def plan_queries(sizes: Sequence[int], max_bytes: int = MAX_QUERY_BYTES) -> List[List[int]]:
+    """
+    按输入顺序将各行分组为请求，返回各组的下标
+    sizes 为每行的UTF-8字节数；每组以换行拼接后不超过 max_bytes（单行超过上限时单独成组）
+    """
+    groups: List[List[int]] = []
+    group: List[int] = []
+    total = 0
+    for index, size in enumerate(sizes):
+        size += 1 if group else 0
+        if group and total + size > max_bytes:
+            groups.append(group)
+            group, total = [], 0
+            size -= 1
+        group.append(index)
+        total += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+class BaiduClient:
+    """
+    共享连接池的百度翻译客户端（只能在事件循环中使用）
+    连接参数变化时在下一次请求前重建连接池；每个 appid 使用独立的令牌桶
+    """
+
+    def __init__(self, endpoint: str = DEFAULT_ENDPOINT):
+        self.endpoint = endpoint
+        self._options: Tuple[float, float, int, int] = (DEFAULT_TIMEOUT, DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_KEEPALIVE)
+        self._client = None
+        self._client_options: Optional[Tuple[float, float, int, int]] = None
+        self.qps = DEFAULT_QPS
+        self.max_retries = DEFAULT_MAX_RETRIES
+        self._buckets: Dict[str, TokenBucket] = {}  # appid -> 令牌桶
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+
+    def configure(self, timeout: float = DEFAULT_TIMEOUT, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, max_connections: int = DEFAULT_MAX_CONNECTIONS, max_keepalive: int = DEFAULT_MAX_KEEPALIVE, qps: float = DEFAULT_QPS, max_retries: int = DEFAULT_MAX_RETRIES, endpoint: str = DEFAULT_ENDPOINT):
+        self.endpoint = endpoint.rstrip("/") or DEFAULT_ENDPOINT
+        self._options = (max(0.1, timeout), max(0.1, connect_timeout), max(1, max_connections), max(0, max_keepalive))
+        self.qps = max(0.1, qps)
+        self.max_retries = max(0, max_retries)
+        for bucket in self._buckets.values():
+            bucket.configure(self.qps)
+
+    @property
+    def concurrency(self) -> int:
+        """同时发送的请求数上限：每秒能发出的请求数（不超过连接池大小）"""
+        return max(1, min(int(self.qps), self._options[2]))
+
+    def _bucket(self, appid: str) -> TokenBucket:
+        bucket = self._buckets.get(appid)
+        if bucket is None:
+            bucket = self._buckets[appid] = TokenBucket(self.qps)
+        return bucket
+
+    async def _get_client(self):
+        import httpx
+
+        if self._client is not None and self._client_options == self._options:
+            return self._client
+        old, self._client = self._client, None
+        if old is not None:
+            await old.aclose()
+        timeout, connect_timeout, max_connections, max_keepalive = self._options
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        )
+        self._client_options = self._options
+        return self._client
+
+    async def translate(self, appid: str, appkey: str, query: str, from_lang: str, to_lang: str) -> Dict[str, Any]:
+        """
+        发送翻译请求，返回百度的响应（包含 trans_result）
+        按 appid 的令牌桶限速；限流和服务端临时错误最多重试 max_retries 次，仍失败时抛出 BaiduAPIError
+        """
+        bucket = self._bucket(appid)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            try:
+                result = await self._send(appid, appkey, query, from_lang, to_lang)
+            except BaiduAPIError as e:
+                if e.code == RATE_LIMIT_CODE:
+                    bucket.throttle()
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt, bucket.rate)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                logger.warning(f"{str(e)}，{delay:.2f}秒后第{attempt}次重试")
+                await asyncio.sleep(delay)
+                continue
+            bucket.recover()
+            return result
+
+    async def _send(self, appid: str, appkey: str, query: str, from_lang: str, to_lang: str) -> Dict[str, Any]:
+        """发送一次请求"""
+        import httpx
+
+        client = await self._get_client()
+        salt = str(random.randint(32768, 65536))
+        payload = {
+            'appid': appid,
+            'q': query,
+            'from': from_lang,
+            'to': to_lang,
+            'salt': salt,
+            'sign': make_sign(appid, query, salt, appkey)
+        }
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        try:
+            response = await client.post(self.endpoint + TRANSLATE_PATH, data=payload, headers=headers)
+        except httpx.TimeoutException as e:
+            self._record(failed=True)
+            raise BaiduAPIError(f"百度翻译API请求超时: {type(e).__name__}") from e
+        except httpx.HTTPError as e:
+            self._record(failed=True)
+            raise BaiduAPIError(f"百度翻译API请求失败: {str(e)}") from e
+
+        result = _parse_response(response.status_code, response.text)
+        self._record(failed=isinstance(result, BaiduAPIError))
+        if isinstance(result, BaiduAPIError):
+            raise result
+        return result
+
+    def _record(self, failed: bool):
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.errors += 1
+
+    async def translate_lines(self, appid: str, appkey: str, lines: Sequence[str], from_lang: str, to_lang: str) -> Tuple[List[str], Optional[str]]:
+        """
+        在一个请求中翻译多行（每行不能包含换行、不能为空），返回 (与 lines 一一对应的译文, 识别出的源语言)
+        返回的条数与行数不一致时抛出 BaiduAPIError
+        """
+        result = await self.translate(appid, appkey, "\n".join(lines), from_lang, to_lang)
+        entries = result['trans_result']
+        if len(entries) != len(lines):
+            logger.error(f"百度翻译API返回 {len(entries)} 条结果，请求包含 {len(lines)} 行")
+            raise BaiduAPIError("百度翻译API返回的结果条数与请求的行数不一致")
+        return [entry.get('dst', '') for entry in entries], result.get('from')
+
+    async def aclose(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        timeout, connect_timeout, max_connections, max_keepalive = self._options
+        with self._lock:
+            requests, errors, retries = self.requests, self.errors, self.retries
+        return {
+            "endpoint": self.endpoint,
+            "timeout": timeout,
+            "connect_timeout": connect_timeout,
+            "max_connections": max_connections,
+            "max_keepalive": max_keepalive,
+            "qps": self.qps,
+            "concurrency": self.concurrency,
+            "max_retries": self.max_retries,
+            "requests": requests,
+            "errors": errors,
+            "retries": retries,
+            # 各 appid 的限流状态和实际QPS（appid 只显示末4位）
+            "rate_limits": {"*" + appid[-4:]: bucket.stats() for appid, bucket in list(self._buckets.items())},
+        }
+
+
+def _parse_response(status_code: int, text: str):
+    """解析百度的响应，返回结果字典或 BaiduAPIError"""
+    logger.info(f"百度翻译API响应状态码: {status_code}")
+    if status_code != 200:
+        logger.error(f"百度翻译API返回错误状态码: {status_code}")
+        return BaiduAPIError(f"百度翻译API返回错误状态码: {status_code}", retryable=status_code >= 500)
+
+    text = text.strip()
+    if not text:
+        logger.error("百度翻译API返回空响应")
+        return BaiduAPIError("百度翻译API返回空响应")
+
+    try:
+        result = json.loads(text)
+    except json.JSONDecodeError as e:
+        logger.error(f"百度翻译API返回非JSON格式: {text[:200]}")
+        return BaiduAPIError(f"百度翻译API返回非JSON格式: {str(e)}")
+
+    if 'error_code' in result and str(result['error_code']) != "52000":
+        error_msg = result.get('error_msg', f"错误代码: {result.get('error_code')}")
+        if str(result['error_code']) in RETRYABLE_CODES:
+            logger.warning(f"百度翻译API错误: {error_msg}")
+        else:
+            logger.error(f"百度翻译API错误: {error_msg}")
+        return BaiduAPIError(f"百度翻译API错误: {error_msg}", code=str(result['error_code']))
+
+    if not result.get('trans_result'):
+        return BaiduAPIError("百度翻译API返回结果格式错误")
+    return result
@@ -0,0 +1,196 @@
+"""
+百度翻译提供商的压测
+在后台线程中启动本地模拟服务（baidu_mock_server.py），或用 --endpoint 指定已经运行的模拟服务，
+通过 Translator 的百度翻译路径（分段打包、限流、重试）执行两个场景，输出吞吐量和延迟分位数：
+  documents：多篇长文档并发调用 translate_with_baidu（每篇按行打包为多个请求）
+  batch：大量短文本通过 submit_many 合并为多行请求（延迟按每个文本完成的时间计算）
+使用临时配置文件，不读取也不修改应用的配置，不使用翻译记忆
+
+用法：
+    python baidu_load_test.py --qps 10 --mock-qps 10 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from baidu_mock_server import DEFAULT_APPID, DEFAULT_APPKEY, MockState, create_app, mock_translate
+from segmenter import iter_segments
+
+_WORDS = (
+    "the quick brown fox jumps over lazy dog while translation engines process long documents "
+    "every request carries several lines of text and the client packs them by bytes before sending"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def make_document(rng: random.Random, lines: int) -> str:
+    """生成一篇有段落空行和缩进的英文文档"""
+    parts = []
+    for i in range(lines):
+        indent = "    " if i % 7 == 3 else ""
+        parts.append(indent + " ".join(_sentence(rng) for _ in range(rng.randint(1, 3))))
+        if i % 10 == 9:
+            parts.append("")
+    return "\n".join(parts)
+
+
+def expected_translation(text: str, to_lang: str) -> str:
+    """模拟服务返回的译文拼接后的结果（用于校验每一行都映射回了原来的位置）"""
+    return "".join(segment.render(mock_translate(segment.body, to_lang) if segment.body else "") for segment in iter_segments(text))
+
+
+def percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def report(name: str, elapsed: float, latencies: List[float], texts: List[str], succeeded: int, complete: int):
+    lines = sum(1 for text in texts for segment in iter_segments(text) if segment.body)
+    size = sum(len(text.encode("utf-8")) for text in texts)
+    print(f"\n场景 {name}: {len(texts)} 个文本，{lines} 行，{size / 1024:.1f} KB，耗时 {elapsed:.2f} 秒")
+    print(f"  吞吐量: {len(texts) / elapsed:.2f} 文本/秒，{lines / elapsed:.1f} 行/秒，{size / 1024 / elapsed:.1f} KB/秒")
+    print(
+        f"  延迟(毫秒): p50 {percentile(latencies, 0.5) * 1000:.0f}，p95 {percentile(latencies, 0.95) * 1000:.0f}，"
+        f"p99 {percentile(latencies, 0.99) * 1000:.0f}，max {max(latencies, default=0) * 1000:.0f}"
+    )
+    print(f"  成功 {succeeded}/{len(texts)}，译文完整 {complete}/{len(texts)}")
+
+
+async def run_documents(translator, documents: List[str], concurrency: int, to_lang: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def run(text: str):
+        async with semaphore:
+            started = time.monotonic()
+            result = await translator.translate_with_baidu(text, "en", "zh")
+            latencies.append(time.monotonic() - started)
+            return result
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(run(text) for text in documents))
+    elapsed = time.monotonic() - started
+    succeeded = sum(1 for result in results if result.get("success"))
+    complete = sum(1 for text, result in zip(documents, results) if result.get("translated_text") == expected_translation(text, to_lang))
+    report("documents", elapsed, latencies, documents, succeeded, complete)
+
+
+async def run_batch(translator, texts: List[str], to_lang: str):
+    latencies: List[float] = []
+    started = time.monotonic()
+    futures = translator.submit_many(texts, "en", "zh", provider="baidu", use_cache=False)
+    for future in futures:
+        future.add_done_callback(lambda _: latencies.append(time.monotonic() - started))
+    results = await asyncio.gather(*futures)
+    elapsed = time.monotonic() - started
+    succeeded = sum(1 for result in results if result.get("success"))
+    complete = sum(1 for text, result in zip(texts, results) if result.get("translated_text") == expected_translation(text, to_lang))
+    report("batch", elapsed, latencies, texts, succeeded, complete)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_server(state: MockState):
+    """在后台线程中启动模拟服务，返回 (server, 地址)"""
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(state), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("模拟服务启动超时")
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def run(args, endpoint: str) -> Dict[str, Any]:
+    from translator import Translator
+
+    # 只输出警告（重试等），不输出每个请求的日志
+    logging.getLogger().setLevel(logging.WARNING)
+
+    config = {
+        "baidu_endpoint": endpoint,
+        "baidu_appid": args.appid,
+        "baidu_appkey": args.appkey,
+        "baidu_qps": args.qps,
+        "baidu_max_retries": args.max_retries,
+        "translation_memory_enabled": False,
+        "preload_model": False,
+    }
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(config, f)
+        config_path = f.name
+    translator = Translator(config_path=config_path)
+    try:
+        rng = random.Random(args.seed)
+        if args.documents:
+            await run_documents(translator, [make_document(rng, args.lines) for _ in range(args.documents)], args.concurrency, "zh")
+        if args.batch:
+            await run_batch(translator, [_sentence(rng) for _ in range(args.batch)], "zh")
+        return translator.get_baidu_stats()
+    finally:
+        await translator.baidu.aclose()
+        os.unlink(config_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="百度翻译提供商的压测（默认使用本地模拟服务）")
+    parser.add_argument("--endpoint", help="已经运行的模拟服务地址；不指定时在后台启动一个")
+    parser.add_argument("--appid", default=DEFAULT_APPID)
+    parser.add_argument("--appkey", default=DEFAULT_APPKEY)
+    parser.add_argument("--qps", type=float, default=10, help="客户端的QPS限额（baidu_qps）")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--documents", type=int, default=20, help="documents 场景的文档数（0 表示跳过）")
+    parser.add_argument("--lines", type=int, default=200, help="每篇文档的行数")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时翻译的文档数")
+    parser.add_argument("--batch", type=int, default=1000, help="batch 场景的短文本数（0 表示跳过）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mock-qps", type=float, default=10, help="模拟服务每秒允许的请求数（0 表示不限）")
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    state: Optional[MockState] = None
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        state = MockState(args.appid, args.appkey, args.mock_qps, args.latency_ms, args.jitter_ms, args.error_rate)
+        server, endpoint = start_mock_server(state)
+        print(f"已启动模拟服务: {endpoint}")
+    try:
+        client_stats = asyncio.run(run(args, endpoint))
+    finally:
+        if server is not None:
+            server.should_exit = True
+
+    print("\n客户端统计:")
+    print(json.dumps(client_stats, ensure_ascii=False, indent=2))
+    if state is not None:
+        print("模拟服务统计:")
+        print(json.dumps(state.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+本地的百度翻译API模拟服务（离线测试和压测用）
+实现 /api/trans/vip/translate 的接口约定：参数可放在表单正文或URL中，校验 appid 和签名，
+q 按行翻译并为每个非空行返回一条 trans_result；译文为在原文前加上目标语言标记的伪翻译（见 mock_translate）
+可以注入响应延迟、按QPS返回限流错误（54003）和随机返回5xx错误
+
+用法：
+    python baidu_mock_server.py --port 8765 --appid test --appkey secret --qps 10 --latency-ms 80
+然后在配置中将 baidu_endpoint 设为 http://127.0.0.1:8765，baidu_appid/baidu_appkey 与上面一致
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from hashlib import md5
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+DEFAULT_APPID = "mock-appid"
+DEFAULT_APPKEY = "mock-appkey"
+
+_REQUIRED_PARAMS = ("q", "from", "to", "appid", "salt", "sign")
+
+
+def mock_translate(line: str, to_lang: str) -> str:
+    """模拟服务的伪翻译（压测时用于校验译文与原文的对应关系）"""
+    return f"[{to_lang}]{line}"
+
+
+def _detect(text: str) -> str:
+    return "zh" if any("一" <= ch <= "鿿" for ch in text) else "en"
+
+
+def _error(code: str, message: str) -> JSONResponse:
+    return JSONResponse({"error_code": code, "error_msg": message})
+
+
+class MockState:
+    """模拟服务的配置和统计（线程安全）"""
+
+    def __init__(self, appid: str = DEFAULT_APPID, appkey: str = DEFAULT_APPKEY, qps: float = 0, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0):
+        self.appid = appid
+        self.appkey = appkey
+        self.qps = qps  # 每个 appid 每秒允许的请求数，0 表示不限
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate  # 返回5xx错误的概率
+        self._lock = threading.Lock()
+        self._recent: Dict[str, Deque[float]] = {}  # appid -> 最近一秒内的请求时间
+        self.requests = 0
+        self.translated = 0
+        self.lines = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.rejected = 0  # 参数、appid 或签名错误
+
+    def admit(self, appid: str) -> bool:
+        """按QPS限额记录一次请求，超出限额时返回 False"""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if self.qps <= 0:
+                return True
+            recent = self._recent.setdefault(appid, deque())
+            while recent and now - recent[0] >= 1.0:
+                recent.popleft()
+            if len(recent) >= self.qps:
+                self.rate_limited += 1
+                return False
+            recent.append(now)
+            return True
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "qps": self.qps,
+                "latency_ms": self.latency_ms,
+                "jitter_ms": self.jitter_ms,
+                "error_rate": self.error_rate,
+                "requests": self.requests,
+                "translated": self.translated,
+                "lines": self.lines,
+                "rate_limited": self.rate_limited,
+                "server_errors": self.server_errors,
+                "rejected": self.rejected,
+            }
+
+
+def create_app(state: Optional[MockState] = None) -> FastAPI:
+    state = state or MockState()
+    app = FastAPI(title="Baidu Translate Mock")
+    app.state.mock = state
+
+    @app.api_route("/api/trans/vip/translate", methods=["GET", "POST"])
+    async def translate(request: Request):
+        params = dict(request.query_params)
+        body = await request.body()
+        if body:
+            params.update(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+
+        if any(not params.get(name) for name in _REQUIRED_PARAMS):
+            state.count("rejected")
+            return _error("54000", "必填参数为空")
+        appid = params["appid"]
+        if appid != state.appid:
+            state.count("rejected")
+            return _error("52003", "UNAUTHORIZED USER")
+        sign = md5((appid + params["q"] + params["salt"] + state.appkey).encode("utf-8")).hexdigest()
+        if sign != params["sign"]:
+            state.count("rejected")
+            return _error("54001", "Invalid Sign")
+        if not state.admit(appid):
+            return _error("54003", "Invalid Access Limit")
+
+        delay = state.latency_ms + random.uniform(0, state.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if state.error_rate > 0 and random.random() < state.error_rate:
+            state.count("server_errors")
+            return Response("Service Unavailable", status_code=random.choice((500, 502, 503)))
+
+        lines = [line for line in params["q"].split("\n") if line.strip()]
+        state.count("translated")
+        state.count("lines", len(lines))
+        from_lang = params["from"] if params["from"] != "auto" else _detect(params["q"])
+        return JSONResponse({
+            "from": from_lang,
+            "to": params["to"],
+            "trans_result": [{"src": line, "dst": mock_translate(line, params["to"])} for line in lines],
+        })
+
+    @app.get("/stats")
+    async def stats():
+        return state.stats()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地的百度翻译API模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--appid", default=DEFAULT_APPID)
+    parser.add_argument("--appkey", default=DEFAULT_APPKEY)
+    parser.add_argument("--qps", type=float, default=0, help="每个 appid 每秒允许的请求数，超出时返回54003（0 表示不限）")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的响应延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="在延迟上随机增加的最大毫秒数")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回5xx错误的概率（0~1）")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    state = MockState(args.appid, args.appkey, args.qps, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"百度翻译模拟服务: http://{args.host}:{args.port}（配置: {json.dumps(state.stats(), ensure_ascii=False)}）")
+    uvicorn.run(create_app(state), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+CPU推理参数
+批大小（n_batch / n_ubatch）、批处理线程数、flash attention 和KV缓存的量化类型，
+按模型的 GGUF 文件头校验：不支持的组合回退为安全值并给出警告
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from speculative import MODE_DRAFT_MODEL, SPECULATIVE_MODES
+
+logger = logging.getLogger(__name__)
+
+# KV缓存类型：名称 -> (GGML类型编号, 每个元素的字节数)
+# 量化类型按块存储，32 个元素一块（q8_0 每块 34 字节，q4_0 每块 18 字节）
+KV_CACHE_TYPES = {
+    "f32": (0, 4.0),
+    "f16": (1, 2.0),
+    "q4_0": (2, 18 / 32),
+    "q4_1": (3, 20 / 32),
+    "q5_0": (6, 22 / 32),
+    "q5_1": (7, 24 / 32),
+    "q8_0": (8, 34 / 32),
+}
+
+DEFAULT_KV_CACHE_TYPE = "f16"
+
+# 量化KV缓存要求每个注意力头的维度是量化块大小的整数倍
+_QUANT_BLOCK_SIZE = 32
+
+
+def kv_element_bytes(cache_type) -> float:
+    """KV缓存每个元素的字节数，cache_type 可以是名称或GGML类型编号"""
+    for name, (type_id, size) in KV_CACHE_TYPES.items():
+        if cache_type == name or cache_type == type_id:
+            return size
+    return KV_CACHE_TYPES[DEFAULT_KV_CACHE_TYPE][1]
+
+
+def check_settings(settings) -> List[str]:
+    """检查配置中的推理参数，返回错误信息列表（用于保存配置前的校验）"""
+    errors = []
+    for key in ("cache_type_k", "cache_type_v"):
+        value = getattr(settings, key)
+        if value not in KV_CACHE_TYPES:
+            errors.append(f"{key} 不支持 {value!r}，可选: {', '.join(KV_CACHE_TYPES)}")
+    if settings.n_batch < 1:
+        errors.append("n_batch 必须大于 0")
+    if settings.n_ubatch < 1:
+        errors.append("n_ubatch 必须大于 0")
+    if settings.n_threads_batch < 0:
+        errors.append("n_threads_batch 不能为负数（0 表示与 threads 相同）")
+    if settings.short_context_length < 0:
+        errors.append("short_context_length 不能为负数（0 表示不使用短上下文实例）")
+    if settings.speculative_mode not in SPECULATIVE_MODES:
+        errors.append(f"speculative_mode 不支持 {settings.speculative_mode!r}，可选: {', '.join(SPECULATIVE_MODES)}")
+    elif settings.speculative_mode == MODE_DRAFT_MODEL and not settings.speculative_draft_model:
+        errors.append("speculative_mode 为 draft_model 时需要配置 speculative_draft_model")
+    if settings.speculative_tokens < 0:
+        errors.append("speculative_tokens 不能为负数（0 表示使用默认值）")
+    return errors
+
+
+def head_dim(info: Optional[Dict[str, Any]]) -> Optional[int]:
+    """注意力头的维度（来自 GGUF 文件头）"""
+    if not info:
+        return None
+    key_length = info.get("key_length")
+    if key_length:
+        return key_length
+    embedding = info.get("embedding_length")
+    heads = info.get("head_count")
+    if embedding and heads:
+        return embedding // heads
+    return None
+
+
+def resolve_inference_params(settings, info: Optional[Dict[str, Any]], n_ctx: int) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    按模型校验推理参数，返回 (传给 Llama 的参数, 警告列表)
+    只包含与 llama.cpp 默认值不同的参数，旧版本的 llama-cpp-python 也能加载
+    """
+    warnings = []
+    params: Dict[str, Any] = {}
+
+    n_batch = max(1, settings.n_batch)
+    if n_batch > n_ctx:
+        n_batch = n_ctx
+    n_ubatch = max(1, settings.n_ubatch)
+    if n_ubatch > n_batch:
+        warnings.append(f"n_ubatch ({n_ubatch}) 不能大于 n_batch，已调整为 {n_batch}")
+        n_ubatch = n_batch
+    params["n_batch"] = n_batch
+    if n_ubatch != n_batch:
+        params["n_ubatch"] = n_ubatch
+    if settings.n_threads_batch > 0:
+        params["n_threads_batch"] = settings.n_threads_batch
+    if settings.flash_attn:
+        params["flash_attn"] = True
+
+    type_k = settings.cache_type_k if settings.cache_type_k in KV_CACHE_TYPES else DEFAULT_KV_CACHE_TYPE
+    type_v = settings.cache_type_v if settings.cache_type_v in KV_CACHE_TYPES else DEFAULT_KV_CACHE_TYPE
+    dim = head_dim(info)
+    if dim is not None and dim % _QUANT_BLOCK_SIZE:
+        for name, value in (("cache_type_k", type_k), ("cache_type_v", type_v)):
+            if value.startswith("q"):
+                warnings.append(f"模型的注意力头维度 {dim} 不是 {_QUANT_BLOCK_SIZE} 的整数倍，{name} 无法使用 {value}，已回退为 {DEFAULT_KV_CACHE_TYPE}")
+        type_k = DEFAULT_KV_CACHE_TYPE if type_k.startswith("q") else type_k
+        type_v = DEFAULT_KV_CACHE_TYPE if type_v.startswith("q") else type_v
+    if type_v.startswith("q") and not settings.flash_attn:
+        warnings.append(f"量化的V缓存（{type_v}）需要开启 flash_attn，已回退为 {DEFAULT_KV_CACHE_TYPE}")
+        type_v = DEFAULT_KV_CACHE_TYPE
+    if type_k != DEFAULT_KV_CACHE_TYPE:
+        params["type_k"] = KV_CACHE_TYPES[type_k][0]
+    if type_v != DEFAULT_KV_CACHE_TYPE:
+        params["type_v"] = KV_CACHE_TYPES[type_v][0]
+    return params, warnings
+
+
+def describe_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """将参数中的GGML类型编号转换为名称（用于接口返回）"""
+    names = {type_id: name for name, (type_id, _) in KV_CACHE_TYPES.items()}
+    described = dict(params)
+    for key in ("type_k", "type_v"):
+        described[key] = names.get(params.get(key, KV_CACHE_TYPES[DEFAULT_KV_CACHE_TYPE][0]), DEFAULT_KV_CACHE_TYPE)
+    return described
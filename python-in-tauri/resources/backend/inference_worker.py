@@ -0,0 +1,552 @@
+"""
+推理工作线程
+由专用线程独占 Llama 实例，事件循环通过 submit/generate/stream 异步提交任务，
+避免同步推理阻塞 FastAPI 的其他路由（/health、/models、/config 等）
+任务经由 RequestScheduler 按优先级排队；InferencePool 让多个工作线程共享同一队列，
+每个线程持有自己的模型实例和线程预算，用于批量任务的并行翻译
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from model_cache import ResidentModelCache
+from prompt_cache import PromptPrefixCache
+from scheduler import RequestScheduler, current_priority
+from speculative import MODE_OFF, SpeculativeStats, create_draft
+
+logger = logging.getLogger(__name__)
+
+# 流式输出结束标记
+_STREAM_END = object()
+
+# 空闲工作线程检查停止标记的间隔（秒）
+_IDLE_POLL_INTERVAL = 0.5
+
+
+class InferenceWorker:
+    """
+    持有 Llama 实例的推理工作线程
+    所有推理（加载、生成、释放）都在该线程中执行
+    生成任务自带所需的模型参数，调度器调整任务顺序后仍能加载到正确的模型
+    切换模型时旧实例在内存预算内常驻（ResidentModelCache），再次切换回来无需重新加载
+    """
+
+    def __init__(self, name: str = "inference-worker", scheduler: Optional[RequestScheduler] = None, n_threads: Optional[int] = None, resident_cache: Optional[ResidentModelCache] = None, speculative_stats: Optional[SpeculativeStats] = None):
+        self.name = name
+        self.n_threads = n_threads  # 覆盖模型参数中的 n_threads（线程池按核心数分配）
+        self.llm = None
+        self.model_key: Optional[Hashable] = None
+        self.model_path: Optional[str] = None
+        self.model_params: Dict[str, Any] = {}
+        self.resident: "OrderedDict[Hashable, Tuple[Any, str, Dict[str, Any]]]" = OrderedDict()  # 常驻实例，按使用顺序排列
+        self.resident_cache = resident_cache or ResidentModelCache()
+        self.prefix_cache = PromptPrefixCache()
+        self.speculative_stats = speculative_stats or SpeculativeStats()
+        self.scheduler = scheduler or RequestScheduler()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()  # 执行任务期间持有
+        self._stopping = False
+        self._unload_pending = False
+        self._evict_pending: Set[Hashable] = set()  # 其他线程要求淘汰的常驻实例
+        self._adopt_pending: List[Tuple[Hashable, Any, str, Dict[str, Any]]] = []  # 后台加载完成、等待接管的实例
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._lock:
+            if self._stopping or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logger.info(f"推理工作线程已启动: {self.name}")
+
+    def retire(self) -> Optional[threading.Thread]:
+        """标记线程退出（当前任务完成后退出并释放模型），返回线程对象"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            self._stopping = True
+        return thread
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止工作线程，当前任务执行完毕后释放模型"""
+        thread = self.retire()
+        if thread is None:
+            return
+        thread.join(timeout)
+        logger.info(f"推理工作线程已停止: {self.name}")
+
+    def _run(self):
+        while not self._stopping:
+            job = self.scheduler.get(timeout=_IDLE_POLL_INTERVAL, target=self)
+            if self._evict_pending or self._adopt_pending:
+                with self._busy:
+                    self._take_adopted()
+                    self._evict_requested()
+            if job is None:
+                continue
+            fn, future, loop = job
+            if future.cancelled():
+                continue
+            with self._busy:
+                if self._unload_pending:
+                    self._unload()
+                try:
+                    result = fn(self)
+                except BaseException as e:  # noqa: B902 - 异常需要原样交给等待方
+                    loop.call_soon_threadsafe(_set_exception, future, e)
+                else:
+                    loop.call_soon_threadsafe(_set_result, future, result)
+        # 指定由本线程执行、尚未开始的任务不会再被执行
+        for _, future, loop in self.scheduler.remove_target(self):
+            loop.call_soon_threadsafe(_cancel, future)
+        with self._busy:
+            self._unload()
+
+    def unload(self):
+        """
+        释放所有模型实例（包括常驻实例）
+        线程空闲时立即释放；正在执行任务时，等当前任务完成后再释放
+        """
+        self._unload_pending = True
+        if self._busy.acquire(blocking=False):
+            try:
+                self._unload()
+            finally:
+                self._busy.release()
+
+    def is_using(self, key: Hashable) -> bool:
+        """是否正在用该实例执行任务"""
+        return self._busy.locked() and self.model_key == key
+
+    def request_evict(self, key: Hashable):
+        """要求淘汰一个常驻实例（由本线程在空闲或下一个任务开始前释放）"""
+        with self._lock:
+            self._evict_pending.add(key)
+
+    def has_model(self, key: Hashable) -> bool:
+        """是否已持有（或即将接管）该实例"""
+        with self._lock:
+            if any(pending[0] == key for pending in self._adopt_pending):
+                return True
+        return key in self.resident
+
+    def adopt(self, key: Hashable, llm, model_path: str, params: Dict[str, Any]):
+        """
+        接管在后台线程中加载好的实例，作为常驻实例（不立即切换）
+        实例在本线程空闲或下一个任务开始前加入 resident
+        """
+        self.resident_cache.add(self, key, model_path, params)
+        with self._lock:
+            self._adopt_pending.append((key, llm, model_path, dict(params)))
+
+    # ---- 以下方法只能在持有模型的线程中执行 ----
+
+    def _load(self, model_path: str, **params) -> bool:
+        """
+        切换到指定的模型：当前模型直接复用，常驻模型直接切换，否则加载新实例
+        加载前按内存预算淘汰最久未使用的常驻实例。返回是否加载了新实例
+        """
+        if self.n_threads:
+            params["n_threads"] = self.n_threads
+        key = _model_key(model_path, params)
+        self._take_adopted()
+        if self.llm is not None and self.model_key == key:
+            self.resident_cache.touch(self, key)
+            return False
+
+        resident = self.resident.get(key)
+        if resident is not None:
+            self.resident.move_to_end(key)
+            self._activate(key, *resident)
+            self.resident_cache.touch(self, key, switched=True)
+            logger.info(f"[{self.name}] 切换到常驻模型: {model_path}")
+            return False
+
+        for victim in self.resident_cache.reserve(self, key, model_path, params):
+            if victim.worker is self:
+                self._evict(victim.key)
+            else:
+                victim.worker.request_evict(victim.key)
+
+        logger.info(f"[{self.name}] 创建CPU模型实例，模型路径: {model_path}，线程数: {params.get('n_threads')}")
+        llm = _create_llama(model_path, params)
+        self.resident[key] = (llm, model_path, dict(params))
+        self._activate(key, llm, model_path, params)
+        self.resident_cache.add(self, key, model_path, params)
+        return True
+
+    def _activate(self, key: Hashable, llm, model_path: str, params: Dict[str, Any]):
+        self.llm = llm
+        self.model_key = key
+        self.model_path = model_path
+        self.model_params = dict(params)
+
+    def _take_adopted(self):
+        with self._lock:
+            adopted = self._adopt_pending
+            self._adopt_pending = []
+        for key, llm, model_path, params in adopted:
+            if key in self.resident:
+                # 加载期间本线程已自行加载了同一实例
+                _close(llm)
+                continue
+            self.resident[key] = (llm, model_path, params)
+
+    def _evict_requested(self):
+        with self._lock:
+            keys = list(self._evict_pending)
+            self._evict_pending.clear()
+        for key in keys:
+            self._evict(key)
+
+    def _evict(self, key: Hashable):
+        """释放一个常驻实例（账本中的记录已由 ResidentModelCache 移除）"""
+        resident = self.resident.pop(key, None)
+        if resident is None:
+            return
+        logger.info(f"[{self.name}] 淘汰常驻模型: {resident[1]}")
+        if key == self.model_key:
+            self._activate(None, None, None, {})
+        _close(resident[0])
+
+    def _unload(self):
+        self._unload_pending = False
+        self.prefix_cache.clear()
+        for key, (llm, _, _) in list(self.resident.items()):
+            self.resident_cache.remove(self, key)
+            _close(llm)
+        self.resident.clear()
+        with self._lock:
+            self._evict_pending.clear()
+            adopted = self._adopt_pending
+            self._adopt_pending = []
+        for key, llm, _, _ in adopted:
+            self.resident_cache.remove(self, key)
+            _close(llm)
+        self._activate(None, None, None, {})
+
+    def _generate(self, prompt: str, model: Optional[Tuple[str, Dict[str, Any]]] = None, cancel: Optional[threading.Event] = None, on_delta: Optional[Callable[[str], None]] = None, on_finish: Optional[Callable[[Optional[str], int], None]] = None, prefix: Optional[str] = None, persist_prefix: bool = False, **kwargs) -> str:
+        """
+        生成文本，on_delta 接收每个文本片段，on_finish(finish_reason, 生成的token数) 在生成结束后调用
+        """
+        if model is not None:
+            model_path, params = model
+            self._load(model_path, **params)
+        if self.llm is None:
+            raise RuntimeError("模型实例不存在")
+        if prefix and prompt.startswith(prefix):
+            prompt = self._prompt_with_cached_prefix(prompt, prefix, persist_prefix)
+        draft = getattr(self.llm, "draft_model", None)
+        if draft is not None and hasattr(draft, "begin"):
+            draft.begin()
+        started = time.perf_counter()
+        output = self.llm(prompt, stream=True, **kwargs)
+        text = ""
+        finish_reason = None
+        n_tokens = 0
+        for chunk in output:
+            if cancel is not None and cancel.is_set():
+                finish_reason = "cancelled"
+                break
+            if 'choices' in chunk and len(chunk['choices']) > 0:
+                choice = chunk['choices'][0]
+                n_tokens += 1  # 流式输出每个片段对应一个token
+                finish_reason = choice.get('finish_reason') or finish_reason
+                delta = choice.get('text', '')
+                if delta:
+                    text += delta
+                    if on_delta is not None:
+                        on_delta(delta)
+        if draft is not None and hasattr(draft, "finish"):
+            drafted, accepted = draft.finish()
+            self.speculative_stats.record(draft.mode, n_tokens, time.perf_counter() - started, drafted, accepted)
+        else:
+            self.speculative_stats.record(MODE_OFF, n_tokens, time.perf_counter() - started)
+        if on_finish is not None:
+            on_finish(finish_reason, n_tokens)
+        return text
+
+    def _prompt_with_cached_prefix(self, prompt: str, prefix: str, persist: bool):
+        """
+        对完整提示词分词，其token以前缀的token开头时恢复已缓存的前缀状态，返回完整提示词的token
+        前缀与原文在边界处合并为不同的token时不使用缓存（与不开启缓存的结果一致）；出错时退回原始提示词（完整求值）
+        """
+        try:
+            tokens = self.llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+            prefix_tokens = self.llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+            if tokens[:len(prefix_tokens)] != prefix_tokens:
+                self.prefix_cache.record_boundary_mismatch()
+                return tokens
+            self.prefix_cache.prepare(self.llm, self.model_path, self.model_params, prefix, persist)
+            return tokens
+        except Exception as e:
+            self.prefix_cache.record_error()
+            logger.warning(f"[{self.name}] 提示词前缀缓存不可用: {str(e)}")
+            return prompt
+
+
+class InferencePool:
+    """
+    推理线程池
+    多个 InferenceWorker 共享同一个优先级队列，空闲的线程取走下一个任务
+    只有一个线程时与单线程推理完全一致
+    """
+
+    def __init__(self, size: int = 1, threads_per_worker: Optional[int] = None):
+        self.scheduler = RequestScheduler()
+        self.resident = ResidentModelCache()  # 所有线程共享的常驻模型内存预算
+        self.speculative = SpeculativeStats()  # 所有线程共享的推测解码统计
+        self.workers: List[InferenceWorker] = []
+        self._inflight: Dict[str, int] = {}  # 模型路径 -> 排队中和执行中的生成任务数
+        self._started = False
+        self._lock = threading.Lock()
+        self.resize(size, threads_per_worker)
+
+    @property
+    def size(self) -> int:
+        return len(self.workers)
+
+    @property
+    def llm(self):
+        """任意一个已加载的模型实例（用于状态查询）"""
+        for worker in self.workers:
+            if worker.llm is not None:
+                return worker.llm
+        return None
+
+    def resize(self, size: int, threads_per_worker: Optional[int] = None):
+        """
+        调整工作线程数量和每个线程的线程预算
+        被替换的线程在当前任务完成后退出并释放模型，排队中的任务由新线程继续执行
+        """
+        size = max(1, int(size))
+        with self._lock:
+            old = self.workers
+            if len(old) == size and all(w.n_threads == threads_per_worker for w in old):
+                return
+            self.workers = [
+                InferenceWorker(name=f"inference-worker-{i}", scheduler=self.scheduler, n_threads=threads_per_worker, resident_cache=self.resident, speculative_stats=self.speculative)
+                for i in range(size)
+            ]
+        for worker in old:
+            worker.retire()
+        if self._started:
+            self.start()
+        logger.info(f"推理线程池大小: {size}，每个线程的线程数: {threads_per_worker or '按配置'}")
+
+    def start(self):
+        self._started = True
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._started = False
+        for worker in self.workers:
+            worker.stop(timeout)
+
+    def unload(self):
+        """释放所有线程的模型实例（正在执行的任务完成后释放）"""
+        for worker in self.workers:
+            worker.unload()
+
+    def speculative_stats(self) -> Dict[str, Any]:
+        """各推测解码模式的生成速度和候选接受率"""
+        return self.speculative.stats()
+
+    def resident_stats(self) -> Dict[str, Any]:
+        """常驻模型的内存占用和加载/淘汰计数"""
+        return self.resident.stats()
+
+    def prefix_cache_stats(self) -> Dict[str, Any]:
+        """汇总各线程的提示词前缀缓存统计"""
+        totals: Dict[str, Any] = {}
+        for worker in self.workers:
+            for key, value in worker.prefix_cache.stats().items():
+                if key != "hit_rate":
+                    totals[key] = totals.get(key, 0) + value
+        lookups = totals.get("hits", 0) + totals.get("misses", 0) + totals.get("disk_hits", 0)
+        totals["hit_rate"] = round((totals.get("hits", 0) + totals.get("disk_hits", 0)) / lookups, 4) if lookups else 0.0
+        return totals
+
+    async def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在某个空闲的工作线程中执行 fn(worker, *args, **kwargs)，并异步等待其返回值
+        """
+        return await self.submit_to(None, fn, *args, **kwargs)
+
+    async def submit_to(self, worker: Optional[InferenceWorker], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在指定的工作线程中执行 fn(worker, *args, **kwargs)（worker 为 None 时由任意空闲线程执行）
+        线程在任务开始前退出（如调整线程池大小）时，等待方收到 CancelledError
+        """
+        if not self._started:
+            self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.scheduler.put((lambda worker: fn(worker, *args, **kwargs), future, loop), target=worker)
+        return await future
+
+    async def load(self, model_path: str, **params) -> bool:
+        """在某个工作线程中加载模型"""
+        return await self.submit(lambda worker: worker._load(model_path, **params))
+
+    async def generate(self, prompt: str, worker: Optional[InferenceWorker] = None, **kwargs) -> str:
+        """
+        生成完整的翻译结果
+        model=(model_path, params) 时先确保加载了该模型；worker 指定执行的线程（默认任意空闲线程）
+        """
+        model_path = self._track(kwargs.get("model"), 1)
+        try:
+            return await self.submit_to(worker, lambda worker: worker._generate(prompt, **kwargs))
+        finally:
+            self._track(model_path, -1)
+
+    def _track(self, model, delta: int) -> Optional[str]:
+        model_path = model[0] if isinstance(model, tuple) else model
+        if model_path:
+            with self._lock:
+                count = self._inflight.get(model_path, 0) + delta
+                if count > 0:
+                    self._inflight[model_path] = count
+                else:
+                    self._inflight.pop(model_path, None)
+        return model_path
+
+    @contextmanager
+    def track(self, model_path: str):
+        """
+        在整个翻译请求期间（包括分词、分段等提交推理任务之前的步骤）将其计入该模型的在途任务，
+        热切换时旧模型要等这些请求完成后才会被释放
+        """
+        self._track(model_path, 1)
+        try:
+            yield
+        finally:
+            self._track(model_path, -1)
+
+    def inflight(self, model_path: str) -> int:
+        """使用该模型的排队中和执行中的生成任务数"""
+        with self._lock:
+            return self._inflight.get(model_path, 0)
+
+    def preload(self, model_path: str, params: Dict[str, Any], warmup_prompt: Optional[str] = None, protect: Optional[Callable[[Any], bool]] = None, on_progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        在调用线程（后台加载线程）中为每个推理线程创建并预热模型实例，完成后交给推理线程作为常驻实例
+        推理线程在此期间继续处理请求；protect 指定的常驻实例（如正在服务的模型）不会因内存预算被淘汰
+        返回新加载的实例数
+        """
+        workers = list(self.workers)
+        loaded = 0
+
+        def keep(entry) -> bool:
+            # 刚为其他线程加载的同一模型实例也不能被淘汰
+            return entry.model_path == model_path or (protect is not None and protect(entry))
+
+        for i, worker in enumerate(workers):
+            worker_params = dict(params)
+            if worker.n_threads:
+                worker_params["n_threads"] = worker.n_threads
+            key = _model_key(model_path, worker_params)
+            if not worker.has_model(key):
+                for victim in self.resident.reserve(worker, key, model_path, worker_params, protect=keep):
+                    victim.worker.request_evict(victim.key)
+                logger.info(f"[后台加载] 为 {worker.name} 创建模型实例: {model_path}")
+                llm = _create_llama(model_path, worker_params)
+                if warmup_prompt:
+                    for _ in llm(warmup_prompt, max_tokens=4, temperature=0.0, stream=True):
+                        pass
+                worker.adopt(key, llm, model_path, worker_params)
+                loaded += 1
+            if on_progress is not None:
+                on_progress(i + 1, len(workers))
+        return loaded
+
+    async def stream(self, prompt: str, priority: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        流式生成，逐个产出文本片段
+        调用方提前结束迭代（如客户端断开）时，工作线程会在下一个token处停止
+        """
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+        cancel = threading.Event()
+
+        def on_delta(delta: str):
+            loop.call_soon_threadsafe(deltas.put_nowait, delta)
+
+        async def run():
+            # run 在独立任务中执行，设置优先级不会影响调用方
+            if priority:
+                current_priority.set(priority)
+            model_path = self._track(kwargs.get("model"), 1)
+            try:
+                await self.submit(lambda worker: worker._generate(prompt, cancel=cancel, on_delta=on_delta, **kwargs))
+            except BaseException as e:
+                deltas.put_nowait(e)
+            else:
+                deltas.put_nowait(_STREAM_END)
+            finally:
+                self._track(model_path, -1)
+
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                item = await deltas.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            cancel.set()
+            if not task.done():
+                task.cancel()
+
+
+def _model_key(model_path: str, params: Dict[str, Any]) -> Hashable:
+    return model_path, tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+
+def _create_llama(model_path: str, params: Dict[str, Any]):
+    """
+    创建模型实例
+    参数中的 speculative 描述（见 speculative.speculative_spec）转换为 llama-cpp 的 draft_model
+    """
+    from llama_cpp import Llama
+
+    params = dict(params)
+    spec = params.pop("speculative", None)
+    if spec:
+        params["draft_model"] = create_draft(spec, params)
+    return Llama(model_path=model_path, **params)
+
+
+def _close(llm):
+    try:
+        draft = getattr(llm, "draft_model", None)
+        if draft is not None and hasattr(draft, "close"):
+            draft.close()
+        close = getattr(llm, "close", None)
+        if close is not None:
+            close()
+    except Exception:
+        pass
+
+
+def _set_result(future: asyncio.Future, result: Any):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException):
+    if not future.done():
+        future.set_exception(exc)
+
+
+def _cancel(future: asyncio.Future):
+    if not future.done():
+        future.cancel()
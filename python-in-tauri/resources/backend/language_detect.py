@@ -0,0 +1,219 @@
+"""
+轻量的语言/文字识别（无第三方依赖）
+按 Unicode 文字统计各文字系统的占比，拉丁字母文本再按常见虚词区分语言；
+只在有把握时给出结果，无法确定时返回 None
+翻译前用于跳过已是目标语言的文本、纯数字/符号/链接等无需翻译的文本，并在源语言为 auto 时补充源语言
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 主要文字占全部文字单位的比例达到该值时才认为文本属于该文字
+DOMINANT_SCRIPT_SHARE = 0.7
+
+# 拉丁字母文本：命中虚词的最少个数和占全部单词的最低比例
+MIN_STOPWORD_HITS = 2
+MIN_STOPWORD_SHARE = 0.15
+
+# 超过该长度的文本只用开头部分识别语言，且不会被跳过（开头部分不能代表全文）
+MAX_DETECT_CHARS = 4000
+
+# 跳过原因
+SKIP_SAME_LANGUAGE = "same_language"
+SKIP_NON_LINGUISTIC = "non_linguistic"
+
+_URL = re.compile(r"(?:https?://|ftp://|www\.)\S+|[\w.+-]+@[\w-]+\.[\w.-]+|(?:[A-Za-z]:)?(?:[\\/][\w.\-]+){2,}", re.IGNORECASE)
+_LATIN_WORD = re.compile(r"[A-Za-zÀ-ɏ]+(?:'[A-Za-z]+)?")
+
+# (起始码位, 结束码位, 文字)
+_SCRIPT_RANGES: Tuple[Tuple[int, int, str], ...] = (
+    (0x0370, 0x03FF, "greek"),
+    (0x0400, 0x052F, "cyrillic"),
+    (0x0590, 0x05FF, "hebrew"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0750, 0x077F, "arabic"),
+    (0x0900, 0x097F, "devanagari"),
+    (0x0980, 0x09FF, "bengali"),
+    (0x0A00, 0x0A7F, "gurmukhi"),
+    (0x0A80, 0x0AFF, "gujarati"),
+    (0x0B80, 0x0BFF, "tamil"),
+    (0x0C00, 0x0C7F, "telugu"),
+    (0x0C80, 0x0CFF, "kannada"),
+    (0x0D00, 0x0D7F, "malayalam"),
+    (0x0D80, 0x0DFF, "sinhala"),
+    (0x0E00, 0x0E7F, "thai"),
+    (0x0E80, 0x0EFF, "lao"),
+    (0x0F00, 0x0FFF, "tibetan"),
+    (0x1000, 0x109F, "myanmar"),
+    (0x1100, 0x11FF, "hangul"),
+    (0x1780, 0x17FF, "khmer"),
+    (0x3040, 0x309F, "kana"),
+    (0x30A0, 0x30FF, "kana"),
+    (0x3130, 0x318F, "hangul"),
+    (0x3400, 0x4DBF, "han"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xAC00, 0xD7AF, "hangul"),
+    (0xF900, 0xFAFF, "han"),
+    (0xFF66, 0xFF9F, "kana"),
+)
+
+# 只用一种文字书写的语言
+_SCRIPT_LANGUAGES = {
+    "greek": "el",
+    "hebrew": "he",
+    "devanagari": "hi",
+    "bengali": "bn",
+    "gurmukhi": "pa",
+    "gujarati": "gu",
+    "tamil": "ta",
+    "telugu": "te",
+    "kannada": "kn",
+    "malayalam": "ml",
+    "sinhala": "si",
+    "thai": "th",
+    "lao": "lo",
+    "tibetan": "bo",
+    "myanmar": "my",
+    "hangul": "ko",
+    "khmer": "km",
+}
+
+# 繁体/简体中常用且互不相同的字
+_TRADITIONAL_CHARS = set("這們個來說為會國時對開過後還發麼學體關點經現車電長見問門無與間書東應從當實話嗎讓們將裡給聽頭")
+_SIMPLIFIED_CHARS = set("这们个来说为会国时对开过后还发么学体关点经现车电长见问门无与间书东应从当实话吗让们将里给听头")
+
+_UKRAINIAN_CHARS = set("іїєґІЇЄҐ")
+_PERSIAN_CHARS = set("پچژگک")
+_URDU_CHARS = set("ٹڈڑںےۓھ")
+
+# 拉丁字母语言的常见虚词
+_STOPWORDS = {
+    "en": set("the and of to in is are was were that this with for on as be by it not or from at which have has an".split()),
+    "fr": set("le la les des et est une un du dans que qui pour pas sur au avec ce sont il elle nous vous".split()),
+    "de": set("der die das und ist nicht ein eine zu den mit von sich des auf für im dem sind wird auch".split()),
+    "es": set("el la los las y es en que de un una por con para del se no al lo como más está son".split()),
+    "it": set("il lo la gli le e è di che un una per con non del della sono si al nel come più".split()),
+    "pt": set("o a os as e é de que um uma para com não do da em no na por se são mais como".split()),
+    "nl": set("de het een en is van dat die niet in op te met zijn voor er ook aan als wordt".split()),
+}
+
+
+def _script(ch: str) -> Optional[str]:
+    code = ord(ch)
+    if code < 0x0370:
+        return "latin" if ch.isalpha() else None
+    for start, end, script in _SCRIPT_RANGES:
+        if start <= code <= end:
+            return script
+    return "other" if ch.isalpha() else None
+
+
+def _script_counts(text: str) -> Dict[str, int]:
+    """各文字的单位数：拉丁字母按单词计，其他文字按字符计（与一个单词的信息量大致相当）"""
+    counts: Dict[str, int] = {}
+    counts["latin"] = len(_LATIN_WORD.findall(text))
+    for ch in text:
+        script = _script(ch)
+        if script is not None and script != "latin":
+            counts[script] = counts.get(script, 0) + 1
+    return {script: n for script, n in counts.items() if n}
+
+
+def _latin_language(text: str) -> Optional[str]:
+    words = [w.lower() for w in _LATIN_WORD.findall(text)]
+    if not words:
+        return None
+    scores = sorted(((sum(w in stopwords for w in words), lang) for lang, stopwords in _STOPWORDS.items()), reverse=True)
+    (best, lang), (second, _) = scores[0], scores[1]
+    if best < MIN_STOPWORD_HITS or best / len(words) < MIN_STOPWORD_SHARE or best < second * 2:
+        return None
+    return lang
+
+
+def is_non_linguistic(text: str) -> bool:
+    """文本是否不含需要翻译的文字（纯数字、符号、链接、邮箱或文件路径）"""
+    stripped = _URL.sub(" ", text)
+    return not any(ch.isalpha() for ch in stripped)
+
+
+def detect_language(text: str) -> Optional[str]:
+    """识别文本的语言，返回语言代码（与 TARGET_LANG_MAP 一致），无法确定时返回 None"""
+    counts = _script_counts(_URL.sub(" ", text))
+    total = sum(counts.values())
+    if not total:
+        return None
+    # 日文混用汉字和假名，韩文可能夹杂汉字
+    if counts.get("kana"):
+        counts["kana"] += counts.pop("han", 0)
+    elif counts.get("hangul"):
+        counts["hangul"] += counts.pop("han", 0)
+    script, units = max(counts.items(), key=lambda item: item[1])
+    if units / total < DOMINANT_SCRIPT_SHARE:
+        return None
+
+    if script == "han":
+        # 只有繁简通用的汉字时无法区分繁体、简体或只用汉字书写的日文
+        traditional = sum(ch in _TRADITIONAL_CHARS for ch in text)
+        simplified = sum(ch in _SIMPLIFIED_CHARS for ch in text)
+        if traditional > simplified:
+            return "zh-Hant"
+        if simplified > traditional:
+            return "zh"
+        return None
+    if script == "kana":
+        return "ja"
+    if script == "cyrillic":
+        return "uk" if any(ch in _UKRAINIAN_CHARS for ch in text) else "ru"
+    if script == "arabic":
+        if any(ch in _URDU_CHARS for ch in text):
+            return "ur"
+        return "fa" if any(ch in _PERSIAN_CHARS for ch in text) else "ar"
+    if script == "latin":
+        return _latin_language(text)
+    return _SCRIPT_LANGUAGES.get(script)
+
+
+def classify(text: str, target_lang: str) -> Tuple[Optional[str], Optional[str]]:
+    """识别文本，返回 (语言代码, 无需翻译的原因)；需要翻译时原因为 None"""
+    if len(text) > MAX_DETECT_CHARS:
+        return detect_language(text[:MAX_DETECT_CHARS]), None
+    if is_non_linguistic(text):
+        return None, SKIP_NON_LINGUISTIC
+    language = detect_language(text)
+    if language is not None and language == target_lang:
+        return language, SKIP_SAME_LANGUAGE
+    return language, None
+
+
+def detect_languages(texts: Sequence[str], target_lang: str) -> List[Tuple[Optional[str], Optional[str]]]:
+    """批量识别，返回每个文本的 (语言代码, 无需翻译的原因)"""
+    return [classify(text, target_lang) for text in texts]
+
+
+class PrepassStats:
+    """翻译前识别的统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped: Dict[str, int] = {}
+        self.auto_detected = 0  # 源语言为 auto 时识别出的语言数
+
+    def record(self, skipped: Optional[str], auto_detected: bool):
+        with self._lock:
+            self.checked += 1
+            if skipped is not None:
+                self.skipped[skipped] = self.skipped.get(skipped, 0) + 1
+            if auto_detected:
+                self.auto_detected += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            saved = sum(self.skipped.values())
+            return {
+                "checked": self.checked,
+                "skipped": dict(self.skipped),
+                "saved_calls": saved,
+                "skip_rate": round(saved / self.checked, 4) if self.checked else 0.0,
+                "auto_detected": self.auto_detected,
+            }
@@ -0,0 +1,195 @@
+"""
+模型加载的内存预算
+加载前按 GGUF 文件头估算权重和KV缓存的内存占用，与系统可用内存（或配置的上限）比较：
+放不下时先逐步缩小上下文长度，缩到下限仍放不下则拒绝加载，避免加载过程中耗尽内存被系统杀死
+以 mmap 方式加载时权重映射的是文件页缓存，同一模型文件的多个实例（包括其他后端进程中的实例）共享同一份物理内存
+"""
+import ctypes
+import logging
+import os
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+from inference_params import kv_element_bytes
+from model_registry import estimate_kv_bytes
+from speculative import speculative_overhead
+
+logger = logging.getLogger(__name__)
+
+# 自动预算时最多使用可用内存的比例（为系统和其他程序留出余量）
+AVAILABLE_MEMORY_FRACTION = 0.85
+
+# 自动缩小上下文长度的下限
+MIN_CONTEXT_LENGTH = 512
+
+# 每个实例在KV缓存之外的计算缓冲区估算（MB）
+INSTANCE_OVERHEAD_MB = 64
+
+_MB = 1024 * 1024
+
+
+class InsufficientMemoryError(Exception):
+    """模型在最小上下文长度下仍超出内存预算"""
+
+
+def system_memory() -> Tuple[Optional[int], Optional[int]]:
+    """
+    系统的 (总内存, 可用内存) 字节数，无法获取时为 None
+    Linux 读取 /proc/meminfo 的 MemAvailable（包含可回收的页缓存），Windows 使用 GlobalMemoryStatusEx
+    """
+    if sys.platform == "win32":
+        return _windows_memory()
+    try:
+        with open("/proc/meminfo", "r") as f:
+            values = {}
+            for line in f:
+                key, _, rest = line.partition(":")
+                parts = rest.split()
+                if parts:
+                    values[key] = int(parts[0]) * 1024
+        available = values.get("MemAvailable")
+        if available is None and "MemFree" in values:
+            available = values["MemFree"] + values.get("Cached", 0)
+        return values.get("MemTotal"), available
+    except (OSError, ValueError):
+        pass
+    # macOS 等没有 /proc 的系统只能获取总内存
+    try:
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None, None
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        available = None
+    return total, available
+
+
+def _windows_memory() -> Tuple[Optional[int], Optional[int]]:
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+            ("dwLength", ctypes.c_ulong),
+            ("dwMemoryLoad", ctypes.c_ulong),
+            ("ullTotalPhys", ctypes.c_ulonglong),
+            ("ullAvailPhys", ctypes.c_ulonglong),
+            ("ullTotalPageFile", ctypes.c_ulonglong),
+            ("ullAvailPageFile", ctypes.c_ulonglong),
+            ("ullTotalVirtual", ctypes.c_ulonglong),
+            ("ullAvailVirtual", ctypes.c_ulonglong),
+            ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+        ]
+
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    try:
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None, None
+    except (AttributeError, OSError):
+        return None, None
+    return status.ullTotalPhys, status.ullAvailPhys
+
+
+def memory_budget_bytes(limit_mb: float, available: Optional[int]) -> Optional[int]:
+    """
+    模型加载可用的内存预算：配置的上限与系统可用内存 × AVAILABLE_MEMORY_FRACTION 中的较小者
+    两者都没有时返回 None（不限制）
+    """
+    budgets = []
+    if limit_mb and limit_mb > 0:
+        budgets.append(int(limit_mb * _MB))
+    if available is not None:
+        budgets.append(int(available * AVAILABLE_MEMORY_FRACTION))
+    return min(budgets) if budgets else None
+
+
+def instance_bytes(info: Optional[Dict[str, Any]], n_ctx: int, type_k="f16", type_v="f16", speculative: Optional[Tuple] = None) -> int:
+    """单个模型实例在权重之外的内存：KV缓存（按缓存类型） + 计算缓冲区 + 推测解码的 logits 和草稿模型"""
+    kv = estimate_kv_bytes(info, n_ctx, kv_element_bytes(type_k), kv_element_bytes(type_v))
+    return kv + INSTANCE_OVERHEAD_MB * _MB + speculative_overhead(speculative, info, n_ctx)
+
+
+class LoadPlan:
+    """一次模型加载的内存估算结果"""
+
+    def __init__(self, model_path: str, requested_ctx: int, n_ctx: int, weights_bytes: int, kv_bytes: int, instances: int, budget_bytes: Optional[int], available_bytes: Optional[int], use_mmap: bool, use_mlock: bool):
+        self.model_path = model_path
+        self.requested_ctx = requested_ctx
+        self.n_ctx = n_ctx
+        self.weights_bytes = weights_bytes
+        self.kv_bytes = kv_bytes
+        self.instances = instances
+        self.budget_bytes = budget_bytes
+        self.available_bytes = available_bytes
+        self.use_mmap = use_mmap
+        self.use_mlock = use_mlock
+
+    @property
+    def reduced(self) -> bool:
+        return self.n_ctx < self.requested_ctx
+
+    @property
+    def total_bytes(self) -> int:
+        return required_bytes(self.weights_bytes, self.kv_bytes, self.instances, self.use_mmap)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": os.path.basename(self.model_path),
+            "requested_context_length": self.requested_ctx,
+            "context_length": self.n_ctx,
+            "reduced": self.reduced,
+            "instances": self.instances,
+            "use_mmap": self.use_mmap,
+            "use_mlock": self.use_mlock,
+            "weights_mb": round(self.weights_bytes / _MB, 1),
+            "kv_mb_per_instance": round(self.kv_bytes / _MB, 1),
+            "required_mb": round(self.total_bytes / _MB, 1),
+            "budget_mb": round(self.budget_bytes / _MB, 1) if self.budget_bytes is not None else None,
+            "available_mb": round(self.available_bytes / _MB, 1) if self.available_bytes is not None else None,
+        }
+
+
+def required_bytes(weights_bytes: int, kv_bytes: int, instances: int, use_mmap: bool) -> int:
+    """
+    instances 个实例所需的内存
+    mmap 方式下权重由所有实例共享（只计一份）；关闭 mmap 时每个实例各自读入一份权重
+    """
+    weight_copies = 1 if use_mmap else instances
+    return weights_bytes * weight_copies + kv_bytes * instances
+
+
+def plan_load(model_path: str, info: Optional[Dict[str, Any]], n_ctx: int, instances: int = 1, use_mmap: bool = True, use_mlock: bool = False, limit_mb: float = 0, min_ctx: int = MIN_CONTEXT_LENGTH, reclaimable_bytes: int = 0, type_k="f16", type_v="f16", speculative: Optional[Tuple] = None) -> LoadPlan:
+    """
+    估算加载 instances 个实例所需的内存，超出预算时将上下文长度逐步减半（不低于 min_ctx）
+    缩到下限仍超出预算时抛出 InsufficientMemoryError
+    reclaimable_bytes 为本进程中将被替换的实例占用的内存，计入可用内存
+    """
+    try:
+        weights = os.path.getsize(model_path)
+    except OSError:
+        weights = 0
+    _, available = system_memory()
+    if available is not None:
+        available += reclaimable_bytes
+    budget = memory_budget_bytes(limit_mb, available)
+    instances = max(1, instances)
+
+    ctx = n_ctx
+    kv = instance_bytes(info, ctx, type_k, type_v, speculative)
+    if budget is not None:
+        floor = min(n_ctx, min_ctx)
+        while required_bytes(weights, kv, instances, use_mmap) > budget and ctx > floor:
+            ctx = max(floor, ctx // 2)
+            kv = instance_bytes(info, ctx, type_k, type_v, speculative)
+        required = required_bytes(weights, kv, instances, use_mmap)
+        if required > budget:
+            raise InsufficientMemoryError(
+                f"内存不足，无法加载模型 {os.path.basename(model_path)}："
+                f"上下文长度 {ctx} 时需要约 {required / _MB:.0f} MB，可用预算 {budget / _MB:.0f} MB"
+            )
+    plan = LoadPlan(model_path, n_ctx, ctx, weights, kv, instances, budget, available, use_mmap, use_mlock)
+    if plan.reduced:
+        logger.warning(
+            f"内存预算不足，模型 {os.path.basename(model_path)} 的上下文长度从 {n_ctx} 缩小到 {ctx}"
+            f"（需要约 {plan.total_bytes / _MB:.0f} MB，预算 {budget / _MB:.0f} MB）"
+        )
+    return plan
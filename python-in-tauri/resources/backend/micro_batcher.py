@@ -0,0 +1,121 @@
+"""
+跨请求的微批处理
+同时到达的多个短文本 /translate 请求各自求值提示词；开启后，短时间窗口内到达的、
+使用同一模型和语言对的请求被收集为一批，合并为一次打包推理，再分别返回给各个调用方
+每个请求最多等待一个窗口（批满时立即执行），等待时间计入统计
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# 默认值（可通过配置覆盖）
+DEFAULT_WINDOW_MS = 10
+DEFAULT_MAX_SIZE = 8
+
+# 保留最近多少次等待时间用于计算分位数
+_RECENT_WAITS = 200
+
+
+class _Batch:
+    def __init__(self):
+        self.items: List[Tuple[Any, asyncio.Future, float]] = []  # (请求, 结果, 加入时间)
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    按键收集请求，窗口到期或批满时调用 run_batch(key, items)，其返回值与 items 一一对应
+    只能在事件循环中使用
+    """
+
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]], window_ms: float = DEFAULT_WINDOW_MS, max_size: int = DEFAULT_MAX_SIZE):
+        self.run_batch = run_batch
+        self.window_ms = window_ms
+        self.max_size = max_size
+        self._pending: Dict[Hashable, _Batch] = {}
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.batched_requests = 0  # 与其他请求合并执行的请求数
+        self.max_batch = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=_RECENT_WAITS)
+
+    def configure(self, window_ms: float, max_size: int):
+        self.window_ms = max(0.0, window_ms)
+        self.max_size = max(1, max_size)
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch()
+            batch.timer = loop.call_later(self.window_ms / 1000, self._flush, key)
+        batch.items.append((item, future, time.monotonic()))
+        if len(batch.items) >= self.max_size:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Hashable):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        # 等待期间已被取消的请求不再执行
+        items = [entry for entry in batch.items if not entry[1].done()]
+        if not items:
+            return
+        task = asyncio.ensure_future(self._run(key, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Hashable, items: List[Tuple[Any, asyncio.Future, float]]):
+        started = time.monotonic()
+        self._record(len(items), [started - enqueued for _, _, enqueued in items])
+        try:
+            results = await self.run_batch(key, [item for item, _, _ in items])
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size: int, waits: List[float]):
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            if size > 1:
+                self.batched_requests += size
+            self.max_batch = max(self.max_batch, size)
+            for wait in waits:
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.recent.append(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self.recent)
+            p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+            return {
+                "window_ms": self.window_ms,
+                "max_size": self.max_size,
+                "pending": sum(len(batch.items) for batch in self._pending.values()),
+                "batches": self.batches,
+                "requests": self.requests,
+                "batched_requests": self.batched_requests,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "max_batch_size": self.max_batch,
+                # 请求在批中等待的时间（微批处理带来的额外延迟）
+                "avg_wait_ms": round(self.total_wait / self.requests * 1000, 2) if self.requests else 0.0,
+                "p95_wait_ms": round(p95 * 1000, 2),
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+            }
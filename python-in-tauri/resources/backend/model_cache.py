@@ -0,0 +1,195 @@
+"""
+常驻模型缓存
+推理线程切换模型时不再释放旧实例，已加载的 Llama 实例在内存预算内常驻，
+再次切换回来只需交换指针；超出预算时淘汰最久未使用的实例
+权重以 mmap 方式加载时，同一模型文件被多个实例共享，内存只按一份计算；关闭 mmap 时每个实例各计一份
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from memory_budget import instance_bytes
+
+logger = logging.getLogger(__name__)
+
+# 默认内存预算（MB）
+DEFAULT_MAX_MB = 4096
+
+class _Entry:
+    def __init__(self, worker, key: Hashable, model_path: str, n_ctx: int, weights_bytes: int, instance_bytes: int, use_mmap: bool = True):
+        self.worker = worker
+        self.key = key
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.use_mmap = use_mmap
+        self.weights_bytes = weights_bytes
+        self.instance_bytes = instance_bytes
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.uses = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": os.path.basename(self.model_path),
+            "worker": self.worker.name,
+            "n_ctx": self.n_ctx,
+            "use_mmap": self.use_mmap,
+            "weights_mb": round(self.weights_bytes / (1024 * 1024), 1),
+            "instance_mb": round(self.instance_bytes / (1024 * 1024), 1),
+            "uses": self.uses,
+            "loaded_at": self.loaded_at,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+        }
+
+
+class ResidentModelCache:
+    """
+    推理线程池共享的常驻模型账本
+    只负责记账和选择淘汰对象；实例由推理线程或后台加载线程创建，只由所属的推理线程释放（避免释放正在使用的实例）
+    """
+
+    def __init__(self, max_mb: float = DEFAULT_MAX_MB, registry=None):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.registry = registry  # ModelRegistry，用于按 GGUF 文件头估算KV缓存大小
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[int, Hashable], _Entry] = {}
+        self.loads = 0
+        self.hits = 0
+        self.switches = 0
+        self.evictions = 0
+
+    def configure(self, max_mb: Optional[float] = None, registry=None):
+        if max_mb is not None:
+            self.max_bytes = int(max_mb * 1024 * 1024)
+        if registry is not None:
+            self.registry = registry
+
+    def estimate(self, model_path: str, params: Dict[str, Any]) -> Tuple[int, int]:
+        """估算 (权重大小, 单个实例的KV缓存和计算缓冲区大小)"""
+        try:
+            weights = os.path.getsize(model_path)
+        except OSError:
+            weights = 0
+        info = self.registry.get(model_path) if self.registry is not None else None
+        return weights, instance_bytes(info, params.get("n_ctx", 0), params.get("type_k", "f16"), params.get("type_v", "f16"), params.get("speculative"))
+
+    def fits(self, specs: List[Tuple[str, Dict[str, Any]]], copies: int = 1) -> bool:
+        """specs 中的实例（每个推理线程各一份，共 copies 份）能否同时常驻在预算内"""
+        entries = []
+        for model_path, params in specs:
+            weights, instance = self.estimate(model_path, params)
+            entries += [_Entry(None, None, model_path, params.get("n_ctx", 0), weights, instance, params.get("use_mmap", True)) for _ in range(copies)]
+        return self._used_bytes(entries) <= self.max_bytes
+
+    def _used_bytes(self, entries) -> int:
+        weights = {}
+        total = 0
+        for entry in entries:
+            if entry.use_mmap:
+                weights[entry.model_path] = entry.weights_bytes
+            else:
+                total += entry.weights_bytes
+            total += entry.instance_bytes
+        return total + sum(weights.values())
+
+    def reserve(self, worker, key: Hashable, model_path: str, params: Dict[str, Any], protect: Optional[Callable[[_Entry], bool]] = None) -> List[_Entry]:
+        """
+        为即将加载的模型腾出空间，返回需要淘汰的实例（按最久未使用的顺序）
+        正在执行任务的线程当前使用的实例和 protect 返回 True 的实例不会被淘汰；
+        与新实例共享 mmap 权重的同一模型文件的实例也不淘汰（淘汰后只能释放其KV缓存，再次使用时却要重新加载）；
+        没有可淘汰的实例时即使超出预算也允许加载
+        """
+        weights, instance = self.estimate(model_path, params)
+        incoming = _Entry(worker, key, model_path, params.get("n_ctx", 0), weights, instance, params.get("use_mmap", True))
+
+        def shares_weights(entry: _Entry) -> bool:
+            return incoming.use_mmap and entry.use_mmap and entry.model_path == model_path
+
+        victims = []
+        with self._lock:
+            remaining = [e for e in self._entries.values() if not (e.worker is worker and e.key == key)]
+            candidates = sorted(remaining, key=lambda e: e.last_used)
+            for candidate in candidates:
+                if self._used_bytes(remaining + [incoming]) <= self.max_bytes:
+                    break
+                if shares_weights(candidate):
+                    continue
+                if candidate.worker is not worker and candidate.worker.is_using(candidate.key):
+                    continue
+                if protect is not None and protect(candidate):
+                    continue
+                remaining.remove(candidate)
+                victims.append(candidate)
+            # 淘汰对象立即从账本中移除，实例由所属线程随后释放
+            for victim in victims:
+                self._entries.pop((id(victim.worker), victim.key), None)
+                self.evictions += 1
+            own = self._used_bytes([e for e in remaining if shares_weights(e)] + [incoming])
+        if own > self.max_bytes:
+            logger.warning(
+                f"模型 {os.path.basename(model_path)} 的权重和KV缓存（{own / (1024 * 1024):.0f} MB）超出常驻模型内存预算"
+                f"（{self.max_bytes / (1024 * 1024):.0f} MB），同一模型的其他实例保持常驻；可调大 resident_models_max_mb"
+            )
+        return victims
+
+    def add(self, worker, key: Hashable, model_path: str, params: Dict[str, Any]):
+        weights, instance = self.estimate(model_path, params)
+        entry = _Entry(worker, key, model_path, params.get("n_ctx", 0), weights, instance, params.get("use_mmap", True))
+        entry.uses = 1
+        with self._lock:
+            self._entries[(id(worker), key)] = entry
+            self.loads += 1
+
+    def touch(self, worker, key: Hashable, switched: bool = False):
+        """记录一次使用；switched 表示从常驻实例中切换（无需加载）"""
+        with self._lock:
+            entry = self._entries.get((id(worker), key))
+            if entry is None:
+                return
+            entry.last_used = time.monotonic()
+            entry.uses += 1
+            self.hits += 1
+            if switched:
+                self.switches += 1
+
+    def remove(self, worker, key: Hashable):
+        with self._lock:
+            self._entries.pop((id(worker), key), None)
+
+    def model_bytes(self, model_path: str) -> int:
+        """某个模型文件的常驻实例占用的内存"""
+        with self._lock:
+            return self._used_bytes([e for e in self._entries.values() if e.model_path == model_path])
+
+    def over_budget(self) -> bool:
+        with self._lock:
+            return self._used_bytes(self._entries.values()) > self.max_bytes
+
+    def evict_model(self, model_path: str) -> int:
+        """淘汰某个模型文件的所有实例（由各自的线程在空闲时释放），返回实例数"""
+        with self._lock:
+            victims = [e for e in self._entries.values() if e.model_path == model_path]
+            for victim in victims:
+                self._entries.pop((id(victim.worker), victim.key), None)
+                self.evictions += 1
+        for victim in victims:
+            victim.worker.request_evict(victim.key)
+        return len(victims)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e.last_used, reverse=True)
+            used = self._used_bytes(entries)
+            models = [entry.to_dict() for entry in entries]
+        return {
+            "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+            "used_mb": round(used / (1024 * 1024), 1),
+            "resident": len(models),
+            "loads": self.loads,
+            "hits": self.hits,
+            "switches": self.switches,
+            "evictions": self.evictions,
+            "models": models,
+        }
@@ -0,0 +1,329 @@
+"""
+模型注册表
+直接解析 GGUF 文件头（元数据和张量信息，不读取权重），提取架构、参数量、量化类型、训练上下文长度、
+分词器和对话模板等信息；结果按 (路径, 大小, 修改时间) 缓存到 resources/cache/model_registry.json，
+只有新增或修改过的模型文件才会重新解析
+"""
+import json
+import logging
+import os
+import struct
+import threading
+from typing import Any, BinaryIO, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存文件位置：resources/cache/model_registry.json
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(__file__), "../cache/model_registry.json")
+
+# 缓存格式版本，解析逻辑变化时旧缓存自动失效
+_REGISTRY_VERSION = 1
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF 元数据值类型
+_GGUF_UINT8, _GGUF_INT8, _GGUF_UINT16, _GGUF_INT16 = 0, 1, 2, 3
+_GGUF_UINT32, _GGUF_INT32, _GGUF_FLOAT32, _GGUF_BOOL = 4, 5, 6, 7
+_GGUF_STRING, _GGUF_ARRAY, _GGUF_UINT64, _GGUF_INT64, _GGUF_FLOAT64 = 8, 9, 10, 11, 12
+
+_SCALAR_FORMATS = {
+    _GGUF_UINT8: "<B", _GGUF_INT8: "<b", _GGUF_UINT16: "<H", _GGUF_INT16: "<h",
+    _GGUF_UINT32: "<I", _GGUF_INT32: "<i", _GGUF_FLOAT32: "<f", _GGUF_BOOL: "<?",
+    _GGUF_UINT64: "<Q", _GGUF_INT64: "<q", _GGUF_FLOAT64: "<d",
+}
+
+# general.file_type（llama_ftype）对应的量化名称
+FILE_TYPE_NAMES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16",
+}
+
+# 张量类型（ggml_type）名称，没有 general.file_type 时按参数量最多的张量类型判断量化
+TENSOR_TYPE_NAMES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 6: "Q5_0", 7: "Q5_1", 8: "Q8_0", 9: "Q8_1",
+    10: "Q2_K", 11: "Q3_K", 12: "Q4_K", 13: "Q5_K", 14: "Q6_K", 15: "Q8_K",
+    16: "IQ2_XXS", 17: "IQ2_XS", 18: "IQ3_XXS", 19: "IQ1_S", 20: "IQ4_NL", 21: "IQ3_S",
+    22: "IQ2_S", 23: "IQ4_XS", 24: "I8", 25: "I16", 26: "I32", 27: "I64", 28: "F64",
+    29: "IQ1_M", 30: "BF16",
+}
+
+# 以 "{architecture}." 为前缀、需要保留的模型结构参数
+_ARCH_KEYS = {
+    "context_length": "context_length",
+    "embedding_length": "embedding_length",
+    "block_count": "block_count",
+    "attention.head_count": "head_count",
+    "attention.head_count_kv": "head_count_kv",
+    "attention.key_length": "key_length",
+    "attention.value_length": "value_length",
+}
+
+
+class GGUFError(Exception):
+    """文件不是有效的 GGUF 模型"""
+
+
+class _Reader:
+    def __init__(self, f: BinaryIO):
+        self.f = f
+
+    def read(self, n: int) -> bytes:
+        data = self.f.read(n)
+        if len(data) != n:
+            raise GGUFError("文件头不完整")
+        return data
+
+    def scalar(self, fmt: str):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def u32(self) -> int:
+        return self.scalar("<I")
+
+    def u64(self) -> int:
+        return self.scalar("<Q")
+
+    def string(self) -> str:
+        return self.read(self.u64()).decode("utf-8", errors="replace")
+
+    def skip_string(self):
+        self.f.seek(self.u64(), os.SEEK_CUR)
+
+
+def _read_value(reader: _Reader, value_type: int, keep_array: bool = False):
+    """读取一个元数据值；数组默认只返回长度（词表等数组很大，不需要内容）"""
+    if value_type in _SCALAR_FORMATS:
+        return reader.scalar(_SCALAR_FORMATS[value_type])
+    if value_type == _GGUF_STRING:
+        return reader.string()
+    if value_type == _GGUF_ARRAY:
+        item_type = reader.u32()
+        count = reader.u64()
+        if keep_array:
+            return [_read_value(reader, item_type) for _ in range(count)]
+        if item_type in _SCALAR_FORMATS:
+            reader.f.seek(struct.calcsize(_SCALAR_FORMATS[item_type]) * count, os.SEEK_CUR)
+        elif item_type == _GGUF_STRING:
+            for _ in range(count):
+                reader.skip_string()
+        else:
+            for _ in range(count):
+                _read_value(reader, item_type)
+        return count
+    raise GGUFError(f"未知的元数据类型: {value_type}")
+
+
+def read_gguf_metadata(path: str) -> Dict[str, Any]:
+    """
+    解析 GGUF 文件头，返回模型信息
+    只读取元数据和张量描述，耗时与词表大小相关，与权重大小无关
+    """
+    with open(path, "rb") as f:
+        reader = _Reader(f)
+        if reader.read(4) != GGUF_MAGIC:
+            raise GGUFError("不是 GGUF 格式的文件")
+        version = reader.u32()
+        if version == 1:
+            tensor_count, kv_count = reader.u32(), reader.u32()
+        else:
+            tensor_count, kv_count = reader.u64(), reader.u64()
+
+        metadata: Dict[str, Any] = {}
+        for _ in range(kv_count):
+            key = reader.string()
+            value_type = reader.u32()
+            metadata[key] = _read_value(reader, value_type)
+
+        parameter_count = 0
+        elements_by_type: Dict[int, int] = {}
+        for _ in range(tensor_count):
+            reader.skip_string()
+            n_dims = reader.u32()
+            elements = 1
+            for _ in range(n_dims):
+                elements *= reader.u64() if version > 1 else reader.u32()
+            tensor_type = reader.u32()
+            reader.u64()  # 数据偏移
+            parameter_count += elements
+            elements_by_type[tensor_type] = elements_by_type.get(tensor_type, 0) + elements
+
+    architecture = metadata.get("general.architecture", "")
+    info: Dict[str, Any] = {
+        "gguf_version": version,
+        "architecture": architecture,
+        "model_name": metadata.get("general.name", ""),
+        "size_label": metadata.get("general.size_label", ""),
+        "parameter_count": parameter_count,
+        "quantization": _quantization(metadata.get("general.file_type"), elements_by_type),
+        "tokenizer": metadata.get("tokenizer.ggml.model", ""),
+        "vocab_size": metadata.get("tokenizer.ggml.tokens", 0),
+        "chat_template": metadata.get("tokenizer.chat_template", ""),
+        "tensor_count": tensor_count,
+    }
+    for suffix, name in _ARCH_KEYS.items():
+        value = metadata.get(f"{architecture}.{suffix}")
+        info[name] = int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    return info
+
+
+def _quantization(file_type: Optional[int], elements_by_type: Dict[int, int]) -> str:
+    if isinstance(file_type, int) and file_type in FILE_TYPE_NAMES:
+        return FILE_TYPE_NAMES[file_type]
+    if not elements_by_type:
+        return ""
+    main_type = max(elements_by_type.items(), key=lambda item: item[1])[0]
+    return TENSOR_TYPE_NAMES.get(main_type, f"type{main_type}")
+
+
+def estimate_kv_bytes(info: Optional[Dict[str, Any]], n_ctx: int, key_bytes: float = 2.0, value_bytes: Optional[float] = None) -> int:
+    """
+    估算 n_ctx 个token的KV缓存大小（默认按 f16 计算，量化缓存传入每个元素的字节数）
+    每层 K、V 各 n_ctx × head_count_kv × head_dim 个元素；缺少结构信息时返回 0
+    """
+    if not info:
+        return 0
+    layers = info.get("block_count")
+    heads = info.get("head_count")
+    kv_heads = info.get("head_count_kv") or heads
+    embedding = info.get("embedding_length")
+    if not layers or not kv_heads:
+        return 0
+    key_length = info.get("key_length") or (embedding // heads if embedding and heads else None)
+    value_length = info.get("value_length") or key_length
+    if not key_length:
+        return 0
+    if value_bytes is None:
+        value_bytes = key_bytes
+    return int(n_ctx * layers * kv_heads * (key_length * key_bytes + value_length * value_bytes))
+
+
+def format_parameter_count(count: int) -> str:
+    """参数量的简写形式（如 1.8B、494M）"""
+    if count >= 1e9:
+        return f"{count / 1e9:.1f}B"
+    if count >= 1e6:
+        return f"{count / 1e6:.0f}M"
+    return str(count)
+
+
+class ModelRegistry:
+    """
+    模型文件夹索引
+    每次查询只列目录并比较 (大小, 修改时间)，新增或修改过的文件才重新解析文件头
+    """
+
+    def __init__(self, cache_path: str = DEFAULT_REGISTRY_PATH):
+        self.cache_path = os.path.normpath(cache_path)
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None  # 绝对路径 -> 模型信息
+        self._dirty = False  # 缓存内容有变化，需要写回文件
+
+    def _load_cache(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is not None:
+            return self._entries
+        self._entries = {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == _REGISTRY_VERSION:
+                self._entries = data.get("models", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取模型索引缓存失败，将重新解析: {str(e)}")
+        return self._entries
+
+    def _save_cache(self):
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": _REGISTRY_VERSION, "models": self._entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"保存模型索引缓存失败: {str(e)}")
+
+    def _entry(self, path: str, size: int, mtime_ns: int) -> Dict[str, Any]:
+        """返回缓存的模型信息，文件变化时重新解析（调用方持有锁）"""
+        entries = self._load_cache()
+        entry = entries.get(path)
+        if entry is not None and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns:
+            return entry
+        try:
+            info = read_gguf_metadata(path)
+            error = None
+        except Exception as e:
+            logger.warning(f"解析模型文件头失败: {path}: {str(e)}")
+            info, error = {}, str(e)
+        entry = {"size": size, "mtime_ns": mtime_ns, "error": error, **info}
+        entries[path] = entry
+        self._dirty = True
+        return entry
+
+    def scan(self, model_dir: str) -> List[Dict[str, Any]]:
+        """列出模型文件夹中的所有 .gguf 模型（按文件名排序）"""
+        model_dir = os.path.abspath(model_dir)
+        models = []
+        with self._lock:
+            self._dirty = False
+            seen = set()
+            with os.scandir(model_dir) as it:
+                for dir_entry in it:
+                    if not dir_entry.name.endswith(".gguf") or not dir_entry.is_file():
+                        continue
+                    st = dir_entry.stat()
+                    path = os.path.join(model_dir, dir_entry.name)
+                    seen.add(path)
+                    entry = self._entry(path, st.st_size, st.st_mtime_ns)
+                    models.append(_public_info(dir_entry.name, path, entry))
+            # 删除该文件夹中已不存在的模型
+            entries = self._load_cache()
+            for path in [p for p in entries if os.path.dirname(p) == model_dir and p not in seen]:
+                del entries[path]
+                self._dirty = True
+            if self._dirty:
+                self._save_cache()
+        models.sort(key=lambda m: m["name"])
+        return models
+
+    def get(self, model_path: str) -> Optional[Dict[str, Any]]:
+        """获取单个模型的信息，文件不存在时返回 None"""
+        path = os.path.abspath(model_path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._dirty = False
+            entry = self._entry(path, st.st_size, st.st_mtime_ns)
+            if self._dirty:
+                self._save_cache()
+        return _public_info(os.path.basename(path), path, entry, include_template=True)
+
+    def first_model(self, model_dir: str) -> Optional[str]:
+        """模型文件夹中按文件名排序的第一个模型"""
+        try:
+            models = self.scan(model_dir)
+        except OSError:
+            return None
+        return models[0]["name"] if models else None
+
+
+def _public_info(name: str, path: str, entry: Dict[str, Any], include_template: bool = False) -> Dict[str, Any]:
+    info = {
+        "name": name,
+        "path": path,
+        "size": entry["size"],
+        "size_mb": round(entry["size"] / (1024 * 1024), 2),
+    }
+    for key, value in entry.items():
+        if key in ("size", "mtime_ns", "chat_template"):
+            continue
+        info[key] = value
+    info["parameters"] = format_parameter_count(entry["parameter_count"]) if entry.get("parameter_count") else ""
+    info["has_chat_template"] = bool(entry.get("chat_template"))
+    if include_template:
+        info["chat_template"] = entry.get("chat_template", "")
+    return info
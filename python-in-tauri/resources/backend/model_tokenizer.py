@@ -0,0 +1,66 @@
+"""
+模型分词器
+使用只加载词表的 Llama 实例（vocab_only）计算token数，不占用推理线程，
+缓存计数结果，分段时反复计量同一批句子的开销很小
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# 每个分词器缓存的文本条数
+DEFAULT_CACHE_SIZE = 50000
+
+# 估算译文长度时使用的输出/输入token比例
+DEFAULT_EXPANSION_RATIO = 1.5
+
+# 上下文窗口中预留的安全余量
+CONTEXT_SAFETY_MARGIN = 0.95
+
+
+class ModelTokenizer:
+    """
+    指定模型的分词器
+    只读取词表，可以在任意线程中调用
+    """
+
+    def __init__(self, model_path: str, cache_size: int = DEFAULT_CACHE_SIZE):
+        from llama_cpp import Llama
+
+        self.model_path = model_path
+        self.llm = Llama(model_path=model_path, vocab_only=True, verbose=False)
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        logger.info(f"已加载模型词表: {model_path}")
+
+    def tokenize(self, text: str) -> List[int]:
+        """分词（不添加BOS）"""
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+
+    def count(self, text: str) -> int:
+        """计算文本的token数（带缓存）"""
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+        count = len(self.tokenize(text)) if text else 0
+        with self._lock:
+            self._cache[text] = count
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return count
+
+
+def source_token_budget(context_length: int, template_tokens: int, max_tokens: int, expansion_ratio: float = DEFAULT_EXPANSION_RATIO) -> int:
+    """
+    计算单次请求可容纳的原文token数
+    需同时满足：提示词模板 + 原文 + 预计译文 不超过上下文窗口，且预计译文不超过 max_tokens
+    """
+    available = int(context_length * CONTEXT_SAFETY_MARGIN) - template_tokens
+    by_context = int(available / (1 + expansion_ratio))
+    by_output = int(max_tokens / expansion_ratio)
+    return max(1, min(by_context, by_output))
@@ -0,0 +1,160 @@
+"""
+模型预加载与预热
+启动时在后台将模型文件读入系统页缓存、加载模型并执行一次很短的生成，
+首个翻译请求不再承担完整的加载时间；进度通过 ModelReadiness 对外提供
+切换模型时同样在后台加载和预热新模型，旧模型继续服务，进度通过 ModelSwapStatus 对外提供
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+# 就绪状态
+STATE_IDLE = "idle"  # 未开始（未开启预加载或模型已释放）
+STATE_LOADING = "loading"  # 正在读取模型文件、加载模型
+STATE_WARMING = "warming"  # 正在执行预热生成
+STATE_READY = "ready"
+STATE_ERROR = "error"
+
+# 模型切换状态
+SWAP_IDLE = "idle"
+SWAP_LOADING = "loading"  # 后台加载并预热新模型，旧模型继续服务
+SWAP_SWAPPING = "swapping"  # 切换到新模型
+SWAP_DRAINING = "draining"  # 等待旧模型上的任务完成
+SWAP_DONE = "done"
+SWAP_ERROR = "error"
+
+# 保留最近多少条切换进度事件
+_SWAP_EVENTS = 50
+
+# 预读模型文件时每次读取的字节数
+PREFETCH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 预热使用的文本和生成长度
+WARMUP_TEXT = "Hello"
+WARMUP_MAX_TOKENS = 4
+
+
+class ModelReadiness:
+    """模型就绪状态（线程安全，/ready 接口读取）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = STATE_IDLE
+        self.model: Optional[str] = None
+        self.message = ""
+        self.progress = 0.0
+        self.load_ms: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self._updated_at = time.time()
+
+    def update(self, state: Optional[str] = None, **fields):
+        with self._lock:
+            if state is not None:
+                self.state = state
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self._updated_at = time.time()
+
+    def reset(self, message: str = ""):
+        """模型被释放或更换后回到未就绪状态"""
+        with self._lock:
+            self.state = STATE_IDLE
+            self.message = message
+            self.progress = 0.0
+            self.load_ms = None
+            self.warmup_ms = None
+            self._updated_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == STATE_READY
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.state == STATE_READY,
+                "model": self.model,
+                "message": self.message,
+                "progress": round(self.progress, 3),
+                "load_ms": self.load_ms,
+                "warmup_ms": self.warmup_ms,
+                "updated_at": self._updated_at,
+            }
+
+
+def prefetch_file(path: str, on_progress: Optional[Callable[[int, int], None]] = None, chunk_size: int = PREFETCH_CHUNK_SIZE) -> int:
+    """
+    顺序读取整个文件，使其进入系统页缓存（模型随后以 mmap 方式加载时无需再等待磁盘）
+    返回读取的字节数
+    """
+    total = os.path.getsize(path)
+    done = 0
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        buffer = bytearray(chunk_size)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            done += n
+            if on_progress is not None:
+                on_progress(done, total)
+    return done
+
+
+class ModelSwapStatus:
+    """模型切换进度（线程安全），每次状态变化记录一条事件供前端轮询"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.state = SWAP_IDLE
+        self.model: Optional[str] = None
+        self.previous: Optional[str] = None
+        self.message = ""
+        self.progress = 0.0
+        self.events = deque(maxlen=_SWAP_EVENTS)
+
+    def update(self, state: Optional[str] = None, message: Optional[str] = None, progress: Optional[float] = None, **fields):
+        with self._lock:
+            if state is not None:
+                self.state = state
+            if message is not None:
+                self.message = message
+            if progress is not None:
+                self.progress = progress
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self._seq += 1
+            self.events.append({
+                "seq": self._seq,
+                "time": time.time(),
+                "state": self.state,
+                "model": self.model,
+                "message": self.message,
+                "progress": round(self.progress, 3),
+            })
+
+    @property
+    def active(self) -> bool:
+        return self.state in (SWAP_LOADING, SWAP_SWAPPING, SWAP_DRAINING)
+
+    def to_dict(self, since: int = 0) -> Dict[str, Any]:
+        """当前状态和 seq 大于 since 的事件"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "active": self.state in (SWAP_LOADING, SWAP_SWAPPING, SWAP_DRAINING),
+                "model": self.model,
+                "previous": self.previous,
+                "message": self.message,
+                "progress": round(self.progress, 3),
+                "events": [event for event in self.events if event["seq"] > since],
+            }
@@ -0,0 +1,140 @@
+"""
+输出token预算
+按原文token数和语言对的膨胀系数（译文token数 / 原文token数）计算每次请求的 max_tokens，
+避免几个词的短文本也按配置的 max_tokens 生成；同时统计预算被用尽（finish_reason 为 length）的频率，
+便于根据实际流量调整各语言对的系数
+"""
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from model_tokenizer import CONTEXT_SAFETY_MARGIN, DEFAULT_EXPANSION_RATIO
+
+# 语言对的默认膨胀系数，键为 "源语言->目标语言"，* 匹配任意语言
+# 中日文的每个token承载的信息较多，译为拼音文字时token数明显增加
+DEFAULT_EXPANSION_RATIOS = {
+    "zh->*": 2.0,
+    "zh-Hant->*": 2.0,
+    "yue->*": 2.0,
+    "ja->*": 1.8,
+    "ko->*": 1.6,
+    "*->zh": 1.3,
+    "*->zh-Hant": 1.3,
+    "*->yue": 1.3,
+    "*->ja": 1.4,
+    "zh->zh-Hant": 1.1,
+    "zh-Hant->zh": 1.1,
+}
+
+# 短文本的固定余量（标点、格式差异）
+OUTPUT_TOKEN_SLACK = 16
+
+# 单次请求的最小输出预算
+MIN_OUTPUT_TOKENS = 32
+
+# 每个语言对保留最近多少次请求用于计算实际膨胀系数的分位数
+_RECENT_RATIOS = 500
+
+
+def pair_key(source_lang: str, target_lang: str) -> str:
+    return f"{source_lang or 'auto'}->{target_lang}"
+
+
+def expansion_ratio(source_lang: str, target_lang: str, overrides: Optional[Dict[str, float]] = None) -> float:
+    """
+    查找语言对的膨胀系数
+    依次匹配 源->目标、*->目标、源->*，配置中的 overrides 优先于内置默认值
+    """
+    if not isinstance(overrides, dict):
+        overrides = {}
+    keys = (pair_key(source_lang, target_lang), f"*->{target_lang}", f"{source_lang}->*", "*->*")
+    for table in (overrides, DEFAULT_EXPANSION_RATIOS):
+        for key in keys:
+            value = table.get(key)
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value > 0:
+                return value
+    return DEFAULT_EXPANSION_RATIO
+
+
+def output_token_budget(source_tokens: int, ratio: float, context_length: int, prompt_tokens: int, max_tokens: int) -> int:
+    """
+    计算单次请求的 max_tokens
+    原文token数 × 膨胀系数 + 余量，不超过配置的 max_tokens，也不超过上下文窗口的剩余空间
+    """
+    budget = max(MIN_OUTPUT_TOKENS, int(source_tokens * ratio) + OUTPUT_TOKEN_SLACK)
+    return min(budget, output_token_limit(context_length, prompt_tokens, max_tokens))
+
+
+def output_token_limit(context_length: int, prompt_tokens: int, max_tokens: int) -> int:
+    """输出token数的上限：配置的 max_tokens 与上下文窗口剩余空间中的较小者"""
+    available = int(context_length * CONTEXT_SAFETY_MARGIN) - prompt_tokens
+    return max(1, min(max_tokens, available))
+
+
+class _PairStats:
+    def __init__(self):
+        self.requests = 0
+        self.budget_hits = 0
+        self.source_tokens = 0
+        self.budget_tokens = 0
+        self.output_tokens = 0
+        self.recent = deque(maxlen=_RECENT_RATIOS)
+
+    def to_dict(self, ratio: float) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "ratio": ratio,
+            "requests": self.requests,
+            "budget_hits": self.budget_hits,
+            "hit_rate": round(self.budget_hits / self.requests, 4) if self.requests else 0.0,
+            "avg_source_tokens": round(self.source_tokens / self.requests, 1) if self.requests else 0.0,
+            "avg_budget": round(self.budget_tokens / self.requests, 1) if self.requests else 0.0,
+            "avg_output_tokens": round(self.output_tokens / self.requests, 1) if self.requests else 0.0,
+            "observed_ratio": round(self.output_tokens / self.source_tokens, 3) if self.source_tokens else 0.0,
+            "observed_ratio_p95": round(p95, 3),
+        }
+
+
+class OutputBudgetStats:
+    """按语言对统计输出预算的使用情况（线程安全，在推理线程中记录）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pairs: Dict[str, _PairStats] = {}
+        self._ratios: Dict[str, float] = {}
+
+    def record(self, source_lang: str, target_lang: str, ratio: float, source_tokens: int, budget: int, output_tokens: int, finish_reason: Optional[str]):
+        key = pair_key(source_lang, target_lang)
+        with self._lock:
+            stats = self._pairs.get(key)
+            if stats is None:
+                stats = self._pairs[key] = _PairStats()
+            self._ratios[key] = ratio
+            stats.requests += 1
+            stats.source_tokens += source_tokens
+            stats.budget_tokens += budget
+            stats.output_tokens += output_tokens
+            if finish_reason == "length":
+                stats.budget_hits += 1
+            elif source_tokens > 0:
+                # 只有正常结束的请求才反映真实的译文长度
+                stats.recent.append(output_tokens / source_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pairs = {key: stats.to_dict(self._ratios[key]) for key, stats in self._pairs.items()}
+        requests = sum(p["requests"] for p in pairs.values())
+        hits = sum(p["budget_hits"] for p in pairs.values())
+        return {
+            "requests": requests,
+            "budget_hits": hits,
+            "hit_rate": round(hits / requests, 4) if requests else 0.0,
+            "pairs": pairs,
+        }
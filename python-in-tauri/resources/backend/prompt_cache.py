@@ -0,0 +1,180 @@
+"""
+提示词前缀缓存
+每次翻译的提示词都以相同的指令开头（只随目标语言变化），
+将指令部分求值后的模型状态（KV缓存）按 (模型, 前缀) 保存，下次直接恢复，只需对原文部分求值
+状态可选保存到模型旁边的 .prompt_cache 目录，重启后仍然有效
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个模型实例在内存中保留的前缀状态数（每种目标语言一个）
+DEFAULT_MAX_ENTRIES = 8
+
+# 磁盘缓存目录名（位于模型文件所在目录）
+CACHE_DIR_NAME = ".prompt_cache"
+
+# 磁盘缓存格式版本，格式变化时旧文件自动失效
+_FORMAT_VERSION = 1
+
+
+class PromptPrefixCache:
+    """
+    单个模型实例的前缀状态缓存
+    只能在持有该模型实例的推理线程中调用 prepare()
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._states: "OrderedDict[str, Tuple[List[int], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.errors = 0
+        self.boundary_mismatches = 0  # 前缀与原文在边界处合并为不同token、无法使用缓存的次数
+
+    def clear(self):
+        """清空内存中的状态（模型卸载时调用）"""
+        with self._lock:
+            self._states.clear()
+
+    def prepare(self, llm, model_path: str, model_params: Dict[str, Any], prefix: str, persist: bool = False) -> List[int]:
+        """
+        使模型的KV缓存以 prefix 开头，返回 prefix 的token
+        调用方将返回值与原文token拼接后作为提示词，llama-cpp 会跳过已求值的前缀
+        """
+        key = _state_key(model_path, model_params, prefix)
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is not None:
+                self._states.move_to_end(key)
+        if entry is not None:
+            tokens, state = entry
+            if not _starts_with(llm, tokens):
+                llm.load_state(state)
+            self._count("hits")
+            return tokens
+
+        tokens = llm.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        path = _disk_path(model_path, key) if persist else None
+        state = _read_state(path, tokens) if path else None
+        if state is not None:
+            llm.load_state(state)
+            self._count("disk_hits")
+            logger.info(f"已从磁盘恢复提示词前缀状态: {os.path.basename(path)}")
+        else:
+            self._count("misses")
+            # 即使已求值的token以前缀开头也重新求值：保存的状态只能包含前缀，
+            # 不能带上一次请求的原文和译文（否则内存和磁盘中的状态随上一次请求的长度增大）
+            llm.reset()
+            llm.eval(tokens)
+            state = llm.save_state()
+            if path and _write_state(path, tokens, state):
+                self._count("disk_writes")
+
+        with self._lock:
+            self._states[key] = (tokens, state)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+        return tokens
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_error(self):
+        self._count("errors")
+
+    def record_boundary_mismatch(self):
+        self._count("boundary_mismatches")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.disk_hits
+            return {
+                "entries": len(self._states),
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "disk_writes": self.disk_writes,
+                "errors": self.errors,
+                "boundary_mismatches": self.boundary_mismatches,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _starts_with(llm, tokens: List[int]) -> bool:
+    """模型当前已求值的token是否以 tokens 开头"""
+    evaluated = _evaluated_tokens(llm)
+    if len(evaluated) < len(tokens):
+        return False
+    return all(int(a) == b for a, b in zip(evaluated[:len(tokens)], tokens))
+
+
+def _evaluated_tokens(llm):
+    """模型已求值的token（llama-cpp 的 input_ids 是整个上下文大小的缓冲区，只有前 n_tokens 个有效）"""
+    n_tokens = getattr(llm, "n_tokens", None)
+    if n_tokens is None:
+        return llm.input_ids
+    return llm.input_ids[:n_tokens]
+
+
+def _state_key(model_path: str, model_params: Dict[str, Any], prefix: str) -> str:
+    """状态只在同一模型文件、相同上下文参数和相同前缀下有效"""
+    try:
+        st = os.stat(model_path)
+        signature = f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        signature = ""
+    params = sorted((k, repr(v)) for k, v in model_params.items() if k not in ("n_threads", "verbose", "use_mmap", "use_mlock"))
+    raw = f"{_FORMAT_VERSION}\0{os.path.abspath(model_path)}\0{signature}\0{params}\0{prefix}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _disk_path(model_path: str, key: str) -> str:
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(model_path)), CACHE_DIR_NAME)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f"{name}-{key[:16]}.state")
+
+
+def _read_state(path: str, tokens: List[int]) -> Optional[Any]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            saved_tokens, state = pickle.load(f)
+        if list(saved_tokens) != list(tokens):
+            return None
+        return state
+    except Exception as e:
+        logger.warning(f"读取提示词前缀状态失败，将重新计算: {str(e)}")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+
+def _write_state(path: str, tokens: List[int], state: Any) -> bool:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump((list(tokens), state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        logger.warning(f"保存提示词前缀状态失败: {str(e)}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
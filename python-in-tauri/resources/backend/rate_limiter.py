@@ -0,0 +1,102 @@
+"""
+令牌桶限流
+按固定速率（每秒请求数，QPS）发放令牌，请求在发送前取得一个令牌，令牌不足时异步等待；
+收到限流错误时临时降低速率（减半），之后每次成功的请求逐步恢复到配置的速率
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+# 降低速率的下限（配置速率的比例）
+MIN_RATE_SHARE = 0.1
+# 两次降低速率的最小间隔（秒）：同一时刻发出的多个请求同时被限流只算一次
+THROTTLE_INTERVAL = 1.0
+# 每次成功的请求恢复的速率（配置速率的比例）
+RECOVERY_SHARE = 0.05
+
+# 计算实际QPS的时间窗口（秒）
+_QPS_WINDOW = 10.0
+
+
+class TokenBucket:
+    """
+    令牌桶（只能在事件循环中使用）
+    容量为一个令牌：请求按速率均匀间隔发出，空闲后也不会突发（服务端按每秒的请求数计算限额）
+    """
+
+    def __init__(self, rate: float = 1.0):
+        self._lock = threading.Lock()
+        self.configured_rate = max(0.1, rate)
+        self.rate = self.configured_rate
+        self.tokens = 1.0
+        self._updated = time.monotonic()
+        self._granted = deque()  # 最近发放令牌的时间
+        self._started = time.monotonic()
+        self._throttled_at = 0.0
+        self.requests = 0
+        self.throttled = 0  # 收到的限流错误数
+        self.total_wait = 0.0
+
+    def configure(self, rate: float):
+        rate = max(0.1, rate)
+        if rate != self.configured_rate:
+            self.configured_rate = rate
+            self.rate = rate
+
+    def _refill(self, now: float):
+        self.tokens = min(1.0, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """取得一个令牌，令牌不足时等待（预先扣除令牌，等待期间被取消时归还）"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.tokens += 1
+                raise
+        with self._lock:
+            granted = time.monotonic()
+            while self._granted and granted - self._granted[0] > _QPS_WINDOW:
+                self._granted.popleft()
+            self._granted.append(granted)
+            self.requests += 1
+            self.total_wait += wait
+
+    def throttle(self):
+        """收到限流错误：速率减半（不低于配置速率的 MIN_RATE_SHARE，每 THROTTLE_INTERVAL 秒最多一次），并清空剩余令牌"""
+        with self._lock:
+            self.throttled += 1
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        if now - self._throttled_at >= THROTTLE_INTERVAL:
+            self._throttled_at = now
+            self.rate = max(self.configured_rate * MIN_RATE_SHARE, self.rate / 2)
+
+    def recover(self):
+        """请求成功：逐步恢复到配置的速率"""
+        if self.rate < self.configured_rate:
+            self.rate = min(self.configured_rate, self.rate + self.configured_rate * RECOVERY_SHARE)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            while self._granted and now - self._granted[0] > _QPS_WINDOW:
+                self._granted.popleft()
+            window = max(1.0, min(_QPS_WINDOW, now - self._started))
+            return {
+                "qps": self.configured_rate,
+                "current_rate": round(self.rate, 3),
+                # 最近 _QPS_WINDOW 秒内实际发出的请求速率
+                "effective_qps": round(len(self._granted) / window, 3),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "avg_wait_ms": round(self.total_wait / self.requests * 1000, 2) if self.requests else 0.0,
+            }
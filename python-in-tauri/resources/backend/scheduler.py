@@ -0,0 +1,129 @@
+"""
+推理请求调度器
+按优先级（交互 > 流式 > 批量）排列推理任务，同一优先级内先进先出
+批量任务按段提交，交互请求可以在任意两段之间插队
+任务可以指定由某个推理线程执行（如预热每个线程的模型实例），与共享任务一起按优先级排列
+"""
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Hashable, List, Optional
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_STREAMING = "streaming"
+PRIORITY_BATCH = "batch"
+
+# 数值越小越先执行
+PRIORITY_ORDER = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_STREAMING: 1,
+    PRIORITY_BATCH: 2,
+}
+
+# 当前请求的优先级，提交推理任务时读取
+current_priority: contextvars.ContextVar = contextvars.ContextVar("inference_priority", default=PRIORITY_INTERACTIVE)
+
+# 每个优先级保留最近多少次等待时间用于计算分位数
+_RECENT_WAITS = 200
+
+
+def normalize_priority(priority: Optional[str]) -> str:
+    """未知优先级按交互请求处理"""
+    return priority if priority in PRIORITY_ORDER else PRIORITY_INTERACTIVE
+
+
+class _ClassStats:
+    def __init__(self):
+        self.depth = 0
+        self.submitted = 0
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=_RECENT_WAITS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "queue_depth": self.depth,
+            "submitted": self.submitted,
+            "started": self.started,
+            "avg_wait_ms": round(self.total_wait / self.started * 1000, 2) if self.started else 0.0,
+            "p95_wait_ms": round(p95 * 1000, 2),
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class RequestScheduler:
+    """
+    线程安全的优先级任务队列
+    推理线程（可以有多个）通过 get() 按优先级取出任务，并记录每个任务的排队时间
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._targeted: Dict[Hashable, list] = {}  # 推理线程 -> 只能由该线程执行的任务
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stats = {name: _ClassStats() for name in PRIORITY_ORDER}
+
+    def put(self, job: Any, priority: Optional[str] = None, target: Optional[Hashable] = None):
+        """按优先级加入任务，未指定时使用当前请求的优先级；target 指定执行任务的推理线程"""
+        priority = normalize_priority(priority or current_priority.get())
+        with self._cond:
+            heap = self._heap if target is None else self._targeted.setdefault(target, [])
+            heapq.heappush(heap, (PRIORITY_ORDER[priority], next(self._seq), time.monotonic(), priority, job))
+            stats = self._stats[priority]
+            stats.depth += 1
+            stats.submitted += 1
+            # 指定线程的任务需要唤醒所有等待的线程，确保目标线程被唤醒
+            if target is None:
+                self._cond.notify()
+            else:
+                self._cond.notify_all()
+
+    def _next_heap(self, target: Optional[Hashable]) -> Optional[list]:
+        """target 可以取出的下一个任务所在的队列（共享队列或该线程的队列）"""
+        targeted = self._targeted.get(target) if target is not None else None
+        if targeted and (not self._heap or targeted[0] < self._heap[0]):
+            return targeted
+        return self._heap or None
+
+    def get(self, timeout: Optional[float] = None, target: Optional[Hashable] = None) -> Any:
+        """取出优先级最高的任务（阻塞），包括指定由 target 执行的任务；超时返回 None"""
+        with self._cond:
+            heap = self._next_heap(target)
+            if heap is None:
+                self._cond.wait(timeout)
+                heap = self._next_heap(target)
+                if heap is None:
+                    return None
+            _, _, enqueued_at, priority, job = heapq.heappop(heap)
+            wait = time.monotonic() - enqueued_at
+            stats = self._stats[priority]
+            stats.depth -= 1
+            stats.started += 1
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+            stats.recent.append(wait)
+            return job
+
+    def remove_target(self, target: Hashable) -> List[Any]:
+        """移除指定由 target 执行、尚未取出的任务（推理线程退出时调用），返回这些任务"""
+        with self._cond:
+            heap = self._targeted.pop(target, [])
+            for entry in heap:
+                self._stats[entry[3]].depth -= 1
+        return [entry[4] for entry in sorted(heap)]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各优先级的队列深度和等待时间"""
+        with self._cond:
+            classes = {name: stats.to_dict() for name, stats in self._stats.items()}
+        return {
+            "queue_depth": sum(c["queue_depth"] for c in classes.values()),
+            "classes": classes,
+        }
@@ -0,0 +1,116 @@
+"""
+短文本打包
+批量翻译中的大量短文本（PDF文本块、/batch_translate 的字符串、很小的文件）各自翻译时，
+每段都要承担一次完整的提示词求值和调度开销；打包后多个短文本共用一次生成：
+每段前加编号分隔符（【1】【2】…），译文按编号拆回各段
+模型合并、遗漏或打乱了段落时拆分失败，由调用方退回逐段翻译，结果不会错位
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+# 编号分隔符（行首的 【n】）
+MARKER_FORMAT = "【{}】"
+_MARKER = re.compile(r"^[ \t]*【(\d+)】[ \t]*", re.MULTILINE)
+
+# 默认值（可通过配置覆盖）
+DEFAULT_MAX_TOKENS = 512  # 每个打包提示词中原文的token数上限
+DEFAULT_MAX_SEGMENTS = 16  # 每个打包提示词最多包含的段数
+DEFAULT_SEGMENT_TOKENS = 64  # 超过该token数的文本单独翻译
+
+# 每段的编号分隔符和换行占用的token数估算
+MARKER_TOKENS = 4
+
+
+def build_packed_prompt_prefix(target_display: str) -> str:
+    """打包提示词的指令部分（只随目标语言变化，其求值状态同样可以缓存复用）"""
+    return (
+        f"将以下各段文本分别翻译为{target_display}。每段以【编号】开头，"
+        f"译文中保留每段的【编号】，段数和顺序保持不变，注意只需要输出翻译后的结果，不要额外解释：\n\n"
+    )
+
+
+def packable(text: str) -> bool:
+    """文本能否参与打包：非空，且不包含会与编号分隔符混淆的内容"""
+    return bool(text.strip()) and _MARKER.search(text) is None
+
+
+def plan_packs(sizes: Sequence[Optional[int]], max_tokens: int = DEFAULT_MAX_TOKENS, max_segments: int = DEFAULT_MAX_SEGMENTS) -> List[List[int]]:
+    """
+    按输入顺序将可打包的文本分组，返回各组的下标
+    sizes 为每个文本的token数，None 表示不参与打包；只有一段的组不算打包（由调用方单独翻译）
+    """
+    packs: List[List[int]] = []
+    group: List[int] = []
+    tokens = 0
+    for index, size in enumerate(sizes):
+        if size is None:
+            continue
+        size += MARKER_TOKENS
+        if group and (tokens + size > max_tokens or len(group) >= max_segments):
+            packs.append(group)
+            group, tokens = [], 0
+        group.append(index)
+        tokens += size
+    if group:
+        packs.append(group)
+    return [pack for pack in packs if len(pack) > 1]
+
+
+def pack_segments(texts: Sequence[str]) -> str:
+    """将多段文本按编号拼接为一个提示词正文"""
+    return "\n".join(MARKER_FORMAT.format(i) + text.strip() for i, text in enumerate(texts, 1))
+
+
+def unpack_segments(output: str, count: int) -> Optional[List[str]]:
+    """
+    按编号拆分译文，返回 count 段译文
+    编号不是依次的 1..count、某段译文为空或第一个编号之前有其他内容时返回 None
+    """
+    matches = list(_MARKER.finditer(output))
+    if [int(m.group(1)) for m in matches] != list(range(1, count + 1)):
+        return None
+    if output[:matches[0].start()].strip():
+        return None
+    pieces = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(output)
+        piece = output[match.end():end].strip()
+        if not piece:
+            return None
+        pieces.append(piece)
+    return pieces
+
+
+class PackingStats:
+    """打包翻译的统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.packs = 0  # 成功拆分的打包请求数
+        self.packed_segments = 0  # 通过打包请求翻译的段数
+        self.fallbacks = 0  # 拆分失败、退回逐段翻译的打包请求数
+        self.fallback_segments = 0
+
+    def record(self, segments: int, success: bool):
+        with self._lock:
+            if success:
+                self.packs += 1
+                self.packed_segments += segments
+            else:
+                self.fallbacks += 1
+                self.fallback_segments += segments
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.packs + self.fallbacks
+            return {
+                "packs": self.packs,
+                "packed_segments": self.packed_segments,
+                "avg_segments_per_pack": round(self.packed_segments / self.packs, 2) if self.packs else 0.0,
+                "fallbacks": self.fallbacks,
+                "fallback_segments": self.fallback_segments,
+                "fallback_rate": round(self.fallbacks / attempts, 4) if attempts else 0.0,
+                # 与逐段翻译相比省去的模型调用次数
+                "saved_calls": self.packed_segments - self.packs,
+            }
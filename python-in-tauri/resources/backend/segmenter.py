@@ -0,0 +1,189 @@
+"""
+流式分段器
+本地模型、百度翻译和PDF翻译共用的分段逻辑：
+先按行，超长的行再按中英文句末标点切分，仍然超长时按分句标点、空白或字符数切分
+分段结果是原文的无损切分：所有 lead + body + trail 依次拼接后与原文完全一致，
+缩进、空行等空白保留在 lead/trail 中，只有 body 需要翻译
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+
+# 一行中第一个到最后一个非空白字符
+_LINE_BODY = re.compile(r"\S(?:[^\n]*\S)?")
+
+# 句末标点：中日文句号/问号/叹号等无需空格；英文句末标点后需跟空白
+_SENTENCE_END = re.compile(r"[。！？；…]+[」』”’）】]*|[.!?;]+[\"'”’)\]]*(?=\s)")
+
+# 分句标点
+_CLAUSE_END = re.compile(r"[，、：,:]+[\"'”’)\]]*\s*")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class Segment:
+    """一个待翻译片段：lead 为前导空白（换行、空行、缩进），body 为正文，trail 为尾部空白"""
+    lead: str
+    body: str
+    trail: str = ""
+
+    def render(self, translated_body: str) -> str:
+        """用译文替换正文，保留原有空白"""
+        return self.lead + translated_body + self.trail
+
+
+def iter_segments(text: str, max_units: Optional[int] = None, measure: Callable[[str], int] = len) -> Iterator[Segment]:
+    """
+    逐个产出分段（生成器，不复制整段原文）
+    max_units 为单个分段的上限（按 measure 计量，如字符数、字节数或token数），None 表示只按行切分
+    """
+    pending = 0  # 上一个正文结束的位置
+    segment = None
+    for match in _LINE_BODY.finditer(text):
+        start, end = match.span()
+        lead = text[pending:start]
+        pending = end
+        body = match.group()
+        if max_units is None or measure(body) <= max_units:
+            pieces = [("", body)]
+        else:
+            pieces = _split_long(body, max_units, measure)
+        for i, (gap, piece) in enumerate(pieces):
+            if segment is not None:
+                yield segment
+            segment = Segment(lead if i == 0 else gap, piece)
+    if segment is None:
+        if text:
+            # 全部是空白
+            yield Segment(text, "")
+        return
+    segment.trail = text[pending:]
+    yield segment
+
+
+def iter_chunks(text: str, max_units: int, measure: Callable[[str], int] = len) -> Iterator[Segment]:
+    """
+    将相邻分段打包为不超过 max_units 的块
+    每个块的 body 是原文中从第一个正文开始到最后一个正文结束的连续片段（包含其间的换行和缩进）
+    """
+    group: List[Segment] = []
+    units = 0
+    for segment in iter_segments(text, max_units, measure):
+        # 分段之间的空白（换行、空行、缩进）在合并后留在块中，按实际内容计量
+        size = measure(segment.body) + (measure(segment.lead) if group else 0)
+        if group and units + size > max_units:
+            yield _merge(group)
+            group, units = [], 0
+            size = measure(segment.body)
+        group.append(segment)
+        units += size
+    if group:
+        yield _merge(group)
+
+
+def count_units(text: str, measure: Callable[[str], int] = len) -> int:
+    """按行计量整段文本：各行正文及其间的空白（与 iter_chunks 合并后的块的计量一致，不含首尾空白）"""
+    total = 0
+    for i, segment in enumerate(iter_segments(text)):
+        total += measure(segment.body) + (measure(segment.lead) if i else 0)
+    return total
+
+
+def _merge(group: List[Segment]) -> Segment:
+    first = group[0]
+    if len(group) == 1:
+        return Segment(first.lead, first.body, first.trail)
+    body = first.body + "".join(segment.lead + segment.body for segment in group[1:])
+    return Segment(first.lead, body, group[-1].trail)
+
+
+def _split_long(body: str, max_units: int, measure: Callable[[str], int]):
+    """
+    切分超长的一行，返回 [(前导空白, 片段), ...]
+    优先在句末标点处切分，其次分句标点和空白，最后按字符数
+    """
+    pieces = []
+    for gap, sentence in _split_at(body, _SENTENCE_END):
+        if measure(sentence) <= max_units:
+            pieces.append((gap, sentence))
+            continue
+        for i, (sub_gap, part) in enumerate(_pack_parts(sentence, max_units, measure)):
+            pieces.append((gap if i == 0 else sub_gap, part))
+    return pieces
+
+
+def _split_at(text: str, pattern: re.Pattern):
+    """在 pattern 匹配处之后切分，匹配后的空白作为下一片段的前导空白"""
+    result = []
+    start = 0
+    gap = ""
+    for match in pattern.finditer(text):
+        end = match.end()
+        piece = text[start:end]
+        stripped = piece.rstrip()
+        if stripped.strip():
+            result.append((gap, stripped))
+            gap = piece[len(stripped):]
+        else:
+            gap += piece
+        ws = _WHITESPACE.match(text, end)
+        if ws:
+            gap += ws.group()
+            end = ws.end()
+        start = end
+    if start < len(text):
+        result.append((gap, text[start:]))
+    return result
+
+
+# 超长句子依次尝试的切分位置：分句标点、空白
+_PART_PATTERNS = (_CLAUSE_END, _WHITESPACE)
+
+
+def _pack_parts(sentence: str, max_units: int, measure: Callable[[str], int], level: int = 0):
+    """
+    按分句标点（其次空白）切开后重新打包到不超过 max_units
+    单个部分仍超长时换用下一级切分方式，最后按字符数切分
+    """
+    if level >= len(_PART_PATTERNS):
+        return [("", piece) for piece in _split_by_measure(sentence, max_units, measure)]
+
+    packed = []
+    current_gap, current = "", ""
+    for gap, part in _split_at(sentence, _PART_PATTERNS[level]):
+        if measure(part) > max_units:
+            if current:
+                packed.append((current_gap, current))
+                current_gap, current = "", ""
+            for i, (sub_gap, piece) in enumerate(_pack_parts(part, max_units, measure, level + 1)):
+                packed.append((gap if i == 0 else sub_gap, piece))
+            continue
+        candidate = current + gap + part if current else part
+        if current and measure(candidate) > max_units:
+            packed.append((current_gap, current))
+            current_gap, current = gap, part
+        elif current:
+            current = candidate
+        else:
+            current_gap, current = gap, part
+    if current:
+        packed.append((current_gap, current))
+    return packed
+
+
+def _split_by_measure(text: str, max_units: int, measure: Callable[[str], int]) -> List[str]:
+    """按字符数切分，每片的计量不超过 max_units（二分查找切分位置）"""
+    pieces = []
+    start = 0
+    while start < len(text):
+        lo, hi = start + 1, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if measure(text[start:mid]) <= max_units:
+                lo = mid
+            else:
+                hi = mid - 1
+        pieces.append(text[start:lo])
+        start = lo
+    return pieces
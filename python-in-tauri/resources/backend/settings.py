@@ -0,0 +1,315 @@
+"""
+应用配置
+配置文件只在首次使用和文件修改时间变化时重新解析，translator.py 与 translation_api.py 共享同一份配置
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# resources/config.json（打包后的位置或开发模式的位置）
+RESOURCES_CONFIG_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), "../config.json"))
+
+# 变化后需要重新加载模型的配置项
+MODEL_KEYS = (
+    "model_dir", "current_model", "context_length", "threads", "use_mmap", "use_mlock", "memory_limit_mb", "auto_reduce_context",
+    "n_batch", "n_ubatch", "n_threads_batch", "flash_attn", "cache_type_k", "cache_type_v", "short_context_length",
+    "speculative_mode", "speculative_draft_model", "speculative_tokens",
+)
+
+
+@dataclass
+class Settings:
+    """类型化的配置对象，未知配置项保存在 extra 中原样写回"""
+    # 本地模型
+    model_dir: str = "./models"
+    current_model: str = ""
+    context_length: int = 2048
+    threads: int = 4
+    # 推理线程池：inference_workers 个模型实例共同处理批量任务
+    # threads_per_worker 为 0 时按 threads / inference_workers 平分核心
+    inference_workers: int = 1
+    threads_per_worker: int = 0
+    # 以 mmap 方式加载权重（多个实例和多个后端进程共享同一份文件页缓存）；mlock 将权重锁定在内存中，避免被换出
+    use_mmap: bool = True
+    use_mlock: bool = False
+    # 加载模型的内存上限（MB），0 表示按系统可用内存自动计算
+    # 超出时 auto_reduce_context 为 True 则逐步缩小上下文长度，缩到下限（或关闭时）仍超出则拒绝加载
+    memory_limit_mb: float = 0.0
+    auto_reduce_context: bool = True
+    # CPU推理参数（按模型校验，不支持的组合回退为安全值，见 /config 的 inference）
+    # n_threads_batch 为 0 时使用 llama.cpp 的默认值；量化的V缓存（q8_0/q4_0 等）需要开启 flash_attn
+    n_batch: int = 512
+    n_ubatch: int = 512
+    n_threads_batch: int = 0
+    flash_attn: bool = False
+    cache_type_k: str = "f16"
+    cache_type_v: str = "f16"
+    # 短文本使用该上下文长度的实例（0 表示不区分），文档等长文本使用 context_length
+    # 两个实例不能同时常驻在 resident_models_max_mb 内时只使用 context_length 的实例
+    short_context_length: int = 1024
+    # 推测解码：off / prompt_lookup（从原文中照抄 n-gram 作为候选）/ draft_model（模型文件夹中词表相同的小模型）
+    # speculative_tokens 为每次提出的候选token数，0 表示使用各模式的默认值；统计见 /speculative
+    speculative_mode: str = "off"
+    speculative_draft_model: str = ""
+    speculative_tokens: int = 0
+    # 常驻模型的内存预算（MB）：切换模型时旧实例保留在内存中，超出预算时淘汰最久未使用的实例
+    resident_models_max_mb: float = 4096.0
+    # 启动时在后台预加载并预热模型（进度见 /ready）
+    preload_model: bool = True
+    max_tokens: int = 512
+    temperature: float = 0.1
+    # 自适应输出预算：按原文token数 × 语言对膨胀系数计算每次请求的 max_tokens（不超过上面的 max_tokens）
+    # expansion_ratios 覆盖内置系数，键为 "源语言->目标语言"，可用 * 匹配任意语言
+    adaptive_max_tokens: bool = True
+    expansion_ratios: Dict[str, float] = field(default_factory=dict)
+    # 提示词前缀缓存：复用固定指令部分的KV状态；persist 时保存到模型目录的 .prompt_cache 中
+    prompt_cache_enabled: bool = True
+    prompt_cache_persist: bool = False
+    # 翻译前识别语言：已是目标语言、纯数字/符号/链接的文本不再调用翻译提供商，源语言为 auto 时补充识别出的语言；统计见 /language-prepass
+    language_prepass: bool = True
+    # 链接、邮箱、路径、占位符、行内代码和带分隔符的数字遮蔽后再翻译，译文中按原样还原（整段是代码时不翻译）；统计见 /span-masking
+    span_masking: bool = True
+    # 短文本打包：批量翻译（PDF、/batch_translate、批量文件）中原文不超过 packing_segment_tokens 的文本
+    # 按编号打包到同一个提示词中（每包不超过 packing_max_tokens / packing_max_segments），拆分失败时逐段翻译；统计见 /packing
+    segment_packing: bool = True
+    packing_max_tokens: int = 512
+    packing_max_segments: int = 16
+    packing_segment_tokens: int = 64
+    # 微批处理：micro_batch_window_ms 内到达的、同一模型和语言对的短文本 /translate 请求合并为一次打包推理
+    # （每批最多 micro_batch_max_size 个，按上面的打包配置拆分），每个请求最多多等待一个窗口；统计见 /micro-batch
+    micro_batching: bool = False
+    micro_batch_window_ms: float = 10.0
+    micro_batch_max_size: int = 8
+    # 百度翻译
+    baidu_appid: str = ""
+    baidu_appkey: str = ""
+    # 百度翻译API地址（离线测试时可改为本地模拟服务，见 baidu_mock_server.py）
+    baidu_endpoint: str = "http://api.fanyi.baidu.com"
+    # 百度翻译请求共用一个异步连接池（保持长连接）：baidu_timeout 为读写超时，baidu_connect_timeout 为建立连接的超时（秒），
+    # baidu_max_connections 为同时打开的最大连接数，baidu_keepalive_connections 为空闲时保留的长连接数
+    baidu_timeout: float = 10.0
+    baidu_connect_timeout: float = 5.0
+    baidu_max_connections: int = 10
+    baidu_keepalive_connections: int = 5
+    # 账户的QPS限额（标准版1，高级版10，尊享版100）：每个 appid 按该速率发送请求，并发请求数不超过该值；
+    # 限流（54003）和服务端临时错误按带随机抖动的指数退避最多重试 baidu_max_retries 次，限流时临时降低速率；实际QPS见 /baidu
+    baidu_qps: float = 1.0
+    baidu_max_retries: int = 3
+    # 翻译记忆
+    translation_memory_enabled: bool = True
+    translation_memory_max_mb: float = 256.0
+    # 前端使用的配置
+    api_base_url: str = "http://127.0.0.1:8000"
+    timeout: int = 5000
+    auto_copy: bool = False
+    dark_mode: bool = False
+    theme_color: str = "#6366f1"
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Settings":
+        """从字典创建配置，按字段声明的类型转换，类型不匹配的值回退为默认值"""
+        settings = cls()
+        known = {f.name: f for f in fields(cls) if f.name != "extra"}
+        for key, value in data.items():
+            if key not in known:
+                settings.extra[key] = value
+                continue
+            default = getattr(settings, key)
+            field_type = known[key].type
+            try:
+                if field_type is bool:
+                    value = value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes", "on")
+                elif field_type in (int, float, str) and value is not None:
+                    value = field_type(value)
+                setattr(settings, key, value)
+            except (TypeError, ValueError):
+                logger.warning(f"配置项 {key} 的值无效: {value!r}，使用默认值 {default!r}")
+        return settings
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典（用于 /config 接口和写回文件）"""
+        data = dict(self.extra)
+        for f in fields(self):
+            if f.name != "extra":
+                data[f.name] = getattr(self, f.name)
+        return data
+
+    @property
+    def worker_threads(self) -> Optional[int]:
+        """每个推理线程的线程数，单线程池时返回 None（直接使用 threads）"""
+        if self.threads_per_worker > 0:
+            return self.threads_per_worker
+        if self.inference_workers <= 1:
+            return None
+        return max(1, self.threads // self.inference_workers)
+
+    @property
+    def model_dir_path(self) -> str:
+        """模型文件夹的绝对路径，相对路径相对于 resources 目录"""
+        model_dir = self.model_dir
+        if not os.path.isabs(model_dir):
+            base_dir = os.path.dirname(__file__)
+            model_dir = os.path.join(base_dir, "..", model_dir)
+            model_dir = os.path.normpath(model_dir)
+        return model_dir
+
+
+def _user_config_path() -> Optional[Path]:
+    """用户配置目录中的 config.json（appdirs 不可用时返回 None）"""
+    try:
+        import appdirs
+        return Path(appdirs.user_data_dir("TranslatorApp", "Translator")) / "config.json"
+    except ImportError:
+        return None
+
+
+class SettingsStore:
+    """
+    带缓存的配置存储
+    读取优先级：resources/config.json > 用户配置目录 > 默认配置
+    每次 get() 只检查文件的修改时间，变化时才重新解析
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._explicit_path = path
+        self._lock = threading.Lock()
+        self._settings: Optional[Settings] = None
+        self._path: Optional[str] = None
+        self._signature = None
+        self._listeners: List[Callable[[Settings, Settings], None]] = []
+
+    def add_listener(self, listener: Callable[[Settings, Settings], None]):
+        """注册配置变化回调 listener(old, new)"""
+        self._listeners.append(listener)
+
+    def _candidate_paths(self) -> List[str]:
+        if self._explicit_path:
+            return [self._explicit_path]
+        paths = [RESOURCES_CONFIG_PATH]
+        user_path = _user_config_path()
+        if user_path is not None:
+            paths.append(str(user_path))
+        return paths
+
+    @staticmethod
+    def _stat_signature(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> Settings:
+        """获取当前配置（文件未变化时直接返回缓存）"""
+        changed = None
+        with self._lock:
+            path, signature = None, None
+            for candidate in self._candidate_paths():
+                signature = self._stat_signature(candidate)
+                if signature is not None:
+                    path = candidate
+                    break
+
+            if self._settings is not None and path == self._path and signature == self._signature:
+                return self._settings
+
+            old = self._settings
+            self._settings = self._load(path) if path else Settings()
+            self._path = path
+            self._signature = signature
+            if old is not None:
+                changed = (old, self._settings)
+            new = self._settings
+
+        if changed:
+            logger.info(f"检测到配置文件变化，已重新加载: {path}")
+            self._notify(*changed)
+        return new
+
+    def _load(self, path: str) -> Settings:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取配置文件 {path} 失败: {str(e)}")
+            return self._settings or Settings()
+
+        # 兼容旧的配置格式：如果有 model_path，转换为 model_dir 和 current_model
+        if "model_path" in data and "model_dir" not in data:
+            old_model_path = data.pop("model_path")
+            model_dir = os.path.dirname(old_model_path)
+            if not os.path.isabs(model_dir):
+                base_dir = os.path.dirname(__file__)
+                model_dir = os.path.normpath(os.path.join(base_dir, "..", model_dir))
+            data["model_dir"] = model_dir
+            data["current_model"] = os.path.basename(old_model_path)
+            try:
+                self._write(path, data)
+            except Exception as e:
+                logger.warning(f"保存转换后的配置失败: {str(e)}")
+
+        return Settings.from_dict(data)
+
+    @staticmethod
+    def _write(path: str, data: Dict[str, Any]):
+        config_dir = os.path.dirname(path)
+        if config_dir and not os.path.exists(config_dir):
+            os.makedirs(config_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def save(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        保存配置
+        优先保存到 resources/config.json，失败时保存到用户配置目录
+        """
+        paths = self._candidate_paths()
+        error = None
+        message = None
+        saved_path = None
+        for index, path in enumerate(paths):
+            try:
+                self._write(path, data)
+                saved_path = path
+                if path == RESOURCES_CONFIG_PATH:
+                    message = "配置已保存到 resources/config.json"
+                elif index > 0:
+                    message = "配置已保存到用户配置目录"
+                else:
+                    message = f"配置已保存到 {path}"
+                break
+            except Exception as e:
+                logger.error(f"保存配置到 {path} 失败: {str(e)}")
+                error = error or e
+
+        if saved_path is None:
+            return {"success": False, "error": str(error)}
+
+        with self._lock:
+            old = self._settings
+            self._settings = Settings.from_dict(data)
+            self._path = saved_path
+            self._signature = self._stat_signature(saved_path)
+            new = self._settings
+        if old is not None:
+            self._notify(old, new)
+        return {"success": True, "message": message}
+
+    def _notify(self, old: Settings, new: Settings):
+        for listener in self._listeners:
+            try:
+                listener(old, new)
+            except Exception as e:
+                logger.error(f"配置变化回调执行失败: {str(e)}")
+
+
+def model_settings_changed(old: Settings, new: Settings) -> bool:
+    """判断两份配置之间是否有需要重新加载模型的变化"""
+    return any(getattr(old, key) != getattr(new, key) for key in MODEL_KEYS)
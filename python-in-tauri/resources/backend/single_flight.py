@@ -0,0 +1,69 @@
+"""
+相同翻译请求的合并（single-flight）
+同一文本、同一提供商/模型/语言对的翻译正在进行时，后到的请求不再重复推理，而是等待第一个请求的结果
+只在请求执行期间有效，与翻译记忆无关；所有等待者都取消后才取消正在执行的翻译
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并正在执行的协程（只能在事件循环中使用）"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0  # 实际执行的请求数
+        self.coalesced = 0  # 合并到正在执行的请求上的请求数
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 factory()；相同 key 的请求正在执行时等待其结果"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda _: self._done(key, flight))
+            self._record(leader=True)
+        else:
+            self._record(leader=False)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def record_coalesced(self, count: int):
+        """记录在调用方已合并的重复请求（如同一批量任务中的相同文本）"""
+        with self._lock:
+            self.coalesced += count
+
+    def _done(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _record(self, leader: bool):
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,183 @@
+"""
+不需要翻译的片段的遮蔽与还原
+链接、邮箱、文件路径、占位符（{name}、%s、${var}）、行内代码和带分隔符的数字（3.14、1,024、v1.2.3、10:30）
+在翻译前替换为 {{0}}、{{1}} … 形式的记号，译文中的记号再按原样还原；
+这些片段不再占用提示词，也不会被模型改写。整段是代码或只剩记号的文本不调用翻译提供商
+译文中记号缺失或重复时还原失败，由调用方改为翻译未遮蔽的原文
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# 超过该长度的文本不遮蔽（长文本分段翻译时记号更容易丢失，失败后重新翻译的代价也更高）
+MAX_MASK_CHARS = 4000
+
+# 跳过原因
+SKIP_CODE = "code"
+SKIP_MASKED_ONLY = "masked_only"
+
+# 按优先级排列：先匹配的片段不会再被后面的规则拆开
+_SPAN_PATTERNS: Tuple[Tuple[str, str], ...] = (
+    ("code", r"`[^`\n]+`"),
+    ("url", r"(?:https?|ftp)://[^\s<>\"'）)\]]+|www\.[^\s<>\"'）)\]]+"),
+    ("email", r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    ("placeholder", r"\{\{[^{}\n]*\}\}|\$\{[^{}\n]+\}|\{[\w.:\-]*\}|%(?:\(\w+\))?[-+#0]*\d*(?:\.\d+)?[sdifgxXeEc]"),
+    ("path", r"[A-Za-z]:\\[^\s<>\"']+|(?<![\w/])(?:/[\w.\-]+){2,}/?"),
+    ("number", r"(?<![\w.])v?\d+(?:[.,:]\d+)+%?(?![\w])"),
+)
+_SPAN = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in _SPAN_PATTERNS))
+
+# 链接末尾的标点属于句子而不是链接
+_TRAILING_PUNCTUATION = ".,;:!?。，；：！？"
+
+_TOKEN = re.compile(r"\{\{\s*(\d+)\s*\}\}")
+
+# 代码行：带赋值或调用的语句、闭合括号、带代码符号的关键字行、赋值、函数调用
+_CODE_LINE = re.compile(
+    r"^\s*(?:"
+    r".*[=(].*[;{]"
+    r"|[}\])]+;?"
+    r"|(?:import|from|#include|#define)\b.*"
+    r"|(?:def|class|return|if|elif|else|for|while|function|var|let|const|public|private|static)\b.*[=()\[\]<>{}+*/%;].*"
+    r"|[\w.\[\]]+\s*(?:[+\-*/%|&]?=|=>)\s*\S.*"
+    r"|[\w.]+\(.*\);?"
+    r")\s*$"
+)
+
+# 代码特征：一行至少命中两种才算代码（只有一个等号、括号或分号的普通句子很常见）
+_CODE_SIGNALS = (
+    re.compile(r"[;{}]\s*$"),  # 语句结尾
+    re.compile(r"^\s*[}\])]"),  # 闭合括号开头
+    re.compile(r"\w\("),  # 函数调用
+    re.compile(r"^\s*[\w.]+\(.*\);?\s*$"),  # 整行是一个函数调用
+    re.compile(r"\w\["),  # 下标
+    re.compile(r"\w\.\w"),  # 属性访问
+    re.compile(r"\b[a-z]+_\w+|\b[a-z]+[A-Z]\w*"),  # 下划线或驼峰命名的标识符
+    re.compile(r"(?<![=<>!+\-*/%|&])=(?![=>])"),  # 赋值
+    re.compile(r"[=!<>]=|=>|->|&&|\|\||::|\+\+|[+\-*/%|&]="),  # 比较、箭头等运算符
+    re.compile(r"\w\s*[+*/%]\s*\w"),  # 算术运算
+    re.compile(r"^\s*(?:import\s+[\w.]+|from\s+[\w.]+\s+import\b|#include\s*[<\"]|#define\s+\w)"),  # 导入和预处理指令
+    re.compile(r"^\s*(?:import|from|#include|#define|def|class|return|if|elif|else|for|while|function|var|let|const|public|private|static)\b"),  # 关键字开头
+)
+
+# 代码关键字（不算作普通单词；if、for、in 等在句子中也很常见，仍按普通单词计）
+_CODE_WORDS = frozenset(
+    "import from include define def class return elif function var let const "
+    "public private static async await yield lambda none true false null this self void int".split()
+)
+
+# 连续的两个以上普通单词（由空格分隔的纯字母单词）是句子的特征
+_PLAIN_WORDS = re.compile(r"(?<![\w.(\[{\\'\"])[A-Za-z]{2,}(?:\s+[A-Za-z]{2,})+(?![\w(\[.])")
+
+
+def _has_prose(line: str) -> bool:
+    """行中是否有连续的两个以上普通单词（代码关键字不算）"""
+    for match in _PLAIN_WORDS.finditer(line):
+        run = 0
+        for word in match.group().split():
+            run = 0 if word.lower() in _CODE_WORDS else run + 1
+            if run >= 2:
+                return True
+    return False
+
+
+def _is_code_line(line: str) -> bool:
+    if not _CODE_LINE.match(line) or _has_prose(line):
+        return False
+    return sum(1 for signal in _CODE_SIGNALS if signal.search(line)) >= 2
+
+
+@dataclass
+class MaskedText:
+    """遮蔽后的文本：text 中的 {{i}} 对应 spans[i]"""
+    text: str
+    spans: List[str] = field(default_factory=list)
+    kinds: List[str] = field(default_factory=list)
+
+
+def _token(index: int) -> str:
+    return "{{" + str(index) + "}}"
+
+
+def looks_like_code(text: str) -> bool:
+    """
+    文本的每一个非空行都像代码（整段不翻译）；记号按普通标识符处理
+    每行需要有两种以上的代码特征，且不能含有连续的普通单词（误判会让整段文本不被翻译，宁可漏判）
+    """
+    text = _TOKEN.sub("x", text)
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return False
+    # 只有一行时要求包含代码特有的符号，避免把普通句子当作代码
+    if len(lines) == 1 and not re.search(r"[;{}=()]", lines[0]):
+        return False
+    return all(_is_code_line(line) for line in lines)
+
+
+def mask_spans(text: str) -> MaskedText:
+    """将不需要翻译的片段替换为记号"""
+    if len(text) > MAX_MASK_CHARS:
+        return MaskedText(text)
+    spans: List[str] = []
+    kinds: List[str] = []
+
+    def replace(match: "re.Match") -> str:
+        span = match.group()
+        trail = ""
+        if match.lastgroup == "url":
+            stripped = span.rstrip(_TRAILING_PUNCTUATION)
+            span, trail = stripped, span[len(stripped):]
+        spans.append(span)
+        kinds.append(match.lastgroup)
+        return _token(len(spans) - 1) + trail
+
+    masked = _SPAN.sub(replace, text)
+    return MaskedText(masked, spans, kinds)
+
+
+def has_translatable_text(masked: MaskedText) -> bool:
+    """去掉记号后是否还有文字"""
+    return any(ch.isalpha() for ch in _TOKEN.sub(" ", masked.text))
+
+
+def restore_spans(masked: MaskedText, translated: str) -> Optional[str]:
+    """将译文中的记号还原为原片段；记号缺失、重复或编号无效时返回 None"""
+    if not masked.spans:
+        return translated
+    found = [int(index) for index in _TOKEN.findall(translated)]
+    if sorted(found) != list(range(len(masked.spans))):
+        return None
+    return _TOKEN.sub(lambda match: masked.spans[int(match.group(1))], translated)
+
+
+class MaskingStats:
+    """遮蔽与还原的统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.masked_segments = 0
+        self.spans: Dict[str, int] = {}
+        self.masked_chars = 0  # 不再发送给翻译提供商的字符数
+        self.restore_failures = 0
+
+    def record_masked(self, masked: MaskedText):
+        with self._lock:
+            self.masked_segments += 1
+            for span, kind in zip(masked.spans, masked.kinds):
+                self.spans[kind] = self.spans.get(kind, 0) + 1
+                self.masked_chars += len(span)
+
+    def record_failure(self):
+        with self._lock:
+            self.restore_failures += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "masked_segments": self.masked_segments,
+                "spans": dict(self.spans),
+                "masked_chars": self.masked_chars,
+                "restore_failures": self.restore_failures,
+                "failure_rate": round(self.restore_failures / self.masked_segments, 4) if self.masked_segments else 0.0,
+            }
@@ -0,0 +1,253 @@
+"""
+推测解码
+草稿一次提出多个候选token，主模型一次求值并在每个位置按自己的采样结果校验，
+只接受与主模型采样结果一致的前缀，因此输出与单独使用主模型时相同（temperature 为 0 时逐字一致）
+草稿来源：
+- prompt_lookup：在提示词和已生成的文本中查找当前结尾的 n-gram，取其后续token作为候选（人名、数字等照抄原文的部分命中率很高）
+- draft_model：与主模型词表相同的小模型贪心生成候选
+"""
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODE_OFF = "off"
+MODE_PROMPT_LOOKUP = "prompt_lookup"
+MODE_DRAFT_MODEL = "draft_model"
+SPECULATIVE_MODES = (MODE_OFF, MODE_PROMPT_LOOKUP, MODE_DRAFT_MODEL)
+
+# 每次提出的候选token数（配置为 0 时使用）
+DEFAULT_DRAFT_TOKENS = {
+    MODE_PROMPT_LOOKUP: 10,
+    MODE_DRAFT_MODEL: 4,
+}
+
+# prompt_lookup 匹配的最长 n-gram（依次尝试更短的）
+PROMPT_LOOKUP_MAX_NGRAM = 3
+
+# 校验候选token需要保存每个位置的 logits（llama-cpp 的 logits_all），占用 n_ctx × 词表大小 × 4 字节；
+# 超过该值的实例（通常是大上下文实例）不使用推测解码
+MAX_LOGITS_MB = 1024
+
+_MB = 1024 * 1024
+
+
+def draft_model_supported() -> bool:
+    """已安装的 llama-cpp-python 是否支持 draft_model 参数"""
+    try:
+        from llama_cpp import Llama
+        return "draft_model" in inspect.signature(Llama.__init__).parameters
+    except (ImportError, TypeError, ValueError):
+        return False
+
+
+def logits_bytes(info: Optional[Dict[str, Any]], n_ctx: int) -> int:
+    """推测解码为每个位置保存 logits 所需的内存（词表大小未知时返回 0）"""
+    vocab_size = (info or {}).get("vocab_size") or 0
+    return n_ctx * vocab_size * 4
+
+
+def speculative_overhead(spec: Optional[Tuple], info: Optional[Dict[str, Any]], n_ctx: int) -> int:
+    """开启推测解码后单个实例额外占用的内存：logits 缓冲区，以及草稿模型的权重"""
+    if not spec:
+        return 0
+    overhead = logits_bytes(info, n_ctx)
+    if spec[0] == MODE_DRAFT_MODEL:
+        try:
+            overhead += os.path.getsize(spec[1])
+        except OSError:
+            pass
+    return overhead
+
+
+def speculative_spec(mode: str, num_tokens: int, info: Optional[Dict[str, Any]], n_ctx: int, draft_path: Optional[str] = None, draft_info: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Tuple], List[str]]:
+    """
+    校验推测解码配置，返回 (实例参数中的 speculative 描述, 警告列表)
+    描述是可比较的元组（作为模型实例的参数之一），推理线程创建实例时据此构建草稿
+    """
+    if mode == MODE_OFF or not mode:
+        return None, []
+    if mode not in SPECULATIVE_MODES:
+        return None, [f"未知的推测解码模式 {mode!r}，已关闭推测解码"]
+    if not draft_model_supported():
+        return None, ["已安装的 llama-cpp-python 不支持 draft_model，已关闭推测解码"]
+    needed = logits_bytes(info, n_ctx)
+    if needed > MAX_LOGITS_MB * _MB:
+        return None, [f"上下文长度 {n_ctx} 下推测解码需要约 {needed / _MB:.0f} MB 保存 logits（上限 {MAX_LOGITS_MB} MB），该实例不使用推测解码"]
+    num_tokens = num_tokens if num_tokens > 0 else DEFAULT_DRAFT_TOKENS[mode]
+    if mode == MODE_PROMPT_LOOKUP:
+        return (MODE_PROMPT_LOOKUP, num_tokens), []
+
+    if not draft_path or not os.path.exists(draft_path):
+        return None, [f"草稿模型不存在: {draft_path or '未配置'}，已关闭推测解码"]
+    if not draft_info or draft_info.get("error"):
+        return None, [f"无法读取草稿模型的文件头: {os.path.basename(draft_path)}，已关闭推测解码"]
+    for key in ("vocab_size", "tokenizer"):
+        if info and info.get(key) != draft_info.get(key):
+            return None, [f"草稿模型 {os.path.basename(draft_path)} 的词表与主模型不同（{key}: {draft_info.get(key)} / {info.get(key)}），已关闭推测解码"]
+    return (MODE_DRAFT_MODEL, draft_path, num_tokens), []
+
+
+def create_draft(spec: Tuple, params: Dict[str, Any]):
+    """按 speculative 描述创建草稿（在推理线程或后台加载线程中调用），params 为主模型实例的参数"""
+    if spec[0] == MODE_PROMPT_LOOKUP:
+        return PromptLookupDraft(spec[1])
+    if spec[0] == MODE_DRAFT_MODEL:
+        draft_params = {k: params[k] for k in ("n_ctx", "n_threads", "n_batch", "use_mmap") if k in params}
+        return ModelDraft(spec[1], spec[2], **draft_params)
+    raise ValueError(f"未知的推测解码模式: {spec[0]}")
+
+
+class _Draft:
+    """
+    草稿的公共部分：统计候选token的接受率
+    llama-cpp 每次校验后把接受的候选和新采样的token追加到 input_ids 再调用草稿，
+    因此下一次调用时对比 input_ids 的新增部分与上一次的候选即可得到接受的个数
+    """
+
+    mode = ""
+
+    def __init__(self, num_tokens: int):
+        self.num_tokens = num_tokens
+        self._proposal: Optional[Sequence[int]] = None
+        self._offset = 0
+        self._drafted = 0
+        self._accepted = 0
+
+    def __call__(self, input_ids, **kwargs):
+        self._settle(input_ids)
+        proposal = self.propose(input_ids)
+        self._proposal = [int(t) for t in proposal]
+        self._offset = len(input_ids)
+        return proposal
+
+    def propose(self, input_ids):
+        raise NotImplementedError
+
+    def _settle(self, input_ids):
+        proposal, self._proposal = self._proposal, None
+        if not proposal or len(input_ids) <= self._offset:
+            return
+        self._drafted += len(proposal)
+        for token, actual in zip(proposal, input_ids[self._offset:self._offset + len(proposal)]):
+            if token != int(actual):
+                break
+            self._accepted += 1
+
+    def begin(self):
+        """新的生成开始"""
+        self._proposal = None
+        self._drafted = 0
+        self._accepted = 0
+
+    def finish(self) -> Tuple[int, int]:
+        """生成结束，返回本次的 (候选token数, 接受数)；最后一次的候选未经完整校验，不计入"""
+        counts = (self._drafted, self._accepted)
+        self.begin()
+        return counts
+
+    def close(self):
+        pass
+
+
+class PromptLookupDraft(_Draft):
+    """在已有token中查找当前结尾的 n-gram，取第一次出现位置之后的token作为候选"""
+
+    mode = MODE_PROMPT_LOOKUP
+
+    def __init__(self, num_tokens: int, max_ngram: int = PROMPT_LOOKUP_MAX_NGRAM):
+        super().__init__(num_tokens)
+        self.max_ngram = max_ngram
+
+    def propose(self, input_ids):
+        import numpy as np
+
+        input_ids = np.asarray(input_ids, dtype=np.intc)
+        length = input_ids.shape[0]
+        for ngram in range(min(self.max_ngram, length - 1), 0, -1):
+            windows = np.lib.stride_tricks.sliding_window_view(input_ids[:-1], (ngram,))
+            matches = np.nonzero(np.all(windows == input_ids[-ngram:], axis=1))[0]
+            for index in matches:
+                start = index + ngram
+                end = min(start + self.num_tokens, length)
+                if start < end:
+                    return input_ids[start:end]
+        return np.array([], dtype=np.intc)
+
+
+class ModelDraft(_Draft):
+    """词表与主模型相同的小模型，贪心生成候选（复用自身KV缓存中的公共前缀）"""
+
+    mode = MODE_DRAFT_MODEL
+
+    def __init__(self, model_path: str, num_tokens: int, **params):
+        from llama_cpp import Llama
+
+        super().__init__(num_tokens)
+        self.model_path = model_path
+        self.llm = Llama(model_path=model_path, verbose=False, **params)
+        self._eos = self.llm.token_eos()
+        self._n_ctx = self.llm.n_ctx()
+
+    def propose(self, input_ids):
+        import numpy as np
+
+        tokens: List[int] = []
+        if len(input_ids) + self.num_tokens < self._n_ctx:
+            for token in self.llm.generate([int(t) for t in input_ids], temp=0.0, top_k=1, top_p=1.0, repeat_penalty=1.0):
+                if token == self._eos:
+                    break
+                tokens.append(token)
+                if len(tokens) >= self.num_tokens:
+                    break
+        return np.array(tokens, dtype=np.intc)
+
+    def close(self):
+        close = getattr(self.llm, "close", None)
+        if close is not None:
+            close()
+
+
+class _ModeStats:
+    def __init__(self):
+        self.requests = 0
+        self.tokens = 0
+        self.seconds = 0.0
+        self.drafted = 0
+        self.accepted = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "tokens_per_second": round(self.tokens / self.seconds, 2) if self.seconds > 0 else 0.0,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance_rate": round(self.accepted / self.drafted, 4) if self.drafted else 0.0,
+        }
+
+
+class SpeculativeStats:
+    """按推测解码模式统计生成速度和候选接受率（线程安全，在推理线程中记录）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes: Dict[str, _ModeStats] = {}
+
+    def record(self, mode: str, tokens: int, seconds: float, drafted: int = 0, accepted: int = 0):
+        with self._lock:
+            stats = self._modes.get(mode)
+            if stats is None:
+                stats = self._modes[mode] = _ModeStats()
+            stats.requests += 1
+            stats.tokens += tokens
+            stats.seconds += seconds
+            stats.drafted += drafted
+            stats.accepted += accepted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {mode: stats.to_dict() for mode, stats in self._modes.items()}
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from baidu_client import MAX_QUERY_BYTES, BaiduAPIError, _parse_response, make_sign, plan_queries, utf8_len
+
+LINES = [
+    "short",
+    "中文一行",
+    "x" * 3000,
+    "y" * 2999,
+    "z" * 10,
+    "这是一段较长的中文文本。" * 100,
+    "w" * 7000,
+    "tail",
+]
+
+
+def _query_bytes(lines, group):
+    return utf8_len("\n".join(lines[i] for i in group))
+
+
+def test_utf8_len_counts_bytes():
+    assert utf8_len("abc") == 3
+    assert utf8_len("中文") == 6
+    assert utf8_len("") == 0
+
+
+@pytest.mark.parametrize("max_bytes", [10, 100, 3000, MAX_QUERY_BYTES])
+def test_plan_queries_keeps_order_and_covers_every_line(max_bytes):
+    groups = plan_queries([utf8_len(line) for line in LINES], max_bytes)
+    assert [index for group in groups for index in group] == list(range(len(LINES)))
+
+
+@pytest.mark.parametrize("max_bytes", [10, 100, 3000, MAX_QUERY_BYTES])
+def test_plan_queries_respects_byte_limit(max_bytes):
+    for group in plan_queries([utf8_len(line) for line in LINES], max_bytes):
+        # 单行超过上限时单独成组
+        assert len(group) == 1 or _query_bytes(LINES, group) <= max_bytes
+
+
+def test_plan_queries_counts_newlines_between_lines():
+    # 3000 + 1 + 2999 = 6000 正好放得下，再多一个字节就要拆开
+    assert plan_queries([3000, 2999]) == [[0, 1]]
+    assert plan_queries([3000, 3000]) == [[0], [1]]
+
+
+def test_plan_queries_fills_groups_greedily():
+    assert plan_queries([4, 4, 4, 4], max_bytes=9) == [[0, 1], [2, 3]]
+    assert plan_queries([]) == []
+
+
+def test_make_sign():
+    # 百度文档中的示例
+    assert make_sign("2015063000000001", "apple", "1435660288", "12345678") == "f89f9594663708c1605f3d736d01d2d4"
+
+
+def test_parse_response_success():
+    body = {"from": "en", "to": "zh", "trans_result": [{"src": "hi", "dst": "你好"}]}
+    assert _parse_response(200, json.dumps(body)) == body
+
+
+@pytest.mark.parametrize("status, text, code, retryable", [
+    (200, json.dumps({"error_code": "54003", "error_msg": "Invalid Access Limit"}), "54003", True),
+    (200, json.dumps({"error_code": "52001", "error_msg": "TIMEOUT"}), "52001", True),
+    (200, json.dumps({"error_code": 54001, "error_msg": "Invalid Sign"}), "54001", False),
+    (503, "Service Unavailable", None, True),
+    (404, "Not Found", None, False),
+    (200, "", None, False),
+    (200, "<html>", None, False),
+    (200, json.dumps({"from": "en", "to": "zh"}), None, False),
+])
+def test_parse_response_errors(status, text, code, retryable):
+    error = _parse_response(status, text)
+    assert isinstance(error, BaiduAPIError)
+    assert error.code == code
+    assert error.retryable is retryable
@@ -0,0 +1,55 @@
+import pytest
+
+from language_detect import (
+    MAX_DETECT_CHARS, SKIP_NON_LINGUISTIC, SKIP_SAME_LANGUAGE, classify, detect_language, detect_languages, is_non_linguistic,
+)
+
+
+@pytest.mark.parametrize("text, language", [
+    ("这是一个简单的测试，我们来看看结果。", "zh"),
+    ("這是一個簡單的測試，我們來看看結果。", "zh-Hant"),
+    ("これは日本語のテストです。", "ja"),
+    ("이것은 한국어 테스트입니다.", "ko"),
+    ("Это простой тест для проверки языка.", "ru"),
+    ("Це простий тест, і ми перевіримо мову.", "uk"),
+    ("This is a simple test of the detector and it should work.", "en"),
+    ("Ceci est un test pour la détection de la langue et il est simple.", "fr"),
+    ("Das ist ein Test für die Erkennung der Sprache und er ist nicht schwer.", "de"),
+    ("هذا اختبار بسيط", "ar"),
+])
+def test_detect_language(text, language):
+    assert detect_language(text) == language
+
+
+@pytest.mark.parametrize("text", [
+    "東京大学",  # 只用汉字书写的日文
+    "山水",  # 繁简通用的汉字
+    "hello",  # 拉丁字母但没有虚词
+    "中文 and English mixed together evenly 中文混合",
+])
+def test_undetermined_text_returns_none(text):
+    assert detect_language(text) is None
+
+
+def test_shared_han_text_is_not_skipped_for_chinese_target():
+    assert classify("東京大学", "zh") == (None, None)
+
+
+@pytest.mark.parametrize("text", ["12,345.67", "https://example.com/a/b", "--- *** ---", "admin@example.org", "/usr/local/bin"])
+def test_non_linguistic(text):
+    assert is_non_linguistic(text)
+    assert classify(text, "zh") == (None, SKIP_NON_LINGUISTIC)
+
+
+def test_same_language_is_skipped():
+    assert classify("这是一个简单的测试，我们来看看结果。", "zh") == ("zh", SKIP_SAME_LANGUAGE)
+    assert classify("这是一个简单的测试，我们来看看结果。", "en") == ("zh", None)
+
+
+def test_long_text_is_never_skipped():
+    text = "这是一个简单的测试。" * (MAX_DETECT_CHARS // 5)
+    assert classify(text, "zh") == ("zh", None)
+
+
+def test_detect_languages_keeps_order():
+    assert detect_languages(["这是一个测试。", "12:30"], "en") == [("zh", None), (None, SKIP_NON_LINGUISTIC)]
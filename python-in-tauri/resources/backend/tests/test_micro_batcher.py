@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+class Runner:
+    """记录每一批的内容；以 ! 开头的文本返回该项自己的错误结果"""
+
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    async def __call__(self, key, items):
+        self.batches.append((key, list(items)))
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return [
+            {"success": False, "error": f"bad {item}"} if item.startswith("!") else {"success": True, "translated_text": item.upper()}
+            for item in items
+        ]
+
+
+def test_requests_within_window_are_merged():
+    async def main():
+        runner = Runner()
+        batcher = MicroBatcher(runner, window_ms=20, max_size=8)
+        results = await asyncio.gather(*(batcher.submit("en->zh", text) for text in ("a", "!b", "c")))
+        return runner, batcher, results
+
+    runner, batcher, results = asyncio.run(main())
+    assert runner.batches == [("en->zh", ["a", "!b", "c"])]
+    assert results == [
+        {"success": True, "translated_text": "A"},
+        {"success": False, "error": "bad !b"},
+        {"success": True, "translated_text": "C"},
+    ]
+    stats = batcher.stats()
+    assert (stats["batches"], stats["requests"], stats["batched_requests"], stats["max_batch_size"]) == (1, 3, 3, 3)
+
+
+def test_keys_are_batched_separately():
+    async def main():
+        runner = Runner()
+        batcher = MicroBatcher(runner, window_ms=20)
+        results = await asyncio.gather(batcher.submit("zh", "a"), batcher.submit("ja", "b"), batcher.submit("zh", "c"))
+        return runner, results
+
+    runner, results = asyncio.run(main())
+    assert sorted(runner.batches) == [("ja", ["b"]), ("zh", ["a", "c"])]
+    assert [result["translated_text"] for result in results] == ["A", "B", "C"]
+
+
+def test_full_batch_flushes_before_window():
+    async def main():
+        runner = Runner()
+        batcher = MicroBatcher(runner, window_ms=60000, max_size=2)
+        return runner, await asyncio.wait_for(asyncio.gather(batcher.submit("k", "a"), batcher.submit("k", "b")), 1)
+
+    runner, results = asyncio.run(main())
+    assert runner.batches == [("k", ["a", "b"])]
+
+
+def test_requests_after_window_start_a_new_batch():
+    async def main():
+        runner = Runner()
+        batcher = MicroBatcher(runner, window_ms=5)
+        first = await batcher.submit("k", "a")
+        second = await batcher.submit("k", "b")
+        return runner, first, second
+
+    runner, first, second = asyncio.run(main())
+    assert runner.batches == [("k", ["a"]), ("k", ["b"])]
+    assert (first["translated_text"], second["translated_text"]) == ("A", "B")
+
+
+def test_batch_error_reaches_every_caller():
+    async def main():
+        batcher = MicroBatcher(Runner(error=RuntimeError("boom")), window_ms=5)
+        return await asyncio.gather(*(batcher.submit("k", text) for text in "abc"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelled_request_is_not_run():
+    async def main():
+        runner = Runner()
+        batcher = MicroBatcher(runner, window_ms=20)
+        kept = asyncio.ensure_future(batcher.submit("k", "a"))
+        dropped = asyncio.ensure_future(batcher.submit("k", "b"))
+        await asyncio.sleep(0)
+        dropped.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await dropped
+        return runner, await kept
+
+    runner, result = asyncio.run(main())
+    assert runner.batches == [("k", ["a"])]
+    assert result["translated_text"] == "A"
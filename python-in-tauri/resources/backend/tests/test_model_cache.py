@@ -0,0 +1,92 @@
+import pytest
+
+from model_cache import ResidentModelCache
+
+MB = 1024 * 1024
+
+
+class FakeWorker:
+    def __init__(self, name="worker", busy=()):
+        self.name = name
+        self.busy = set(busy)
+
+    def is_using(self, key):
+        return key in self.busy
+
+
+def _model(tmp_path, name, size_mb):
+    """稀疏文件：只占用文件大小，不占用磁盘空间"""
+    path = tmp_path / name
+    with open(path, "wb") as f:
+        f.truncate(int(size_mb * MB))
+    return str(path)
+
+
+def _load(cache, worker, key, path, n_ctx, **params):
+    params = {"n_ctx": n_ctx, **params}
+    victims = cache.reserve(worker, key, path, params)
+    cache.add(worker, key, path, params)
+    return [victim.key for victim in victims]
+
+
+def test_instances_of_an_oversized_model_do_not_evict_each_other(tmp_path):
+    big = _model(tmp_path, "7b-q4_k_m.gguf", 4700)
+    cache = ResidentModelCache(max_mb=4096)
+    worker = FakeWorker()
+    assert _load(cache, worker, "short", big, 1024) == []
+    assert _load(cache, worker, "long", big, 4096) == []
+    assert _load(cache, worker, "short", big, 1024) == []
+    assert cache.stats()["resident"] == 2
+    assert cache.evictions == 0
+
+
+def test_other_models_are_evicted_least_recently_used_first(tmp_path):
+    a = _model(tmp_path, "a.gguf", 1500)
+    b = _model(tmp_path, "b.gguf", 1500)
+    c = _model(tmp_path, "c.gguf", 1500)
+    cache = ResidentModelCache(max_mb=4096)
+    worker = FakeWorker()
+    _load(cache, worker, "a", a, 512)
+    _load(cache, worker, "b", b, 512)
+    cache.touch(worker, "a")
+    assert _load(cache, worker, "c", c, 512) == ["b"]
+
+
+def test_busy_and_protected_instances_are_kept(tmp_path):
+    a = _model(tmp_path, "a.gguf", 3000)
+    b = _model(tmp_path, "b.gguf", 3000)
+    c = _model(tmp_path, "c.gguf", 3000)
+    cache = ResidentModelCache(max_mb=4096)
+    busy = FakeWorker("busy", busy={"a"})
+    worker = FakeWorker()
+    _load(cache, busy, "a", a, 512)
+    _load(cache, worker, "b", b, 512)
+    assert cache.reserve(worker, "c", c, {"n_ctx": 512}, protect=lambda entry: entry.key == "b") == []
+
+
+def test_same_file_without_mmap_can_be_evicted(tmp_path):
+    big = _model(tmp_path, "big.gguf", 3000)
+    cache = ResidentModelCache(max_mb=4096)
+    worker = FakeWorker()
+    _load(cache, worker, "short", big, 1024, use_mmap=False)
+    # 关闭 mmap 时每个实例各有一份权重，淘汰能释放内存
+    assert _load(cache, worker, "long", big, 4096, use_mmap=False) == ["short"]
+
+
+def test_mmap_weights_are_counted_once(tmp_path):
+    path = _model(tmp_path, "m.gguf", 1000)
+    cache = ResidentModelCache(max_mb=4096)
+    _load(cache, FakeWorker("w1"), "k", path, 512)
+    _load(cache, FakeWorker("w2"), "k", path, 512)
+    single = cache.model_bytes(path)
+    assert single < 2 * 1000 * MB
+    assert single >= 1000 * MB
+
+
+@pytest.mark.parametrize("max_mb", [1024, 4096])
+def test_warns_when_one_model_exceeds_budget(tmp_path, caplog, max_mb):
+    big = _model(tmp_path, "big.gguf", 4700)
+    cache = ResidentModelCache(max_mb=max_mb)
+    with caplog.at_level("WARNING", logger="model_cache"):
+        _load(cache, FakeWorker(), "k", big, 1024)
+    assert "超出常驻模型内存预算" in caplog.text
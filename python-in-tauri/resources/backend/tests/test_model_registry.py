@@ -0,0 +1,151 @@
+import struct
+
+import pytest
+
+import model_registry
+from model_registry import GGUFError, ModelRegistry, estimate_kv_bytes, format_parameter_count, read_gguf_metadata
+
+# 元数据值类型
+UINT32, FLOAT32, BOOL, STRING, ARRAY, UINT64 = 4, 6, 7, 8, 9, 10
+
+
+def _string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def _value(value_type: int, value) -> bytes:
+    if value_type == STRING:
+        return _string(value)
+    if value_type == ARRAY:
+        item_type, items = value
+        return struct.pack("<IQ", item_type, len(items)) + b"".join(_value(item_type, item) for item in items)
+    return struct.pack({UINT32: "<I", FLOAT32: "<f", BOOL: "<?", UINT64: "<Q"}[value_type], value)
+
+
+def build_gguf(metadata, tensors, version: int = 3) -> bytes:
+    """构造 GGUF 文件头：metadata 为 (键, 类型, 值)，tensors 为 (名称, 各维大小, 张量类型)"""
+    data = b"GGUF" + struct.pack("<IQQ", version, len(tensors), len(metadata))
+    for key, value_type, value in metadata:
+        data += _string(key) + struct.pack("<I", value_type) + _value(value_type, value)
+    offset = 0
+    for name, dims, tensor_type in tensors:
+        data += _string(name) + struct.pack("<I", len(dims)) + b"".join(struct.pack("<Q", d) for d in dims)
+        data += struct.pack("<IQ", tensor_type, offset)
+        offset += 1024
+    return data
+
+
+METADATA = [
+    ("general.architecture", STRING, "qwen2"),
+    ("general.name", STRING, "Tiny Qwen"),
+    ("general.file_type", UINT32, 15),
+    ("qwen2.context_length", UINT32, 32768),
+    ("qwen2.embedding_length", UINT32, 896),
+    ("qwen2.block_count", UINT32, 24),
+    ("qwen2.attention.head_count", UINT32, 14),
+    ("qwen2.attention.head_count_kv", UINT32, 2),
+    ("qwen2.rope.freq_base", FLOAT32, 1000000.0),
+    ("tokenizer.ggml.model", STRING, "gpt2"),
+    ("tokenizer.ggml.tokens", ARRAY, (STRING, ["a", "b", "中", "<|im_end|>"])),
+    ("tokenizer.ggml.scores", ARRAY, (FLOAT32, [0.0, 0.5, 1.0, 1.5])),
+    ("tokenizer.ggml.add_bos_token", BOOL, False),
+    ("tokenizer.chat_template", STRING, "{% for m in messages %}{{ m.content }}{% endfor %}"),
+]
+
+TENSORS = [
+    ("token_embd.weight", [896, 4], 12),
+    ("blk.0.attn_q.weight", [896, 896], 12),
+    ("output_norm.weight", [896], 0),
+]
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_read_metadata(tmp_path):
+    info = read_gguf_metadata(_write(tmp_path, "model.gguf", build_gguf(METADATA, TENSORS)))
+    assert info["gguf_version"] == 3
+    assert info["architecture"] == "qwen2"
+    assert info["model_name"] == "Tiny Qwen"
+    assert info["quantization"] == "Q4_K_M"
+    assert info["tokenizer"] == "gpt2"
+    assert info["vocab_size"] == 4
+    assert info["chat_template"].startswith("{% for m in messages %}")
+    assert info["tensor_count"] == 3
+    assert info["parameter_count"] == 896 * 4 + 896 * 896 + 896
+    assert info["context_length"] == 32768
+    assert info["head_count_kv"] == 2
+    assert info["key_length"] is None
+
+
+def test_quantization_falls_back_to_tensor_types(tmp_path):
+    metadata = [entry for entry in METADATA if entry[0] != "general.file_type"]
+    info = read_gguf_metadata(_write(tmp_path, "model.gguf", build_gguf(metadata, TENSORS)))
+    # 参数量最多的张量类型（12 = Q4_K）
+    assert info["quantization"] == "Q4_K"
+
+
+def test_read_version_2_header(tmp_path):
+    metadata = [("general.architecture", STRING, "llama"), ("llama.context_length", UINT32, 2048)]
+    info = read_gguf_metadata(_write(tmp_path, "v2.gguf", build_gguf(metadata, [("w", [8, 8], 1)], version=2)))
+    assert info["gguf_version"] == 2
+    assert info["context_length"] == 2048
+    assert info["parameter_count"] == 64
+    assert info["quantization"] == "F16"
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"GGML" + b"\0" * 20,
+    build_gguf(METADATA, TENSORS)[:100],
+])
+def test_invalid_files(tmp_path, data):
+    with pytest.raises(GGUFError):
+        read_gguf_metadata(_write(tmp_path, "bad.gguf", data))
+
+
+def test_estimate_kv_bytes():
+    info = {"block_count": 24, "head_count": 14, "head_count_kv": 2, "embedding_length": 896}
+    # 每层 K、V 各 n_ctx × 2 × 64 个 f16 元素
+    assert estimate_kv_bytes(info, 1024) == 1024 * 24 * 2 * (64 * 2 + 64 * 2)
+    assert estimate_kv_bytes(info, 1024, key_bytes=1.0) == 1024 * 24 * 2 * (64 + 64)
+    assert estimate_kv_bytes({}, 1024) == 0
+    assert estimate_kv_bytes(None, 1024) == 0
+
+
+def test_format_parameter_count():
+    assert format_parameter_count(1_840_000_000) == "1.8B"
+    assert format_parameter_count(494_000_000) == "494M"
+    assert format_parameter_count(1000) == "1000"
+
+
+def test_registry_caches_until_file_changes(tmp_path, monkeypatch):
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+    _write(model_dir, "a.gguf", build_gguf(METADATA, TENSORS))
+    _write(model_dir, "broken.gguf", b"not a model")
+    _write(model_dir, "notes.txt", b"ignored")
+
+    registry = ModelRegistry(str(tmp_path / "cache" / "registry.json"))
+    models = registry.scan(str(model_dir))
+    assert [m["name"] for m in models] == ["a.gguf", "broken.gguf"]
+    assert models[0]["quantization"] == "Q4_K_M"
+    assert models[0]["has_chat_template"]
+    assert "chat_template" not in models[0]
+    assert models[1]["error"]
+
+    # 新的注册表实例从缓存文件读取，未变化的文件不再解析
+    calls = []
+    original = model_registry.read_gguf_metadata
+    monkeypatch.setattr(model_registry, "read_gguf_metadata", lambda path: calls.append(path) or original(path))
+    registry = ModelRegistry(str(tmp_path / "cache" / "registry.json"))
+    assert registry.scan(str(model_dir))[0]["parameters"] == models[0]["parameters"]
+    assert calls == []
+
+    _write(model_dir, "a.gguf", build_gguf(METADATA[:1], TENSORS))
+    registry.get(str(model_dir / "a.gguf"))
+    assert len(calls) == 1
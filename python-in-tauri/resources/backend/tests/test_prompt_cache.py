@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from prompt_cache import CACHE_DIR_NAME, PromptPrefixCache
+
+PREFIX = "将以下文本翻译为中文：\n\n"
+
+
+class FakeLlama:
+    """按字符分词的模型：记录已求值的token，状态为已求值token的副本"""
+
+    def __init__(self):
+        self.input_ids = []
+        self.n_tokens = 0
+        self.evals = 0
+        self.loads = 0
+
+    def tokenize(self, data: bytes, add_bos: bool = True, special: bool = False):
+        return ([1] if add_bos else []) + [ord(ch) for ch in data.decode("utf-8")]
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids[:self.n_tokens] + list(tokens)
+        self.n_tokens = len(self.input_ids)
+        self.evals += 1
+
+    def save_state(self):
+        return list(self.input_ids[:self.n_tokens])
+
+    def load_state(self, state):
+        self.input_ids = list(state)
+        self.n_tokens = len(state)
+        self.loads += 1
+
+    def generate(self, text: str):
+        """模拟一次翻译：在前缀之后求值原文和译文"""
+        self.eval([ord(ch) for ch in text])
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / "model.gguf"
+    path.write_bytes(b"GGUF")
+    return str(path)
+
+
+PARAMS = {"n_ctx": 2048, "n_threads": 4}
+
+
+def test_miss_then_hit(model_path):
+    cache = PromptPrefixCache()
+    llm = FakeLlama()
+    tokens = cache.prepare(llm, model_path, PARAMS, PREFIX)
+    assert tokens == llm.tokenize(PREFIX.encode("utf-8"))
+    assert llm.input_ids == tokens
+    llm.generate("hello world -> 你好世界")
+
+    # 已求值的token以前缀开头：直接复用，不恢复状态也不重新求值
+    evals = llm.evals
+    assert cache.prepare(llm, model_path, PARAMS, PREFIX) == tokens
+    assert (llm.evals, llm.loads) == (evals, 0)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_hit_restores_state_after_other_prompt(model_path):
+    cache = PromptPrefixCache()
+    llm = FakeLlama()
+    tokens = cache.prepare(llm, model_path, PARAMS, PREFIX)
+    llm.reset()
+    llm.eval([1, 2, 3])
+    cache.prepare(llm, model_path, PARAMS, PREFIX)
+    assert llm.loads == 1
+    assert llm.input_ids == tokens
+
+
+def test_saved_state_contains_only_the_prefix(model_path):
+    cache = PromptPrefixCache()
+    llm = FakeLlama()
+    tokens = llm.tokenize(PREFIX.encode("utf-8"))
+    # 上一次请求已求值了同一前缀和很长的原文、译文
+    llm.eval(tokens)
+    llm.generate("previous request " * 50)
+    cache.prepare(llm, model_path, PARAMS, PREFIX, persist=True)
+    (_, state), = cache._states.values()
+    assert state == tokens
+
+    # 磁盘上的状态同样只有前缀
+    disk = PromptPrefixCache()
+    other = FakeLlama()
+    assert disk.prepare(other, model_path, PARAMS, PREFIX, persist=True) == tokens
+    assert other.input_ids == tokens
+
+
+def test_disk_restore(model_path):
+    first = PromptPrefixCache()
+    first.prepare(FakeLlama(), model_path, PARAMS, PREFIX, persist=True)
+    assert first.stats()["disk_writes"] == 1
+    assert os.listdir(os.path.join(os.path.dirname(model_path), CACHE_DIR_NAME))
+
+    # 新的实例（如重启后）从磁盘恢复，不需要求值
+    cache = PromptPrefixCache()
+    llm = FakeLlama()
+    cache.prepare(llm, model_path, PARAMS, PREFIX, persist=True)
+    assert (llm.evals, llm.loads) == (0, 1)
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["misses"], stats["hit_rate"]) == (1, 0, 1.0)
+
+
+def test_key_ignores_thread_count_but_not_context(model_path):
+    cache = PromptPrefixCache()
+    llm = FakeLlama()
+    cache.prepare(llm, model_path, PARAMS, PREFIX)
+    cache.prepare(llm, model_path, {**PARAMS, "n_threads": 8}, PREFIX)
+    cache.prepare(llm, model_path, {**PARAMS, "n_ctx": 1024}, PREFIX)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entries_are_bounded(model_path):
+    cache = PromptPrefixCache(max_entries=2)
+    llm = FakeLlama()
+    for language in ("中文", "English", "日本語"):
+        cache.prepare(llm, model_path, PARAMS, f"翻译为{language}：")
+    assert cache.stats()["entries"] == 2
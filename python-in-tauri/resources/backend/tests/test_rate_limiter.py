@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import MIN_RATE_SHARE, RECOVERY_SHARE, THROTTLE_INTERVAL, TokenBucket
+
+
+class FakeClock:
+    """替换令牌桶使用的时钟和 asyncio.sleep：等待时直接推进时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(rate_limiter, "asyncio", SimpleNamespace(sleep=clock.sleep, CancelledError=asyncio.CancelledError))
+    return clock
+
+
+def _acquire(bucket, count):
+    async def run():
+        for _ in range(count):
+            await bucket.acquire()
+
+    asyncio.run(run())
+
+
+def test_requests_are_spaced_by_rate(clock):
+    bucket = TokenBucket(rate=4)
+    started = clock.now
+    _acquire(bucket, 9)
+    # 第一个令牌立即发放，之后每 1/rate 秒一个
+    assert clock.now - started == pytest.approx(2.0)
+    assert clock.sleeps == pytest.approx([0.25] * 8)
+
+
+def test_idle_does_not_allow_bursts(clock):
+    bucket = TokenBucket(rate=2)
+    _acquire(bucket, 1)
+    clock.now += 60
+    clock.sleeps.clear()
+    _acquire(bucket, 3)
+    # 容量为一个令牌：空闲后只有第一个请求不用等待
+    assert clock.sleeps == pytest.approx([0.5, 0.5])
+
+
+def test_throttle_halves_rate_once_per_interval(clock):
+    bucket = TokenBucket(rate=8)
+    bucket.throttle()
+    bucket.throttle()
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(4)
+    assert bucket.throttled == 3
+    clock.now += THROTTLE_INTERVAL
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(2)
+
+
+def test_throttle_drains_tokens(clock):
+    bucket = TokenBucket(rate=2)
+    clock.now += 10
+    bucket.throttle()
+    _acquire(bucket, 1)
+    # 限流后的第一个请求也要按降低后的速率等待
+    assert clock.sleeps == pytest.approx([1.0])
+
+
+def test_throttle_has_a_floor(clock):
+    bucket = TokenBucket(rate=10)
+    for _ in range(20):
+        bucket.throttle()
+        clock.now += THROTTLE_INTERVAL
+    assert bucket.rate == pytest.approx(10 * MIN_RATE_SHARE)
+
+
+def test_recover_restores_configured_rate(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(5)
+    bucket.recover()
+    assert bucket.rate == pytest.approx(5 + 10 * RECOVERY_SHARE)
+    for _ in range(100):
+        bucket.recover()
+    assert bucket.rate == pytest.approx(10)
+
+
+def test_configure_resets_rate(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.throttle()
+    bucket.configure(10)
+    assert bucket.rate == pytest.approx(5)
+    bucket.configure(20)
+    assert bucket.rate == pytest.approx(20)
+    assert bucket.configured_rate == pytest.approx(20)
+
+
+def test_stats(clock):
+    bucket = TokenBucket(rate=5)
+    _acquire(bucket, 6)
+    stats = bucket.stats()
+    assert stats["qps"] == 5
+    assert stats["requests"] == 6
+    assert stats["throttled"] == 0
+    assert stats["effective_qps"] == pytest.approx(6 / 1.0)
+    assert stats["avg_wait_ms"] == pytest.approx(5 * 200 / 6, abs=0.01)
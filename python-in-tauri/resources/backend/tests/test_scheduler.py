@@ -0,0 +1,196 @@
+import asyncio
+import threading
+
+import pytest
+
+from inference_worker import InferencePool
+from scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_STREAMING,
+    RequestScheduler,
+    current_priority,
+    normalize_priority,
+)
+
+
+def _drain(scheduler):
+    jobs = []
+    while True:
+        job = scheduler.get(timeout=0)
+        if job is None:
+            return jobs
+        jobs.append(job)
+
+
+def test_interactive_before_streaming_before_batch():
+    scheduler = RequestScheduler()
+    scheduler.put("batch", PRIORITY_BATCH)
+    scheduler.put("streaming", PRIORITY_STREAMING)
+    scheduler.put("interactive", PRIORITY_INTERACTIVE)
+    assert _drain(scheduler) == ["interactive", "streaming", "batch"]
+
+
+def test_same_priority_is_fifo():
+    scheduler = RequestScheduler()
+    for i in range(5):
+        scheduler.put(f"batch-{i}", PRIORITY_BATCH)
+    scheduler.put("interactive", PRIORITY_INTERACTIVE)
+    for i in range(5, 8):
+        scheduler.put(f"batch-{i}", PRIORITY_BATCH)
+    assert _drain(scheduler) == ["interactive"] + [f"batch-{i}" for i in range(8)]
+
+
+def test_put_uses_current_priority():
+    scheduler = RequestScheduler()
+    scheduler.put("default")
+    token = current_priority.set(PRIORITY_BATCH)
+    try:
+        scheduler.put("batch")
+    finally:
+        current_priority.reset(token)
+    scheduler.put("streaming", PRIORITY_STREAMING)
+    assert _drain(scheduler) == ["default", "streaming", "batch"]
+
+
+def test_unknown_priority_is_interactive():
+    assert normalize_priority("urgent") == PRIORITY_INTERACTIVE
+    assert normalize_priority(None) == PRIORITY_INTERACTIVE
+    assert normalize_priority(PRIORITY_BATCH) == PRIORITY_BATCH
+
+
+def test_get_times_out_and_stats():
+    scheduler = RequestScheduler()
+    assert scheduler.get(timeout=0.01) is None
+    scheduler.put("a", PRIORITY_BATCH)
+    scheduler.put("b", PRIORITY_BATCH)
+    assert scheduler.stats()["classes"][PRIORITY_BATCH]["queue_depth"] == 2
+    scheduler.get(timeout=0)
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 1
+    assert stats["classes"][PRIORITY_BATCH]["started"] == 1
+
+
+def test_worker_takes_jobs_by_priority_and_skips_cancelled():
+    async def main():
+        pool = InferencePool(size=1)
+        started, gate = threading.Event(), threading.Event()
+        order = []
+
+        def block(worker):
+            started.set()
+            gate.wait(5)
+
+        def submit(name, priority):
+            # 任务创建时复制当前上下文，提交时读取其中的优先级
+            token = current_priority.set(priority)
+            try:
+                return asyncio.ensure_future(pool.submit(lambda worker: order.append(name)))
+            finally:
+                current_priority.reset(token)
+
+        try:
+            blocker = asyncio.ensure_future(pool.submit(block))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            tasks = {
+                "batch-1": submit("batch-1", PRIORITY_BATCH),
+                "batch-2": submit("batch-2", PRIORITY_BATCH),
+                "streaming": submit("streaming", PRIORITY_STREAMING),
+                "interactive-1": submit("interactive-1", PRIORITY_INTERACTIVE),
+                "interactive-2": submit("interactive-2", PRIORITY_INTERACTIVE),
+            }
+            while pool.scheduler.stats()["queue_depth"] < len(tasks):
+                await asyncio.sleep(0.01)
+            tasks["interactive-2"].cancel()
+            await asyncio.sleep(0)
+            gate.set()
+            await blocker
+            await asyncio.gather(*(task for name, task in tasks.items() if name != "interactive-2"))
+            with pytest.raises(asyncio.CancelledError):
+                await tasks["interactive-2"]
+        finally:
+            gate.set()
+            pool.stop(timeout=5)
+        return order
+
+    assert asyncio.run(main()) == ["interactive-1", "streaming", "batch-1", "batch-2"]
+
+
+def test_targeted_jobs_are_only_taken_by_their_worker():
+    scheduler = RequestScheduler()
+    scheduler.put("shared-batch", PRIORITY_BATCH)
+    scheduler.put("w1-interactive", PRIORITY_INTERACTIVE, target="w1")
+    scheduler.put("w2-batch", PRIORITY_BATCH, target="w2")
+    assert scheduler.get(timeout=0, target="w2") == "shared-batch"
+    assert scheduler.get(timeout=0, target="w2") == "w2-batch"
+    assert scheduler.get(timeout=0, target="w2") is None
+    assert scheduler.get(timeout=0) is None
+    assert scheduler.get(timeout=0, target="w1") == "w1-interactive"
+
+
+def test_remove_target_returns_pending_jobs():
+    scheduler = RequestScheduler()
+    scheduler.put("a", PRIORITY_BATCH, target="w1")
+    scheduler.put("b", PRIORITY_INTERACTIVE, target="w1")
+    assert scheduler.remove_target("w1") == ["b", "a"]
+    assert scheduler.stats()["queue_depth"] == 0
+    assert scheduler.get(timeout=0, target="w1") is None
+
+
+def test_submit_to_runs_on_each_worker():
+    async def main():
+        pool = InferencePool(size=2)
+        started, gate = threading.Event(), threading.Event()
+
+        def block(worker):
+            started.set()
+            gate.wait(5)
+            return worker.name
+
+        try:
+            # 一个线程被占用时，指定给它的任务不会被另一个空闲线程取走
+            busy = asyncio.ensure_future(pool.submit(block))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            targeted = [asyncio.ensure_future(pool.submit_to(worker, lambda worker: worker.name)) for worker in pool.workers]
+            done, _ = await asyncio.wait(targeted, timeout=0.3)
+            free = [task.result() for task in done]
+            gate.set()
+            names = await asyncio.gather(*targeted)
+            return [worker.name for worker in pool.workers], await busy, free, names
+        finally:
+            gate.set()
+            pool.stop(timeout=5)
+
+    workers, busy, free, names = asyncio.run(main())
+    assert names == workers
+    assert free == [name for name in workers if name != busy]
+
+
+def test_targeted_jobs_are_cancelled_when_the_worker_retires():
+    async def main():
+        pool = InferencePool(size=1)
+        started, gate = threading.Event(), threading.Event()
+
+        def block(worker):
+            started.set()
+            gate.wait(5)
+
+        try:
+            worker = pool.workers[0]
+            busy = asyncio.ensure_future(pool.submit_to(worker, block))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            pending = asyncio.ensure_future(pool.submit_to(worker, lambda worker: "never"))
+            await asyncio.sleep(0.01)
+            worker.retire()
+            gate.set()
+            await busy
+            with pytest.raises(asyncio.CancelledError):
+                await asyncio.wait_for(pending, 5)
+        finally:
+            gate.set()
+            pool.stop(timeout=5)
+
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import pytest
+
+from segment_packer import MARKER_TOKENS, pack_segments, packable, plan_packs, unpack_segments
+from segmenter import count_units, iter_chunks, iter_segments
+
+TEXTS = [
+    "",
+    "   \n\n  ",
+    "single line",
+    "  leading and trailing  \n",
+    "first line\n\n\n    indented second\n\tthird\n",
+    "这是第一句。这是第二句！这是第三句？\nSecond line. With two sentences! And a third? Yes",
+    "word " * 200,
+    "x" * 500,
+    "aaaa\n\n\n\n\nbbbb\n\n\n\n\ncccc",
+]
+
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+
+def _join(segments):
+    return "".join(segment.lead + segment.body + segment.trail for segment in segments)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("max_units", [None, 5, 20, 64])
+def test_segments_are_lossless(text, max_units):
+    assert _join(iter_segments(text, max_units)) == text
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("max_units", [5, 20, 64])
+def test_segments_respect_limit(text, max_units):
+    for segment in iter_segments(text, max_units):
+        assert len(segment.body) <= max_units
+        assert "\n" not in segment.body
+
+
+@pytest.mark.parametrize("text", TEXTS)
+@pytest.mark.parametrize("max_units", [5, 14, 20, 64])
+def test_chunks_are_lossless_and_within_limit(text, max_units):
+    chunks = list(iter_chunks(text, max_units))
+    assert _join(chunks) == text
+    for chunk in chunks:
+        assert len(chunk.body) <= max_units
+
+
+def test_chunk_limit_counts_blank_lines_between_segments():
+    chunks = list(iter_chunks("aaaa\n\n\n\n\nbbbb\n\n\n\n\ncccc", 14))
+    assert [chunk.body for chunk in chunks] == ["aaaa\n\n\n\n\nbbbb", "cccc"]
+
+
+def test_chunks_with_custom_measure():
+    text = "one two three four.\nfive six seven.\neight nine ten eleven twelve."
+    for chunk in iter_chunks(text, 8, _words):
+        assert _words(chunk.body) <= 8
+
+
+def test_render_replaces_only_body():
+    segments = list(iter_segments("  hello\n\n  world  "))
+    assert "".join(segment.render(segment.body.upper()) for segment in segments) == "  HELLO\n\n  WORLD  "
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_count_units_matches_merged_chunk(text):
+    chunks = list(iter_chunks(text, 10 ** 6))
+    expected = len(chunks[0].body) if chunks else 0
+    assert count_units(text) == expected
+
+
+# ---- 短文本打包：按编号拼接和拆回 ----
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_packed_segments_reassemble_losslessly(text):
+    segments = [segment for segment in iter_segments(text, 64) if segment.body.strip()]
+    if len(segments) < 2:
+        return
+    pieces = unpack_segments(pack_segments([segment.body for segment in segments]), len(segments))
+    assert pieces == [segment.body.strip() for segment in segments]
+
+
+SEGMENTS = [
+    ["Hello", "World"],
+    ["  padded  ", "第二段", "third\nwith a line break"],
+    ["x"] * 16,
+]
+
+
+@pytest.mark.parametrize("texts", SEGMENTS)
+def test_pack_unpack_round_trip(texts):
+    assert unpack_segments(pack_segments(texts), len(texts)) == [text.strip() for text in texts]
+
+
+def test_unpack_tolerates_whitespace_around_markers():
+    assert unpack_segments("\n 【1】 你好\n\n【2】世界\n", 2) == ["你好", "世界"]
+
+
+@pytest.mark.parametrize("output", [
+    "【1】你好",  # 缺少一段
+    "【2】世界\n【1】你好",  # 顺序被打乱
+    "【1】你好\n【2】",  # 某段为空
+    "说明：\n【1】你好\n【2】世界",  # 编号前有其他内容
+    "【1】你好\n【2】世界\n【3】多余",  # 多出一段
+    "你好世界",  # 没有编号
+])
+def test_unpack_rejects_mismatched_output(output):
+    assert unpack_segments(output, 2) is None
+
+
+def test_packable():
+    assert packable("plain text")
+    assert not packable("")
+    assert not packable("  \n ")
+    assert not packable("【1】looks like a marker")
+    assert not packable("line\n  【3】 marker on a later line")
+    assert packable("inline 【1】 is not at line start")
+
+
+def test_plan_packs_respects_token_limit():
+    sizes = [10, 20, 30, 40, 50]
+    max_tokens = 80
+    packs = plan_packs(sizes, max_tokens=max_tokens, max_segments=16)
+    for pack in packs:
+        assert sum(sizes[i] + MARKER_TOKENS for i in pack) <= max_tokens
+    assert packs == [[0, 1, 2]]
+
+
+def test_plan_packs_respects_segment_limit():
+    packs = plan_packs([1] * 10, max_tokens=1000, max_segments=4)
+    assert packs == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_plan_packs_keeps_order_and_skips_unpackable():
+    sizes = [5, None, 5, None, 5]
+    packs = plan_packs(sizes, max_tokens=1000, max_segments=16)
+    assert packs == [[0, 2, 4]]
+    indices = [index for pack in packs for index in pack]
+    assert indices == sorted(indices)
+
+
+def test_plan_packs_drops_single_segment_groups():
+    assert plan_packs([5]) == []
+    assert plan_packs([None, None]) == []
+    assert plan_packs([60, 60], max_tokens=70) == []
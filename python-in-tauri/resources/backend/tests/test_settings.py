@@ -0,0 +1,49 @@
+from dataclasses import fields
+
+import pytest
+
+from settings import Settings
+
+
+def test_float_fields_keep_fractions():
+    settings = Settings.from_dict({"micro_batch_window_ms": "7.5", "memory_limit_mb": 1536.7, "resident_models_max_mb": "2048.5"})
+    assert settings.micro_batch_window_ms == 7.5
+    assert settings.memory_limit_mb == 1536.7
+    assert settings.resident_models_max_mb == 2048.5
+
+
+def test_defaults_match_declared_types():
+    settings = Settings()
+    for f in fields(Settings):
+        if f.type in (bool, int, float, str):
+            assert type(getattr(settings, f.name)) is f.type, f.name
+
+
+@pytest.mark.parametrize("key, value, expected", [
+    ("context_length", "2048", 2048),
+    ("translation_memory_max_mb", 128, 128.0),
+    ("use_mmap", "false", False),
+    ("micro_batching", "on", True),
+    ("model_dir", 123, "123"),
+])
+def test_values_are_coerced(key, value, expected):
+    value = getattr(Settings.from_dict({key: value}), key)
+    assert value == expected
+    assert type(value) is type(expected)
+
+
+@pytest.mark.parametrize("key, value", [
+    ("micro_batch_window_ms", "fast"),
+    ("context_length", "7.5"),
+    ("memory_limit_mb", [1]),
+])
+def test_invalid_values_fall_back_to_default(key, value):
+    assert getattr(Settings.from_dict({key: value}), key) == getattr(Settings(), key)
+
+
+def test_unknown_keys_round_trip_through_extra():
+    settings = Settings.from_dict({"custom_option": {"a": 1}, "context_length": 1024})
+    assert settings.extra == {"custom_option": {"a": 1}}
+    data = settings.to_dict()
+    assert data["custom_option"] == {"a": 1}
+    assert Settings.from_dict(data) == settings
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+import memory_budget
+from model_registry import ModelRegistry
+from translator import Translator
+
+MB = 1024 * 1024
+
+
+class FakeWorker:
+    name = "worker"
+
+    def is_using(self, key):
+        return False
+
+
+@pytest.fixture
+def make_translator(tmp_path, monkeypatch):
+    # 加载计划只按 memory_limit_mb 计算，与测试机器的可用内存无关
+    monkeypatch.setattr(memory_budget, "system_memory", lambda: (None, None))
+
+    def make(model_mb, resident_mb=4096):
+        model_path = tmp_path / "model.gguf"
+        with open(model_path, "wb") as f:
+            f.truncate(int(model_mb * MB))
+        config_path = tmp_path / "config.json"
+        config_path.write_text(json.dumps({
+            "context_length": 4096,
+            "short_context_length": 1024,
+            "memory_limit_mb": 65536,
+            "resident_models_max_mb": resident_mb,
+            "preload_model": False,
+            "translation_memory_enabled": False,
+        }), encoding="utf-8")
+        translator = Translator(config_path=str(config_path))
+        translator.models = ModelRegistry(str(tmp_path / "registry.json"))
+        translator.pool.resident.configure(max_mb=resident_mb, registry=translator.models)
+        return translator, str(model_path)
+
+    return make
+
+
+def _alternate(cache, specs, rounds=3):
+    """按短、长交替的顺序经过常驻模型缓存，返回被淘汰的实例"""
+    worker = FakeWorker()
+    evicted = []
+    for _ in range(rounds):
+        for model_path, params in specs:
+            key = params["n_ctx"]
+            evicted += [victim.key for victim in cache.reserve(worker, key, model_path, params)]
+            cache.add(worker, key, model_path, params)
+    return evicted
+
+
+def test_short_and_long_instances_stay_resident(make_translator):
+    translator, model_path = make_translator(model_mb=1000)
+    settings = translator.settings.get()
+    specs = translator._model_specs(model_path, settings)
+    assert [params["n_ctx"] for _, params in specs] == [4096, 1024]
+    assert _alternate(translator.pool.resident, specs[::-1]) == []
+    assert translator.pool.resident.stats()["resident"] == 2
+
+
+def test_short_context_is_skipped_when_both_do_not_fit(make_translator):
+    translator, model_path = make_translator(model_mb=4700)
+    settings = translator.settings.get()
+    specs = translator._model_specs(model_path, settings)
+    assert [params["n_ctx"] for _, params in specs] == [4096]
+    model = specs[0]
+    assert translator._select_context(model, settings, prompt_tokens=20, output_tokens=40) is model
+    assert _alternate(translator.pool.resident, specs) == []
+
+
+def test_short_context_is_selected_for_short_prompts(make_translator):
+    translator, model_path = make_translator(model_mb=1000)
+    settings = translator.settings.get()
+    model = translator._model_spec(model_path, settings)
+    assert translator._select_context(model, settings, prompt_tokens=20, output_tokens=40)[1]["n_ctx"] == 1024
+    assert translator._select_context(model, settings, prompt_tokens=2000, output_tokens=400) is model
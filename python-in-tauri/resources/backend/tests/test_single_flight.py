@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, current_priority
+from single_flight import SingleFlight
+
+
+class Calls:
+    """记录调用次数，结果在 release 后返回"""
+
+    def __init__(self, error=None):
+        self.count = 0
+        self.error = error
+        self.release = asyncio.Event()
+        self.cancelled = False
+
+    async def __call__(self):
+        self.count += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"value": self.count}
+
+
+def test_identical_keys_share_one_call():
+    async def main():
+        flight = SingleFlight()
+        calls = Calls()
+        waiters = [asyncio.ensure_future(flight.run("key", calls)) for _ in range(5)]
+        other = asyncio.ensure_future(flight.run("other", calls))
+        await asyncio.sleep(0)
+        assert flight.stats()["in_flight"] == 2
+        calls.release.set()
+        results = await asyncio.gather(*waiters, other)
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert calls.count == 2
+    assert all(result is results[0] for result in results[:5])
+    stats = flight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (2, 4, 0)
+
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flight = SingleFlight()
+        calls = Calls(error=RuntimeError("boom"))
+        waiters = [asyncio.ensure_future(flight.run("key", calls)) for _ in range(3)]
+        await asyncio.sleep(0)
+        calls.release.set()
+        return calls, await asyncio.gather(*waiters, return_exceptions=True)
+
+    calls, results = asyncio.run(main())
+    assert calls.count == 1
+    assert all(isinstance(result, RuntimeError) and str(result) == "boom" for result in results)
+
+
+def test_finished_flight_is_not_reused():
+    async def main():
+        flight = SingleFlight()
+        calls = Calls()
+        calls.release.set()
+        first = await flight.run("key", calls)
+        second = await flight.run("key", calls)
+        return calls, first, second
+
+    calls, first, second = asyncio.run(main())
+    assert calls.count == 2
+    assert first != second
+
+
+def test_cancelling_one_waiter_keeps_the_call_running():
+    async def main():
+        flight = SingleFlight()
+        calls = Calls()
+        leader = asyncio.ensure_future(flight.run("key", calls))
+        follower = asyncio.ensure_future(flight.run("key", calls))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        calls.release.set()
+        return calls, await follower
+
+    calls, result = asyncio.run(main())
+    assert not calls.cancelled
+    assert result == {"value": 1}
+
+
+def test_cancelling_every_waiter_cancels_the_call():
+    async def main():
+        flight = SingleFlight()
+        calls = Calls()
+        waiters = [asyncio.ensure_future(flight.run("key", calls)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return calls, flight
+
+    calls, flight = asyncio.run(main())
+    assert calls.cancelled
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.parametrize("priorities, expected_calls", [
+    ((PRIORITY_INTERACTIVE, PRIORITY_INTERACTIVE), 1),
+    ((PRIORITY_BATCH, PRIORITY_INTERACTIVE), 2),
+])
+def test_translate_key_includes_priority(tmp_path, priorities, expected_calls):
+    from translator import Translator
+
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"preload_model": False}), encoding="utf-8")
+    translator = Translator(config_path=str(config_path))
+    calls = []
+
+    async def translate_once(text, source_lang, target_lang, provider, use_cache):
+        calls.append(current_priority.get())
+        await asyncio.sleep(0.01)
+        return {"success": True, "translated_text": text.upper()}
+
+    translator._translate_once = translate_once
+
+    async def main():
+        async def run(priority):
+            token = current_priority.set(priority)
+            try:
+                return await translator._translate("hello", "en", "zh", "baidu", False)
+            finally:
+                current_priority.reset(token)
+
+        return await asyncio.gather(*(run(priority) for priority in priorities))
+
+    results = asyncio.run(main())
+    assert len(calls) == expected_calls
+    assert all(result["translated_text"] == "HELLO" for result in results)
@@ -0,0 +1,81 @@
+import pytest
+
+from span_masking import MAX_MASK_CHARS, has_translatable_text, looks_like_code, mask_spans, restore_spans
+
+
+@pytest.mark.parametrize("text", [
+    "See https://example.com/docs?a=1 for details.",
+    "Mail admin@example.org or open C:\\Users\\me\\file.txt",
+    "Hello {name}, you have %d new messages (${count}).",
+    "Run `pip install -r requirements.txt` in /opt/app/backend",
+    "Version v1.2.3 costs 1,024 dollars at 10:30, about 3.14 each.",
+])
+def test_mask_restore_round_trip(text):
+    masked = mask_spans(text)
+    assert masked.spans
+    assert all(span not in masked.text for span in masked.spans)
+    assert restore_spans(masked, masked.text) == text
+
+
+def test_url_keeps_trailing_punctuation_outside_span():
+    masked = mask_spans("Visit https://example.com.")
+    assert masked.spans == ["https://example.com"]
+    assert masked.text == "Visit {{0}}."
+
+
+def test_restore_accepts_reordered_tokens():
+    masked = mask_spans("From /usr/local/bin to /opt/app/bin")
+    assert restore_spans(masked, "到 {{1}} 从 {{0}}") == "到 /opt/app/bin 从 /usr/local/bin"
+
+
+@pytest.mark.parametrize("translated", ["只有 {{0}}", "{{0}} {{0}} {{1}}", "{{0}} {{1}} {{2}}"])
+def test_restore_rejects_missing_duplicate_or_unknown_tokens(translated):
+    masked = mask_spans("From /usr/local/bin to /opt/app/bin")
+    assert restore_spans(masked, translated) is None
+
+
+def test_plain_integers_are_not_masked():
+    assert mask_spans("I have 3 apples").spans == []
+
+
+def test_long_text_is_not_masked():
+    text = "https://example.com " * (MAX_MASK_CHARS // 10)
+    masked = mask_spans(text)
+    assert masked.text == text and masked.spans == []
+
+
+def test_has_translatable_text():
+    assert not has_translatable_text(mask_spans("https://example.com 3.14"))
+    assert has_translatable_text(mask_spans("Open https://example.com now"))
+
+
+@pytest.mark.parametrize("text", [
+    "Total = 5 items",
+    "result => success",
+    "Please call me (see below);",
+    "if (you agree) please sign",
+    "Note: x = y is not required;",
+    "Use foo() to do it",
+    "from here import that",
+    "return to the menu;",
+    "Welcome to the show!\nEnjoy (a lot);",
+    "The API returns {{0}} on failure;",
+])
+def test_prose_is_not_code(text):
+    assert not looks_like_code(text)
+
+
+@pytest.mark.parametrize("text", [
+    "x = 5;",
+    "});",
+    "def foo(bar):\n    return bar + 1",
+    "for i in range(10):\n    print(i)",
+    "const total = items.length;",
+    "if (x > 0) {\n  y = compute(x);\n}",
+    "import os\nos.path.join(a, b)",
+    "#include <stdio.h>\nint main() {\n  printf(\"hi\");\n  return 0;\n}",
+    "self.cache[key] = value",
+    "let x = foo({{0}});",
+])
+def test_code_is_detected(text):
+    assert looks_like_code(text)
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from translation_memory import TranslationMemory, make_key, normalize_segment
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.db"))
+    yield memory
+    memory.close()
+
+
+def test_round_trip(memory):
+    assert memory.get("llama-cpp", "m.gguf", "en", "zh", "Hello") is None
+    memory.put("llama-cpp", "m.gguf", "en", "zh", "Hello", "你好")
+    assert memory.get("llama-cpp", "m.gguf", "en", "zh", "Hello") == "你好"
+    stats = memory.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["writes"]) == (1, 1, 1, 1)
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "tm.db")
+    first = TranslationMemory(path)
+    first.put("baidu", "baidu", "en", "zh", "Hello", "你好")
+    first.close()
+    second = TranslationMemory(path)
+    assert second.get("baidu", "baidu", "en", "zh", "Hello") == "你好"
+    assert second.stats()["size_bytes"] == first.stats()["size_bytes"]
+    second.close()
+
+
+@pytest.mark.parametrize("a, b", [
+    ("line one\r\nline two", "line one\nline two"),
+    ("trailing   \nspaces\t", "trailing\nspaces"),
+    ("  padded  ", "padded"),
+    ("caf\u00e9", "cafe\u0301"),
+])
+def test_normalization_shares_keys(a, b):
+    assert normalize_segment(a) == normalize_segment(b)
+    assert make_key("baidu", "baidu", "en", "zh", a) == make_key("baidu", "baidu", "en", "zh", b)
+
+
+def test_normalization_keeps_line_structure_and_indent():
+    assert normalize_segment("a\n\n  b") == "a\n\n  b"
+    assert normalize_segment("a\nb") != normalize_segment("a b")
+
+
+@pytest.mark.parametrize("changed", [
+    ("llama-cpp", "m.gguf", "en", "zh"),
+    ("baidu", "other.gguf", "en", "zh"),
+    ("baidu", "m.gguf", "ja", "zh"),
+    ("baidu", "m.gguf", "en", "en"),
+])
+def test_key_includes_provider_model_and_languages(changed):
+    assert make_key(*changed, "Hello") != make_key("baidu", "m.gguf", "en", "zh", "Hello")
+
+
+def test_contains_does_not_count(memory):
+    memory.put("baidu", "baidu", "en", "zh", "Hello", "你好")
+    assert memory.contains("baidu", "baidu", "en", "zh", "Hello")
+    assert not memory.contains("baidu", "baidu", "en", "zh", "Bye")
+    stats = memory.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
+
+
+def test_evicts_least_recently_used_when_over_size(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.db"), max_mb=4096 / MB)
+    texts = [f"text {i}" for i in range(8)]
+    for text in texts[:4]:
+        memory.put("baidu", "baidu", "en", "zh", text, "译" * 300)
+    # 访问第一条，使其成为最近使用
+    memory.get("baidu", "baidu", "en", "zh", texts[0])
+    for text in texts[4:]:
+        memory.put("baidu", "baidu", "en", "zh", text, "译" * 300)
+    stats = memory.stats()
+    assert stats["evictions"] > 0
+    assert stats["size_bytes"] <= memory.max_bytes
+    assert memory.contains("baidu", "baidu", "en", "zh", texts[-1])
+    assert not memory.contains("baidu", "baidu", "en", "zh", texts[1])
+    memory.close()
+
+
+def test_configure_applies_new_limit_on_next_write(memory):
+    for i in range(8):
+        memory.put("baidu", "baidu", "en", "zh", f"text {i}", "译" * 300)
+    memory.configure(max_mb=2048 / MB)
+    assert memory.max_bytes == 2048
+    memory.put("baidu", "baidu", "en", "zh", "new", "译" * 300)
+    assert memory.stats()["size_bytes"] <= 2048
+
+
+def test_translator_reapplies_max_mb(tmp_path):
+    from translator import Translator
+
+    config_path = tmp_path / "config.json"
+    config = {"translation_memory_max_mb": 64, "preload_model": False}
+    config_path.write_text(json.dumps(config), encoding="utf-8")
+    translator = Translator(config_path=str(config_path))
+    translator.settings.get()
+    translator.memory = TranslationMemory(str(tmp_path / "tm.db"), max_mb=64)
+    memory, _ = translator._get_translation_memory("baidu")
+    assert memory.max_bytes == 64 * MB
+
+    assert translator.settings.save({**config, "translation_memory_max_mb": 32.5})["success"]
+    assert memory.max_bytes == int(32.5 * MB)
+    memory.close()
+
+
+def test_planning_skips_cached_segments_without_counting(tmp_path):
+    from translator import Translator
+
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"preload_model": False}), encoding="utf-8")
+    translator = Translator(config_path=str(config_path))
+    memory = translator.memory = TranslationMemory(str(tmp_path / "tm.db"))
+    texts = ["one", "two", "three", "four", "five"]
+    for text in ("two", "four"):
+        memory.put("baidu", "baidu", "en", "zh", text, "译文")
+
+    async def plan():
+        return await translator._plan_packs(texts, list(range(len(texts))), ["en"] * len(texts), "zh", "baidu", True)
+
+    packs = asyncio.run(plan())
+    assert packs == [("en", [0, 2, 4])]
+    stats = memory.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
+
+    # 逐段翻译已缓存的文本时只计一次命中
+    cached = asyncio.run(translator._cached_result("baidu", "en", "zh", "two"))
+    assert cached["translated_text"] == "译文"
+    assert memory.stats()["hits"] == 1
+    memory.close()
@@ -13,6 +13,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from translator import translator, init_translator, cleanup_translator
+from scheduler import PRIORITY_BATCH
 
 # 设置日志
 import os
@@ -48,6 +49,7 @@ class TranslationRequest(BaseModel):
     source_lang: str = "auto"
     target_lang: str = "zh"
     provider: str = "llama-cpp"
+    bypass_cache: bool = False  # 为True时绕过翻译记忆
 
 
 class InferenceModeRequest(BaseModel):
@@ -109,7 +111,8 @@ async def translate(request: TranslationRequest):
             text=request.text,
             source_lang=request.source_lang,
             target_lang=request.target_lang,
-            provider=request.provider
+            provider=request.provider,
+            use_cache=not request.bypass_cache
         )
         
         if result["success"]:
@@ -139,138 +142,15 @@ async def translate_stream(request: TranslationRequest):
         try:
             logger.info(f"收到流式翻译请求: {request.text[:50]}...")
             
-            # 动态导入llama-cpp-python
-            from llama_cpp import Llama
             import json
             
-            # 从配置文件加载参数
-            # 尝试使用appdirs，如果不可用则回退
-            try:
-                import appdirs
-                import pathlib
-                config_dir = pathlib.Path(appdirs.user_data_dir("TranslatorApp", "Translator"))
-                config_file_path = config_dir / "config.json"
-                config_path = str(config_file_path)
-            except ImportError:
-                # 如果appdirs不可用，回退到原始方法
-                config_path = "../config.json"
-                config_file_path = os.path.join(os.path.dirname(__file__), config_path)
-            config = {}
-            if os.path.exists(config_file_path):
-                with open(config_file_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            
-            # 使用配置文件中的参数，如果没有则使用默认值
-            model_dir = config.get("model_dir", "./models")
-            current_model = config.get("current_model", "")
-            context_length = config.get("context_length", 2048)
-            threads = config.get("threads", 4)
-            max_tokens = config.get("max_tokens", 512)
-            temperature = config.get("temperature", 0.1)
-            
-            # 构建模型路径
-            if not os.path.isabs(model_dir):
-                base_dir = os.path.dirname(__file__)
-                model_dir = os.path.join(base_dir, "..", model_dir)
-                model_dir = os.path.normpath(model_dir)
-            
-            # 如果没有指定当前模型，尝试查找第一个 .gguf 文件
-            if not current_model:
-                if os.path.exists(model_dir):
-                    for file in os.listdir(model_dir):
-                        if file.endswith('.gguf'):
-                            current_model = file
-                            break
-            
-            if not current_model:
-                yield f"data: {json.dumps({'error': f'模型文件夹中没有找到 .gguf 文件: {model_dir}'})}\n\n"
-                return
-            
-            model_path = os.path.join(model_dir, current_model)
-            
-            # 构建翻译提示（使用混元模型的提示词模板）
-            target_lang_map = {
-                "zh": "中文",
-                "en": "English",
-                "ja": "日本語",
-                "ko": "한국어",
-                "fr": "Français",
-                "de": "Deutsch",
-                "es": "Español",
-                "ru": "Русский",
-                "ar": "العربية",
-                "it": "Italiano",
-                "pt": "Português",
-                "nl": "Nederlands",
-                "pl": "Polski",
-                "vi": "Tiếng Việt",
-                "th": "ไทย",
-                "tr": "Türkçe",
-                "he": "עברית",
-                "hi": "हिन्दी",
-                "cs": "Čeština",
-                "uk": "Українська",
-                "id": "Bahasa Indonesia",
-                "ms": "Bahasa Melayu",
-                "tl": "Filipino",
-                "bn": "বাংলা",
-                "ta": "தமிழ்",
-                "te": "తెలుగు",
-                "mr": "मराठी",
-                "gu": "ગુજરાતી",
-                "kn": "ಕನ್ನಡ",
-                "ml": "മലയാളം",
-                "si": "සිංහල",
-                "my": "မြန်မာဘာသာ",
-                "km": "ភាសាខ្មែរ",
-                "lo": "ລາວ",
-                "fa": "فارسی",
-                "ur": "اردو",
-                "pa": "ਪੰਜਾਬੀ",
-                "kk": "Қазақ тілі",
-                "uz": "O'zbek tili",
-                "mn": "Монгол хэл",
-                "bo": "བོད་སྐད།",
-                "ug": "ئۇيغۇر تىلى",
-                "yue": "粵語",
-                "zh-Hant": "繁體中文"
-            }
-            
-            target_display = target_lang_map.get(request.target_lang, request.target_lang)
-            prompt = f"将以下文本翻译为{target_display}，注意只需要输出翻译后的结果，不要额外解释：\n\n{request.text}"
-            
-            # 检查模型文件是否存在
-            if not os.path.exists(model_path):
-                yield f"data: {json.dumps({'error': f'模型文件不存在: {model_path}'})}\n\n"
-                return
-            
-            # 如果模型实例不存在，则创建新实例
-            if translator.llm_instance is None:
-                translator.llm_instance = Llama(
-                    model_path=model_path,
-                    n_ctx=context_length,
-                    n_gpu_layers=0,  # 禁用GPU，仅使用CPU
-                    n_threads=threads,
-                    verbose=False
-                )
-            
-            # 使用流式生成
-            output = translator.llm_instance(
-                prompt,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                stop=["\n\n", "###"],
-                stream=True
-            )
-            
-            # 逐个yield生成的文本，添加flush确保实时发送
-            for chunk in output:
-                if 'choices' in chunk and len(chunk['choices']) > 0:
-                    delta = chunk['choices'][0].get('text', '')
-                    if delta:
-                        yield f"data: {json.dumps({'text': delta})}\n\n"
-                        # 强制刷新，确保数据立即发送
-                        # 在FastAPI中，我们通过yield来实时发送数据
+            # 推理在推理线程中进行，这里只负责转发生成的文本片段
+            async for delta in translator.translate_stream(
+                text=request.text,
+                source_lang=request.source_lang,
+                target_lang=request.target_lang
+            ):
+                yield f"data: {json.dumps({'text': delta})}\n\n"
                         
             # 发送结束信号
             yield f"data: {json.dumps({'done': True})}\n\n"
@@ -295,8 +175,17 @@ async def translate_stream(request: TranslationRequest):
 async def health_check():
     """
     健康检查接口
+    只反映服务进程是否可用，不触发模型加载；模型是否就绪见 model_state 和 /ready
     """
-    return {"status": "healthy", "service": "translation-api"}
+    return {"status": "healthy", "service": "translation-api", "model_state": translator.readiness.state}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    模型就绪状态接口（预加载进度：idle/loading/warming/ready/error）
+    """
+    return {"success": True, **translator.get_readiness()}
 
 
 @app.post("/batch_translate")
@@ -312,15 +201,17 @@ async def batch_translate(
     try:
         logger.info(f"收到批量翻译请求，共{len(texts)}个文本")
         
+        # 所有文本同时提交，由推理线程池并行翻译
+        translations = await translator.translate_many(
+            texts,
+            source_lang=source_lang,
+            target_lang=target_lang,
+            provider=provider,
+            priority=PRIORITY_BATCH
+        )
+        
         results = []
-        for text in texts:
-            result = await translator.translate(
-                text=text,
-                source_lang=source_lang,
-                target_lang=target_lang,
-                provider=provider
-            )
-            
+        for text, result in zip(texts, translations):
             results.append({
                 "original_text": text,
                 "translated_text": result.get("translated_text", ""),
@@ -388,7 +279,8 @@ async def get_config():
         config = translator.get_config()
         return {
             "success": True,
-            "config": config
+            "config": config,
+            "inference": translator.get_inference_params()
         }
     except Exception as e:
         logger.error(f"获取配置时发生错误: {str(e)}")
@@ -416,6 +308,217 @@ async def update_config(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/translation-memory")
+async def get_translation_memory_stats():
+    """
+    获取翻译记忆统计信息接口
+    """
+    try:
+        return {
+            "success": True,
+            "stats": translator.get_translation_memory_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取翻译记忆统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/translation-memory/clear")
+async def clear_translation_memory():
+    """
+    清空翻译记忆接口
+    """
+    try:
+        await asyncio.to_thread(translator.clear_translation_memory)
+        return {
+            "success": True,
+            "message": "翻译记忆已清空"
+        }
+    except Exception as e:
+        logger.error(f"清空翻译记忆时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/scheduler")
+async def get_scheduler_stats():
+    """
+    获取推理调度器状态接口（各优先级的队列深度和等待时间）
+    """
+    try:
+        return {
+            "success": True,
+            "scheduler": translator.get_scheduler_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取调度器状态时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/speculative")
+async def get_speculative_stats():
+    """
+    获取推测解码统计接口（各模式的 tokens/s 和候选接受率）
+    """
+    try:
+        return {
+            "success": True,
+            "speculative": translator.get_speculative_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取推测解码统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/packing")
+async def get_packing_stats():
+    """
+    获取短文本打包翻译统计接口
+    """
+    try:
+        return {
+            "success": True,
+            "packing": translator.get_packing_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取打包翻译统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/micro-batch")
+async def get_micro_batch_stats():
+    """
+    获取微批处理统计接口（批大小和请求的额外等待时间）
+    """
+    try:
+        return {
+            "success": True,
+            "micro_batch": translator.get_micro_batch_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取微批处理统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/baidu")
+async def get_baidu_stats():
+    """
+    获取百度翻译API客户端统计接口
+    """
+    try:
+        return {
+            "success": True,
+            "baidu": translator.get_baidu_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取百度翻译统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/single-flight")
+async def get_single_flight_stats():
+    """
+    获取相同请求合并统计接口
+    """
+    try:
+        return {
+            "success": True,
+            "single_flight": translator.get_single_flight_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取请求合并统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/language-prepass")
+async def get_prepass_stats():
+    """
+    获取翻译前语言识别统计接口（跳过的文本数和识别出的源语言数）
+    """
+    try:
+        return {
+            "success": True,
+            "prepass": translator.get_prepass_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取语言识别统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/span-masking")
+async def get_masking_stats():
+    """
+    获取片段遮蔽统计接口
+    """
+    try:
+        return {
+            "success": True,
+            "masking": translator.get_masking_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取片段遮蔽统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/memory")
+async def get_memory_info():
+    """
+    获取内存信息接口（系统可用内存、mmap/mlock 配置、各模型的加载内存估算）
+    """
+    try:
+        return {
+            "success": True,
+            "memory": translator.get_memory_info()
+        }
+    except Exception as e:
+        logger.error(f"获取内存信息时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/resident-models")
+async def get_resident_models_stats():
+    """
+    获取常驻模型状态接口（各实例的内存估算、加载/切换/淘汰计数）
+    """
+    try:
+        return {
+            "success": True,
+            "resident_models": translator.get_resident_models_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取常驻模型状态时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/prompt-cache")
+async def get_prompt_cache_stats():
+    """
+    获取提示词前缀缓存统计接口
+    """
+    try:
+        return {
+            "success": True,
+            "prompt_cache": translator.get_prompt_cache_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取提示词前缀缓存统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/output-budget")
+async def get_output_budget_stats():
+    """
+    获取输出预算统计接口（各语言对的预算用尽比例，用于调整膨胀系数）
+    """
+    try:
+        return {
+            "success": True,
+            "output_budget": translator.get_output_budget_stats()
+        }
+    except Exception as e:
+        logger.error(f"获取输出预算统计时发生错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/cpu-status")
 async def get_cpu_status():
     """
@@ -493,13 +596,14 @@ async def switch_model(request: Request):
         if not model_name:
             raise HTTPException(status_code=400, detail="缺少 model_name 参数")
         
-        result = translator.switch_model(model_name)
+        result = await translator.switch_model(model_name)
         
         if result["success"]:
             return {
                 "success": True,
                 "message": result["message"],
-                "model_path": result["model_path"]
+                "model_path": result["model_path"],
+                "swap": result["swap"]
             }
         else:
             raise HTTPException(status_code=400, detail=result.get("error", "切换模型失败"))
@@ -510,6 +614,15 @@ async def switch_model(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/switch-model/status")
+async def get_switch_status(since: int = 0):
+    """
+    模型切换进度接口
+    返回当前状态（idle/loading/swapping/draining/done/error）和序号大于 since 的进度事件
+    """
+    return {"success": True, **translator.get_switch_status(since)}
+
+
 @app.post("/batch-translate-files")
 async def batch_translate_files(request: BatchFileTranslationRequest):
     """
@@ -519,56 +632,49 @@ async def batch_translate_files(request: BatchFileTranslationRequest):
         import os
         from pathlib import Path
         
-        results = []
         total_files = len(request.file_paths)
         
-        for idx, file_path in enumerate(request.file_paths):
+        def read_file(file_path: str):
+            """读取待翻译文件，返回 (内容, 错误结果)"""
+            # 检查文件是否存在
+            if not os.path.exists(file_path):
+                return None, {
+                    "file_path": file_path,
+                    "success": False,
+                    "error": "文件不存在"
+                }
+            
+            # 只处理.txt文件
+            if not file_path.lower().endswith('.txt'):
+                return None, {
+                    "file_path": file_path,
+                    "success": False,
+                    "error": "只支持.txt文件"
+                }
+            
+            # 读取文件内容
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            if not content.strip():
+                return None, {
+                    "file_path": file_path,
+                    "success": False,
+                    "error": "文件为空"
+                }
+            return content, None
+        
+        async def process_file(idx: int, file_path: str, translation):
             try:
-                # 检查文件是否存在
-                if not os.path.exists(file_path):
-                    results.append({
-                        "file_path": file_path,
-                        "success": False,
-                        "error": "文件不存在"
-                    })
-                    continue
-                
-                # 只处理.txt文件
-                if not file_path.lower().endswith('.txt'):
-                    results.append({
-                        "file_path": file_path,
-                        "success": False,
-                        "error": "只支持.txt文件"
-                    })
-                    continue
-                
-                # 读取文件内容
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                if not content.strip():
-                    results.append({
-                        "file_path": file_path,
-                        "success": False,
-                        "error": "文件为空"
-                    })
-                    continue
-                
-                # 翻译内容
-                translation_result = await translator.translate(
-                    text=content,
-                    source_lang=request.source_lang,
-                    target_lang=request.target_lang,
-                    provider=request.provider
-                )
+                # 等待翻译结果
+                translation_result = await translation
                 
                 if not translation_result.get("success"):
-                    results.append({
+                    return {
                         "file_path": file_path,
                         "success": False,
                         "error": translation_result.get("error", "翻译失败")
-                    })
-                    continue
+                    }
                 
                 translated_text = translation_result.get("translated_text", "")
                 
@@ -577,12 +683,11 @@ async def batch_translate_files(request: BatchFileTranslationRequest):
                     save_path = file_path
                 else:  # save_as
                     if not request.save_path:
-                        results.append({
+                        return {
                             "file_path": file_path,
                             "success": False,
                             "error": "另存为模式下需要指定保存路径"
-                        })
-                        continue
+                        }
                     
                     # 获取原文件名
                     original_filename = os.path.basename(file_path)
@@ -596,20 +701,48 @@ async def batch_translate_files(request: BatchFileTranslationRequest):
                 with open(save_path, 'w', encoding='utf-8') as f:
                     f.write(translated_text)
                 
-                results.append({
+                return {
                     "file_path": file_path,
                     "save_path": save_path,
                     "success": True,
                     "progress": (idx + 1) / total_files * 100
-                })
+                }
                 
             except Exception as e:
                 logger.error(f"翻译文件 {file_path} 时出错: {str(e)}")
-                results.append({
+                return {
                     "file_path": file_path,
                     "success": False,
                     "error": str(e)
-                })
+                }
+        
+        # 先读取所有文件，再一起提交翻译：由推理线程池并行处理，很小的文件按短文本打包翻译
+        results = [None] * total_files
+        contents = {}
+        for idx, file_path in enumerate(request.file_paths):
+            try:
+                content, error = read_file(file_path)
+            except Exception as e:
+                logger.error(f"读取文件 {file_path} 时出错: {str(e)}")
+                content, error = None, {"file_path": file_path, "success": False, "error": str(e)}
+            if error is not None:
+                results[idx] = error
+            else:
+                contents[idx] = content
+        
+        indices = list(contents)
+        translations = translator.submit_many(
+            [contents[idx] for idx in indices],
+            source_lang=request.source_lang,
+            target_lang=request.target_lang,
+            provider=request.provider,
+            priority=PRIORITY_BATCH
+        )
+        processed = await asyncio.gather(
+            *(process_file(idx, request.file_paths[idx], translation) for idx, translation in zip(indices, translations))
+        )
+        for idx, result in zip(indices, processed):
+            results[idx] = result
         
         # 统计结果
         success_count = sum(1 for r in results if r.get("success"))
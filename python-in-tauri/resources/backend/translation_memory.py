@@ -0,0 +1,190 @@
+"""
+翻译记忆缓存
+基于 SQLite 的持久化缓存，位于所有翻译提供商之前
+键为 (provider, 模型文件, 源语言, 目标语言, 规范化文本哈希)，按总大小进行LRU淘汰
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存文件位置：resources/cache/translation_memory.db
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "../cache/translation_memory.db")
+
+# 默认缓存上限（MB）
+DEFAULT_MAX_MB = 256
+
+
+def normalize_segment(text: str) -> str:
+    """
+    规范化文本用于计算缓存键
+    统一 Unicode 形式和换行符，去掉行尾空白和首尾空白，保留行结构
+    """
+    text = unicodedata.normalize("NFC", text)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def make_key(provider: str, model: str, source_lang: str, target_lang: str, text: str) -> str:
+    """计算缓存键"""
+    digest = hashlib.sha256(normalize_segment(text).encode("utf-8")).hexdigest()
+    raw = "\x1f".join([provider, model or "", source_lang, target_lang, digest])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """
+    持久化翻译记忆
+    单连接 + 锁，允许在事件循环和工作线程中同时使用
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_mb: float = DEFAULT_MAX_MB):
+        self.db_path = os.path.normpath(db_path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._size_bytes = 0
+
+    def configure(self, max_mb: float):
+        """修改容量上限；超出新上限的条目在下一次写入时淘汰"""
+        with self._lock:
+            self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_last_access ON segments(last_access)")
+        conn.commit()
+        row = conn.execute("SELECT COALESCE(SUM(size), 0) FROM segments").fetchone()
+        self._size_bytes = int(row[0])
+        self._conn = conn
+        logger.info(f"翻译记忆已打开: {self.db_path}，当前大小: {self._size_bytes} 字节")
+        return conn
+
+    def get(self, provider: str, model: str, source_lang: str, target_lang: str, text: str) -> Optional[str]:
+        """查询缓存，未命中返回 None"""
+        key = make_key(provider, model, source_lang, target_lang, text)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT translated_text FROM segments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            # 访问时间随下一次写入一并提交，避免每次命中都落盘
+            conn.execute("UPDATE segments SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def contains(self, provider: str, model: str, source_lang: str, target_lang: str, text: str) -> bool:
+        """是否已有缓存（不计入命中统计，也不更新访问时间；用于批量翻译前的规划）"""
+        key = make_key(provider, model, source_lang, target_lang, text)
+        with self._lock:
+            conn = self._connect()
+            return conn.execute("SELECT 1 FROM segments WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, provider: str, model: str, source_lang: str, target_lang: str, text: str, translated_text: str):
+        """写入缓存，超出容量时按最近访问时间淘汰"""
+        key = make_key(provider, model, source_lang, target_lang, text)
+        size = len(translated_text.encode("utf-8")) + len(key)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            old = conn.execute("SELECT size FROM segments WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO segments "
+                "(key, provider, model, source_lang, target_lang, translated_text, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model or "", source_lang, target_lang, translated_text, size, now, now)
+            )
+            self._size_bytes += size - (old[0] if old else 0)
+            self.writes += 1
+            if self._size_bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """淘汰最久未访问的条目，直到降到上限的90%"""
+        target = int(self.max_bytes * 0.9)
+        while self._size_bytes > target:
+            rows = conn.execute(
+                "SELECT key, size FROM segments ORDER BY last_access ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._size_bytes = 0
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM segments WHERE key = ?", (key,))
+                self._size_bytes -= size
+                self.evictions += 1
+                if self._size_bytes <= target:
+                    break
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM segments")
+            conn.commit()
+            conn.execute("VACUUM")
+            self._size_bytes = 0
+        logger.info("翻译记忆已清空")
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            size_bytes = self._size_bytes
+        lookups = self.hits + self.misses
+        return {
+            "db_path": self.db_path,
+            "entries": entries,
+            "size_bytes": size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        """提交未落盘的访问时间并关闭连接"""
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.commit()
+                    self._conn.close()
+                except Exception as e:
+                    logger.warning(f"关闭翻译记忆失败: {str(e)}")
+                self._conn = None
@@ -1,8 +1,31 @@
 import asyncio
 import logging
-from typing import Dict, Optional
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import importlib.util
 
+from inference_worker import InferencePool
+from translation_memory import TranslationMemory
+from settings import MODEL_KEYS, Settings, SettingsStore, model_settings_changed
+from model_tokenizer import ModelTokenizer, source_token_budget
+from output_budget import OutputBudgetStats, expansion_ratio, output_token_budget, output_token_limit
+from segmenter import Segment, count_units, iter_chunks, iter_segments
+from micro_batcher import MicroBatcher
+from single_flight import SingleFlight
+from baidu_client import MAX_QUERY_BYTES, BaiduClient, plan_queries, utf8_len
+from language_detect import PrepassStats, detect_languages
+from span_masking import SKIP_CODE, SKIP_MASKED_ONLY, MaskedText, MaskingStats, has_translatable_text, looks_like_code, mask_spans, restore_spans
+from segment_packer import PackingStats, build_packed_prompt_prefix, pack_segments, packable, plan_packs, unpack_segments
+from model_registry import ModelRegistry
+from memory_budget import MIN_CONTEXT_LENGTH, plan_load, system_memory
+from inference_params import check_settings, describe_params, resolve_inference_params
+from speculative import MODE_DRAFT_MODEL, speculative_spec
+from model_warmup import (
+    ModelReadiness, ModelSwapStatus, STATE_ERROR, STATE_LOADING, STATE_READY, STATE_WARMING,
+    SWAP_DONE, SWAP_DRAINING, SWAP_ERROR, SWAP_LOADING, SWAP_SWAPPING, WARMUP_MAX_TOKENS, WARMUP_TEXT, prefetch_file
+)
+from scheduler import PRIORITY_BATCH, PRIORITY_STREAMING, current_priority, normalize_priority
+
 # 设置日志
 import os
 log_dir = os.path.join(os.path.dirname(__file__), "../logs")
@@ -19,239 +42,914 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 目标语言显示名称（用于构建提示词）
+TARGET_LANG_MAP = {
+    "zh": "中文",
+    "en": "English",
+    "ja": "日本語",
+    "ko": "한국어",
+    "fr": "Français",
+    "de": "Deutsch",
+    "es": "Español",
+    "ru": "Русский",
+    "ar": "العربية",
+    "it": "Italiano",
+    "pt": "Português",
+    "nl": "Nederlands",
+    "pl": "Polski",
+    "vi": "Tiếng Việt",
+    "th": "ไทย",
+    "tr": "Türkçe",
+    "he": "עברית",
+    "hi": "हिन्दी",
+    "cs": "Čeština",
+    "uk": "Українська",
+    "id": "Bahasa Indonesia",
+    "ms": "Bahasa Melayu",
+    "tl": "Filipino",
+    "bn": "বাংলা",
+    "ta": "தமிழ்",
+    "te": "తెలుగు",
+    "mr": "मराठी",
+    "gu": "ગુજરાતી",
+    "kn": "ಕನ್ನಡ",
+    "ml": "മലയാളം",
+    "si": "සිංහල",
+    "my": "မြန်မာဘာသာ",
+    "km": "ភាសាខ្មែរ",
+    "lo": "ລາວ",
+    "fa": "فارسی",
+    "ur": "اردو",
+    "pa": "ਪੰਜਾਬੀ",
+    "kk": "Қазақ тілі",
+    "uz": "O'zbek tili",
+    "mn": "Монгол хэл",
+    "bo": "བོད་སྐད།",
+    "ug": "ئۇيغۇر تىلى",
+    "yue": "粵語",
+    "zh-Hant": "繁體中文"
+}
+
+# 百度翻译API语言代码映射
+BAIDU_LANG_MAP = {
+    "zh": "zh",
+    "en": "en",
+    "ja": "jp",
+    "ko": "kor",
+    "fr": "fra",
+    "de": "de",
+    "es": "spa",
+    "ru": "ru",
+    "ar": "ara"
+}
+
+
+def baidu_lang_codes(source_lang: str, target_lang: str) -> Tuple[str, str]:
+    """转换为百度翻译API的 (源语言, 目标语言) 代码，不支持的源语言改为自动识别"""
+    to_lang = BAIDU_LANG_MAP.get(target_lang, "zh")
+    from_lang = "auto" if source_lang == "auto" else BAIDU_LANG_MAP.get(source_lang, "auto")
+    return from_lang, to_lang
+
+
+def _render_lines(segments: List[Segment], translated: Iterator[Optional[str]]) -> Tuple[str, bool]:
+    """用译文依次替换各分段的正文（译文为 None 时保留原文），返回 (结果, 是否每段都有译文)"""
+    parts = []
+    complete = True
+    for segment in segments:
+        piece = next(translated) if segment.body else ""
+        if piece is None:
+            piece = segment.body
+            complete = False
+        parts.append(segment.render(piece))
+    return "".join(parts), complete
+
+
+def build_prompt_prefix(target_display: str) -> str:
+    """提示词中固定的指令部分（只随目标语言变化，其求值状态可以缓存复用）"""
+    return f"将以下文本翻译为{target_display}，注意只需要输出翻译后的结果，不要额外解释：\n\n"
+
+
+def build_translation_prompt(text: str, target_display: str) -> str:
+    """构建翻译提示（使用混元模型的提示词模板）"""
+    return build_prompt_prefix(target_display) + text
+
+
+def _load_settings(settings: Settings):
+    """变化后需要释放已加载实例的配置项（切换模型之外的模型参数）"""
+    return tuple(getattr(settings, key) for key in MODEL_KEYS if key not in ("model_dir", "current_model"))
+
+
 class Translator:
-    def __init__(self):
-        self.llm_instance = None
+    def __init__(self, config_path: Optional[str] = None):
+        self.models = ModelRegistry()  # 模型文件夹索引（缓存 GGUF 文件头信息）
+        self.pool = InferencePool()  # 推理线程池（每个线程独占自己的 Llama 实例）
+        self.pool.resident.configure(registry=self.models)
+        self.memory: Optional[TranslationMemory] = None  # 翻译记忆（首次使用时打开）
+        self.settings = SettingsStore(config_path)  # 共享的配置（按修改时间重新加载；config_path 为空时按默认位置查找）
+        self._tokenizers: Dict[str, ModelTokenizer] = {}  # 模型路径 -> 分词器
+        self._tokenizer_lock = asyncio.Lock()
+        self.output_budget_stats = OutputBudgetStats()  # 各语言对的输出预算使用情况
+        self.packing_stats = PackingStats()  # 短文本打包翻译的统计
+        self.micro_batcher = MicroBatcher(self._run_micro_batch)  # 合并同时到达的短文本翻译请求（默认关闭）
+        self.single_flight = SingleFlight()  # 合并正在执行的相同翻译请求
+        self.prepass_stats = PrepassStats()  # 翻译前语言识别的统计
+        self.masking_stats = MaskingStats()  # 不需要翻译的片段的遮蔽统计
+        self.baidu = BaiduClient()  # 百度翻译API客户端（共享连接池）
+        self.readiness = ModelReadiness()  # 模型预加载/预热进度
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._load_plans: Dict[tuple, tuple] = {}  # 模型加载的内存估算和推理参数（配置变化时清空）
+        self.swap = ModelSwapStatus()  # 模型热切换进度
+        self._swap_task: Optional[asyncio.Task] = None
+        self._swap_target: Optional[str] = None  # 热切换正在写入配置的模型（已预热，无需重置就绪状态）
+        self.settings.add_listener(self._on_settings_changed)
         self.inference_mode = "cpu"  # 默认CPU模式
-        self._need_recreate = False  # 标记是否需要重新创建实例
+
+    def _on_settings_changed(self, old: Settings, new: Settings):
+        """
+        配置变化回调
+        上下文长度、线程数或内存相关配置变化时，在推理线程中排队释放旧实例：
+        正在执行的推理会先完成，下一次请求再按新配置加载
+        只切换模型时旧实例作为常驻模型保留，超出内存预算时按最久未使用淘汰
+        """
+        model_changed = model_settings_changed(old, new)
+        if model_changed:
+            self._load_plans.clear()
+        if _load_settings(old) != _load_settings(new) and self.llm_instance is not None:
+            logger.info("模型相关配置已变更，将在当前推理完成后重新加载模型")
+            self.pool.unload()
+        if old.resident_models_max_mb != new.resident_models_max_mb:
+            self.pool.resident.configure(max_mb=new.resident_models_max_mb)
+        if self.memory is not None and old.translation_memory_max_mb != new.translation_memory_max_mb:
+            self.memory.configure(max_mb=new.translation_memory_max_mb)
+        workers_changed = (old.inference_workers, old.worker_threads) != (new.inference_workers, new.worker_threads)
+        if workers_changed:
+            self.pool.resize(new.inference_workers, new.worker_threads)
+        if workers_changed or (model_changed and not self._is_swap_target(new)):
+            self.readiness.reset("模型配置已变更")
+            if new.preload_model:
+                self._schedule_warmup()
+
+    def _is_swap_target(self, settings: Settings) -> bool:
+        """配置变化是否只是热切换到已预热的模型"""
+        if self._swap_target is None:
+            return False
+        model_path, _ = self._resolve_model_path(settings)
+        return model_path == self._swap_target
+
+    @property
+    def llm_instance(self):
+        """当前推理线程持有的模型实例（只读，模型由推理线程管理）"""
+        return self.pool.llm
     
     async def init(self):
         """初始化翻译器"""
+        settings = self.settings.get()
+        self.pool.resident.configure(max_mb=settings.resident_models_max_mb)
+        self.pool.resize(settings.inference_workers, settings.worker_threads)
+        self.pool.start()
+        # 预先建立模型索引（只解析新增或修改过的模型文件头），之后 /models 直接读取缓存
+        try:
+            await asyncio.to_thread(self.models.scan, settings.model_dir_path)
+        except OSError as e:
+            logger.warning(f"建立模型索引失败: {str(e)}")
+        if settings.preload_model:
+            self._schedule_warmup()
         logger.info("翻译器初始化完成")
     
     async def cleanup(self):
         """清理翻译器资源"""
-        if self.llm_instance:
-            try:
-                del self.llm_instance
-            except:
-                pass
-            self.llm_instance = None
+        for task in (self._warmup_task, self._swap_task):
+            if task is not None and not task.done():
+                task.cancel()
+        await asyncio.to_thread(self.pool.stop)
+        await self.baidu.aclose()
+        if self.memory is not None:
+            self.memory.close()
         logger.info("翻译器资源清理完成")
     
-    async def translate(self, text: str, source_lang: str = "auto", target_lang: str = "zh", provider: str = "llama-cpp") -> Dict[str, str]:
+    def _schedule_warmup(self):
+        """在后台启动预加载（取消尚未完成的上一次预加载）；没有运行中的事件循环时跳过"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        self._warmup_task = loop.create_task(self.warmup())
+
+    async def warmup(self):
+        """
+        预加载并预热当前配置的模型
+        将模型文件读入页缓存 -> 加载分词器和各推理线程的模型 -> 执行一次很短的生成
+        预热任务按批量优先级排队，不会阻塞用户请求
+        """
+        if importlib.util.find_spec("llama_cpp") is None:
+            self.readiness.update(STATE_ERROR, message="llama-cpp-python库未安装")
+            return
+        settings = self.settings.get()
+        model_path, error = self._resolve_model_path(settings)
+        if error:
+            self.readiness.update(STATE_ERROR, model=None, message=error)
+            return
+
+        current_priority.set(PRIORITY_BATCH)
+        model_name = os.path.basename(model_path)
+        started = time.monotonic()
+        self.readiness.update(STATE_LOADING, model=model_name, message="正在读取模型文件", progress=0.0, load_ms=None, warmup_ms=None)
+        try:
+            # 读取文件的进度占加载阶段的前一半
+            def on_progress(done: int, total: int):
+                self.readiness.update(progress=0.5 * done / total if total else 0.5)
+
+            await asyncio.to_thread(prefetch_file, model_path, on_progress)
+            self.readiness.update(message="正在加载模型", progress=0.5)
+
+            await self._get_tokenizer(model_path)
+            # 完整上下文实例和短上下文实例都在启动时加载；每个推理线程各自加载和预热，
+            # 避免先完成的线程取走其他线程的任务，使另一个线程在就绪后仍未加载
+            specs = self._model_specs(model_path, settings)
+            workers = list(self.pool.workers)
+            for model_file, params in specs:
+                await asyncio.gather(*(
+                    self.pool.submit_to(worker, lambda worker, model_file=model_file, params=params: worker._load(model_file, **params))
+                    for worker in workers
+                ))
+            load_ms = round((time.monotonic() - started) * 1000, 1)
+            self.readiness.update(STATE_WARMING, message="正在预热模型", progress=0.9, load_ms=load_ms)
+
+            # 预热生成同时缓存默认目标语言的提示词前缀
+            target_display = TARGET_LANG_MAP["zh"]
+            warmed = time.monotonic()
+            await asyncio.gather(*(
+                self.pool.generate(
+                    build_translation_prompt(WARMUP_TEXT, target_display),
+                    model=model,
+                    max_tokens=WARMUP_MAX_TOKENS,
+                    temperature=0.0,
+                    worker=worker,
+                    **self._prefix_cache_options(settings, target_display)
+                )
+                for model in specs
+                for worker in workers
+            ))
+            warmup_ms = round((time.monotonic() - warmed) * 1000, 1)
+            self.readiness.update(STATE_READY, message="模型已就绪", progress=1.0, warmup_ms=warmup_ms)
+            logger.info(f"模型预加载完成: {model_name}，加载 {load_ms} ms，预热 {warmup_ms} ms")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"模型预加载失败: {str(e)}")
+            self.readiness.update(STATE_ERROR, message=f"模型预加载失败: {str(e)}")
+
+    async def translate(self, text: str, source_lang: str = "auto", target_lang: str = "zh", provider: str = "llama-cpp", use_cache: bool = True, priority: Optional[str] = None) -> Dict[str, str]:
         """
         统一的翻译接口
+        先查询翻译记忆，未命中时再调用翻译提供商，成功结果写回翻译记忆
+        use_cache=False 时绕过翻译记忆（既不读取也不写入）
+        priority 为本次请求的推理优先级（interactive/streaming/batch），默认交互优先级
+        翻译前先识别语言：已是目标语言或不含文字的文本直接返回原文，源语言为 auto 时补充识别出的语言
+        链接、占位符、代码等片段遮蔽后再翻译，译文中按原样还原；整段是代码的文本直接返回原文
+        开启微批处理时，短文本请求在窗口内与其他请求合并为一次打包推理
         """
-        if provider == "llama-cpp":
-            return await self.translate_with_llama_cpp(text, source_lang, target_lang)
-        elif provider == "baidu":
-            return await self.translate_with_baidu(text, source_lang, target_lang)
+        settings = self.settings.get()
+        if provider in ("llama-cpp", "baidu"):
+            skipped, source_lang, mask = self._prepass([text], source_lang, target_lang, settings)[0]
+            if skipped is not None:
+                return skipped
+            if mask is not None:
+                result = await self._dispatch(mask.text, source_lang, target_lang, provider, use_cache, priority, settings)
+                return await self._restore(mask, text, result, lambda: self._dispatch(text, source_lang, target_lang, provider, use_cache, priority, settings))
+        return await self._dispatch(text, source_lang, target_lang, provider, use_cache, priority, settings)
+
+    async def _dispatch(self, text: str, source_lang: str, target_lang: str, provider: str, use_cache: bool, priority: Optional[str], settings: Settings) -> Dict[str, str]:
+        """交给微批处理或直接翻译"""
+        if settings.micro_batching and self._micro_batchable(text, provider, settings):
+            if use_cache:
+                cached = await self._cached_result(provider, source_lang, target_lang, text)
+                if cached is not None:
+                    return cached
+            self.micro_batcher.configure(settings.micro_batch_window_ms, settings.micro_batch_max_size)
+            key = (settings.current_model, source_lang, target_lang, use_cache, normalize_priority(priority) if priority else current_priority.get())
+            return await self.micro_batcher.submit(key, text)
+        return await self._translate_direct(text, source_lang, target_lang, provider, use_cache, priority)
+
+    async def _translate_direct(self, text: str, source_lang: str, target_lang: str, provider: str, use_cache: bool, priority: Optional[str]) -> Dict[str, str]:
+        """不经过微批处理的单次翻译"""
+        token = current_priority.set(normalize_priority(priority)) if priority else None
+        try:
+            return await self._translate(text, source_lang, target_lang, provider, use_cache)
+        finally:
+            if token is not None:
+                current_priority.reset(token)
+
+    def _micro_batchable(self, text: str, provider: str, settings: Settings) -> bool:
+        """能否参与微批处理：本地模型、开启了打包，且是可打包的短文本（按字符数粗略判断，批内再按token数分组）"""
+        return provider == "llama-cpp" and settings.segment_packing and len(text) <= settings.packing_segment_tokens * 8 and packable(text)
+
+    async def _run_micro_batch(self, key, texts: List[str]) -> List[Dict[str, str]]:
+        """执行一批合并的请求：按打包配置分组翻译，拆分失败的包退回逐段翻译"""
+        _, source_lang, target_lang, use_cache, priority = key
+        return await self.translate_many(texts, source_lang, target_lang, "llama-cpp", use_cache, priority, prepass=False)
+
+    def _prepass(self, texts: List[str], source_lang: str, target_lang: str, settings: Settings) -> List[Tuple[Optional[Dict[str, str]], str, Optional[MaskedText]]]:
+        """
+        翻译前的语言识别和片段遮蔽，返回每个文本的 (无需翻译时的结果, 源语言, 遮蔽结果)
+        源语言为 auto 且识别出语言时，返回识别出的语言；没有需要遮蔽的片段时遮蔽结果为 None
+        """
+        if not settings.language_prepass and not settings.span_masking:
+            return [(None, source_lang, None)] * len(texts)
+        if settings.language_prepass:
+            detections = detect_languages(texts, target_lang)
         else:
+            detections = [(None, None)] * len(texts)
+        results = []
+        for text, (language, reason) in zip(texts, detections):
+            detected = source_lang == "auto" and language is not None
+            source = language if detected else source_lang
+            mask = None
+            if reason is None and settings.span_masking:
+                masked = mask_spans(text)
+                if looks_like_code(masked.text):
+                    reason = SKIP_CODE
+                elif masked.spans and not has_translatable_text(masked):
+                    reason = SKIP_MASKED_ONLY
+                elif masked.spans:
+                    mask = masked
+                    self.masking_stats.record_masked(masked)
+            self.prepass_stats.record(reason, detected)
+            if reason is None:
+                results.append((None, source, mask))
+                continue
+            results.append(({
+                "success": True,
+                "translated_text": text,
+                "source_lang": source,
+                "target_lang": target_lang,
+                "skipped": reason
+            }, source, None))
+        return results
+
+    async def _restore(self, mask: MaskedText, text: str, result: Dict[str, str], retry) -> Dict[str, str]:
+        """还原译文中被遮蔽的片段；记号丢失时调用 retry() 翻译未遮蔽的原文"""
+        if not result.get("success"):
+            return result
+        restored = restore_spans(mask, result["translated_text"])
+        if restored is None:
+            self.masking_stats.record_failure()
+            logger.info(f"译文中被遮蔽的片段无法还原，改为翻译原文: {text[:50]}...")
+            return await retry()
+        return {**result, "translated_text": restored}
+
+    async def _cached_result(self, provider: str, source_lang: str, target_lang: str, text: str) -> Optional[Dict[str, str]]:
+        """查询翻译记忆（在工作线程中查询，不阻塞事件循环），未命中或翻译记忆被禁用时返回 None"""
+        memory, model = self._get_translation_memory(provider)
+        if memory is None:
+            return None
+        try:
+            cached = await asyncio.to_thread(memory.get, provider, model, source_lang, target_lang, text)
+        except Exception as e:
+            logger.warning(f"查询翻译记忆失败: {str(e)}")
+            return None
+        if cached is None:
+            return None
+        return {
+            "success": True,
+            "translated_text": cached,
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "cached": True
+        }
+
+    async def _translate(self, text: str, source_lang: str, target_lang: str, provider: str, use_cache: bool) -> Dict[str, str]:
+        if provider not in ("llama-cpp", "baidu"):
             return {
                 "success": False,
                 "error": f"不支持的翻译提供商: {provider}"
             }
+
+        # 相同的翻译正在进行时等待其结果（如重复点击翻译、PDF多页中相同的页眉）
+        # 按优先级区分：交互请求不等待排在批量任务后面的同一翻译
+        model = self.settings.get().current_model if provider == "llama-cpp" else provider
+        key = (provider, model, source_lang, target_lang, use_cache, current_priority.get(), text)
+        result = await self.single_flight.run(key, lambda: self._translate_once(text, source_lang, target_lang, provider, use_cache))
+        return dict(result)
+
+    async def _translate_once(self, text: str, source_lang: str, target_lang: str, provider: str, use_cache: bool) -> Dict[str, str]:
+        memory, model = self._get_translation_memory(provider) if use_cache else (None, "")
+        if memory is not None:
+            cached = await self._cached_result(provider, source_lang, target_lang, text)
+            if cached is not None:
+                return cached
+
+        if provider == "llama-cpp":
+            result = await self.translate_with_llama_cpp(text, source_lang, target_lang)
+        else:
+            result = await self.translate_with_baidu(text, source_lang, target_lang)
+
+        # 部分保留原文的结果（分段翻译失败）不写入翻译记忆，下次重新翻译
+        if memory is not None and result.get("success") and not result.get("partial"):
+            try:
+                await asyncio.to_thread(memory.put, provider, model, source_lang, target_lang, text, result["translated_text"])
+            except Exception as e:
+                logger.warning(f"写入翻译记忆失败: {str(e)}")
+        return result
+
+    async def translate_many(self, texts: List[str], source_lang: str = "auto", target_lang: str = "zh", provider: str = "llama-cpp", use_cache: bool = True, priority: Optional[str] = PRIORITY_BATCH, prepass: bool = True) -> List[Dict[str, str]]:
+        """
+        批量翻译多个文本，结果顺序与输入一致
+        本地模型的任务同时提交给推理线程池，由多个模型实例并行处理；短文本打包翻译（见 submit_many）
+        """
+        return list(await asyncio.gather(*self.submit_many(texts, source_lang, target_lang, provider, use_cache, priority, prepass)))
+
+    def submit_many(self, texts: List[str], source_lang: str = "auto", target_lang: str = "zh", provider: str = "llama-cpp", use_cache: bool = True, priority: Optional[str] = PRIORITY_BATCH, prepass: bool = True) -> List[asyncio.Future]:
+        """
+        提交批量翻译，返回与 texts 一一对应的 Future（结果为 translate 的返回值）
+        先批量识别语言，无需翻译的文本立即返回原文（prepass=False 表示调用方已识别过）
+        本地模型开启 segment_packing 时，短文本按编号打包翻译，拆分失败的包退回逐段翻译；
+        百度翻译的多个文本按行合并为尽量少的请求
+        调用方可以按顺序等待各个 Future；所有 Future 都被取消后停止剩余的翻译
+        """
+        loop = asyncio.get_running_loop()
+        # 相同的文本只翻译一次
+        first: Dict[str, int] = {}
+        for text in texts:
+            first.setdefault(text, len(first))
+        unique = list(first)
+        results = [loop.create_future() for _ in unique]
+        if len(unique) < len(texts):
+            self.single_flight.record_coalesced(len(texts) - len(unique))
+        source_langs = [source_lang] * len(unique)
+        masks: List[Optional[MaskedText]] = [None] * len(unique)
+        if prepass and provider in ("llama-cpp", "baidu"):
+            for i, (skipped, source, mask) in enumerate(self._prepass(unique, source_lang, target_lang, self.settings.get())):
+                source_langs[i] = source
+                masks[i] = mask
+                if skipped is not None:
+                    results[i].set_result(skipped)
+        run_texts = [mask.text if mask is not None else text for text, mask in zip(unique, masks)]
+        task = asyncio.ensure_future(self._run_many(run_texts, results, source_langs, target_lang, provider, use_cache, priority))
+
+        # 遮蔽过的文本在结果中还原被遮蔽的片段
+        outputs: List[asyncio.Future] = list(results)
+        restores = []
+        for i, mask in enumerate(masks):
+            if mask is not None:
+                outputs[i] = asyncio.ensure_future(self._restore_result(results[i], mask, unique[i], source_langs[i], target_lang, provider, use_cache, priority))
+                restores.append(outputs[i])
+
+        futures = [loop.create_future() for _ in texts]
+        for future, text in zip(futures, texts):
+            outputs[first[text]].add_done_callback(lambda result, future=future: _copy_result(result, future))
+
+        def on_done(_):
+            if all(future.cancelled() for future in futures):
+                for pending in [task] + restores:
+                    if not pending.done():
+                        pending.cancel()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return futures
+
+    async def _restore_result(self, result: asyncio.Future, mask: MaskedText, text: str, source_lang: str, target_lang: str, provider: str, use_cache: bool, priority: Optional[str]) -> Dict[str, str]:
+        return await self._restore(mask, text, await result, lambda: self._translate_direct(text, source_lang, target_lang, provider, use_cache, priority))
+
+    async def _run_many(self, texts: List[str], futures: List[asyncio.Future], source_langs: List[str], target_lang: str, provider: str, use_cache: bool, priority: Optional[str]):
+        """翻译 futures 中尚未完成的文本，source_langs 为每个文本的源语言"""
+        semaphore = asyncio.Semaphore(self.batch_concurrency(provider))
+
+        def resolve(index: int, result=None, error: Optional[BaseException] = None):
+            future = futures[index]
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        async def run_single(index: int):
+            try:
+                async with semaphore:
+                    result = await self._translate_direct(texts[index], source_langs[index], target_lang, provider, use_cache, priority)
+                resolve(index, result)
+            except Exception as e:
+                resolve(index, error=e)
+
+        async def run_pack(source_lang: str, indices: List[int]):
+            try:
+                async with semaphore:
+                    if provider == "baidu":
+                        results = await self._translate_baidu_pack([texts[i] for i in indices], source_lang, target_lang, use_cache)
+                    else:
+                        results = await self._translate_pack([texts[i] for i in indices], source_lang, target_lang, use_cache, priority)
+            except Exception as e:
+                logger.error(f"打包翻译出错: {str(e)}")
+                results = None
+            if results is None:
+                results = [None] * len(indices)
+            for index, result in zip(indices, results):
+                if result is not None:
+                    resolve(index, result)
+            # 没有结果的文本退回逐段翻译
+            await asyncio.gather(*(run_single(index) for index, result in zip(indices, results) if result is None))
+
+        try:
+            pending = [i for i in range(len(texts)) if not futures[i].done()]
+            packs = await self._plan_packs(texts, pending, source_langs, target_lang, provider, use_cache)
+            packed = {index for _, pack in packs for index in pack}
+            # 按输入顺序提交，先出现的文本先翻译
+            jobs = [(pack[0], run_pack(source_lang, pack)) for source_lang, pack in packs]
+            jobs += [(i, run_single(i)) for i in pending if i not in packed]
+            jobs.sort(key=lambda job: job[0])
+            await asyncio.gather(*(job for _, job in jobs))
+        finally:
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+
+    async def _plan_packs(self, texts: List[str], pending: List[int], source_langs: List[str], target_lang: str, provider: str, use_cache: bool) -> List[Tuple[str, List[int]]]:
+        """
+        将 pending 中可打包的短文本按源语言分组（已在翻译记忆中的文本不参与打包）
+        返回各组的 (源语言, 下标列表)
+        """
+        settings = self.settings.get()
+        if len(pending) < 2:
+            return []
+        if provider == "baidu":
+            return await self._plan_baidu_packs(texts, pending, source_langs, target_lang, use_cache)
+        if provider != "llama-cpp" or not settings.segment_packing:
+            return []
+        if importlib.util.find_spec("llama_cpp") is None:
+            return []
+        model_path, error = self._resolve_model_path(settings)
+        if error:
+            return []
+        try:
+            model = self._model_spec(model_path, settings)
+            tokenizer = await self._get_tokenizer(model_path)
+        except Exception as e:
+            logger.warning(f"无法打包翻译，逐段翻译: {str(e)}")
+            return []
+
+        target_display = TARGET_LANG_MAP.get(target_lang, target_lang)
+        template_tokens = tokenizer.count(build_packed_prompt_prefix(target_display))
+        segment_tokens = settings.packing_segment_tokens
+        memory, memory_model = self._get_translation_memory(provider) if use_cache else (None, "")
+
+        def measure(index: int) -> Optional[int]:
+            text = texts[index]
+            # 先按字符数粗略过滤，避免对长文本分词
+            if len(text) > segment_tokens * 8 or not packable(text):
+                return None
+            # 只检查是否已缓存（不计入命中统计），逐段翻译时再读取译文
+            if memory is not None:
+                try:
+                    if memory.contains(provider, memory_model, source_langs[index], target_lang, text):
+                        return None
+                except Exception:
+                    pass
+            tokens = tokenizer.count(text.strip())
+            return tokens if tokens <= segment_tokens else None
+
+        measured = await asyncio.to_thread(lambda: {index: measure(index) for index in pending})
+        packs = []
+        for source_lang in dict.fromkeys(source_langs[index] for index in pending):
+            ratio = expansion_ratio(source_lang, target_lang, settings.expansion_ratios)
+            max_tokens = min(settings.packing_max_tokens, source_token_budget(model[1]["n_ctx"], template_tokens, settings.max_tokens, ratio))
+            sizes = [
+                size if size is not None and size <= max_tokens and source_langs[index] == source_lang else None
+                for index, size in ((index, measured.get(index)) for index in range(len(texts)))
+            ]
+            packs += [(source_lang, pack) for pack in plan_packs(sizes, max_tokens, max(2, settings.packing_max_segments))]
+        return packs
+
+    async def _plan_baidu_packs(self, texts: List[str], pending: List[int], source_langs: List[str], target_lang: str, use_cache: bool) -> List[Tuple[str, List[int]]]:
+        """
+        百度翻译：将 pending 中的文本按源语言合并为尽量少的请求（每个请求不超过 MAX_QUERY_BYTES 字节）
+        已在翻译记忆中的文本和超过单个请求上限的文本不参与合并
+        """
+        memory, memory_model = self._get_translation_memory("baidu") if use_cache else (None, "")
+
+        def measure(index: int) -> Optional[int]:
+            text = texts[index]
+            size = utf8_len(text)
+            if not text.strip() or size > MAX_QUERY_BYTES:
+                return None
+            if memory is not None:
+                try:
+                    if memory.contains("baidu", memory_model, source_langs[index], target_lang, text):
+                        return None
+                except Exception:
+                    pass
+            return size
+
+        measured = await asyncio.to_thread(lambda: {index: measure(index) for index in pending})
+        packs = []
+        for source_lang in dict.fromkeys(source_langs[index] for index in pending):
+            indices = [index for index in pending if source_langs[index] == source_lang and measured[index] is not None]
+            packs += [(source_lang, [indices[i] for i in group]) for group in plan_queries([measured[index] for index in indices]) if len(group) > 1]
+        return packs
+
+    async def _translate_pack(self, texts: List[str], source_lang: str, target_lang: str, use_cache: bool, priority: Optional[str]) -> Optional[List[Dict[str, str]]]:
+        """
+        将多个短文本打包为一次生成，按编号拆回各段
+        拆分失败（模型合并、遗漏或打乱了段落）时返回 None，由调用方逐段翻译
+        """
+        settings = self.settings.get()
+        model_path, error = self._resolve_model_path(settings)
+        if error:
+            return None
+        target_display = TARGET_LANG_MAP.get(target_lang, target_lang)
+        prefix = build_packed_prompt_prefix(target_display)
+        body = pack_segments(texts)
+
+        token = current_priority.set(normalize_priority(priority)) if priority else None
+        try:
+            with self.pool.track(model_path):
+                model = self._model_spec(model_path, settings)
+                tokenizer = await self._get_tokenizer(model_path)
+                source_tokens = tokenizer.count(body)
+                output = await self._generate_with_budget(
+                    prefix + body, model, settings, source_lang, target_lang, source_tokens, tokenizer.count(prefix),
+                    self._prefix_cache_options(settings, target_display, prefix)
+                )
+        finally:
+            if token is not None:
+                current_priority.reset(token)
+
+        pieces = unpack_segments(output, len(texts))
+        self.packing_stats.record(len(texts), pieces is not None)
+        if pieces is None:
+            logger.info(f"打包翻译的译文无法按编号拆分为 {len(texts)} 段，改为逐段翻译")
+            return None
+
+        memory, memory_model = self._get_translation_memory("llama-cpp") if use_cache else (None, "")
+        if memory is not None:
+            try:
+                await asyncio.to_thread(
+                    lambda: [memory.put("llama-cpp", memory_model, source_lang, target_lang, text, piece) for text, piece in zip(texts, pieces)]
+                )
+            except Exception as e:
+                logger.warning(f"写入翻译记忆失败: {str(e)}")
+        return [
+            {
+                "success": True,
+                "translated_text": piece,
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "packed": True
+            }
+            for piece in pieces
+        ]
+
+    def batch_concurrency(self, provider: str) -> int:
+        """
+        批量任务的并发数：本地模型保持线程池中每个线程都有排队的任务，
+        百度翻译按账户每秒能发出的请求数
+        """
+        if provider == "llama-cpp":
+            return self.pool.size * 2
+        if provider == "baidu":
+            self._configure_baidu(self.settings.get())
+            return self.baidu.concurrency
+        return 1
+
+    def _configure_baidu(self, settings: Settings):
+        """按配置更新百度翻译客户端的连接池和限流参数"""
+        self.baidu.configure(
+            settings.baidu_timeout, settings.baidu_connect_timeout, settings.baidu_max_connections, settings.baidu_keepalive_connections,
+            qps=settings.baidu_qps, max_retries=settings.baidu_max_retries, endpoint=settings.baidu_endpoint
+        )
+
+    def _get_translation_memory(self, provider: str):
+        """
+        获取翻译记忆及当前提供商对应的模型标识
+        翻译记忆被禁用或无法确定模型时返回 (None, "")
+        """
+        settings = self.settings.get()
+        if not settings.translation_memory_enabled:
+            return None, ""
+
+        if provider == "llama-cpp":
+            model_path, error = self._resolve_model_path(settings)
+            if error:
+                return None, ""
+            model = os.path.basename(model_path)
+        else:
+            model = provider
+
+        if self.memory is None:
+            self.memory = TranslationMemory(max_mb=settings.translation_memory_max_mb)
+        return self.memory, model
+
+    def _resolve_model_path(self, settings: Settings):
+        """
+        根据配置确定模型文件路径
+        返回 (model_path, error)，出错时 model_path 为 None
+        """
+        model_dir = settings.model_dir_path
+        current_model = settings.current_model
+
+        # 如果没有指定当前模型，使用模型索引中的第一个 .gguf 文件
+        if not current_model:
+            current_model = self.models.first_model(model_dir)
+
+        if not current_model:
+            return None, f"模型文件夹中没有找到 .gguf 文件: {model_dir}"
+
+        model_path = os.path.join(model_dir, current_model)
+
+        # 检查模型文件是否存在
+        if not os.path.exists(model_path):
+            return None, f"模型文件不存在: {model_path}。请下载合适的GGUF格式翻译模型"
+
+        return model_path, None
+
+    async def _get_tokenizer(self, model_path: str) -> ModelTokenizer:
+        """
+        获取当前模型的分词器（只加载词表，首次使用时创建）
+        加载在锁外进行，热切换加载新模型的分词器时不阻塞使用旧模型的请求
+        """
+        tokenizer = self._tokenizers.get(model_path)
+        if tokenizer is None:
+            tokenizer = await asyncio.to_thread(ModelTokenizer, model_path)
+        async with self._tokenizer_lock:
+            # 并发加载了同一分词器时使用先完成的实例
+            tokenizer = self._tokenizers.pop(model_path, tokenizer)
+            # 只保留最近使用的两个模型的分词器（热切换期间新旧模型同时服务）
+            self._tokenizers[model_path] = tokenizer
+            while len(self._tokenizers) > 2:
+                self._tokenizers.pop(next(iter(self._tokenizers)))
+            return tokenizer
+
+    def _model_spec(self, model_path: str, settings: Settings, context_length: Optional[int] = None):
+        """
+        构建推理任务所需的模型参数 (model_path, params)
+        推理线程在执行任务前按此加载模型，参数未变化时复用现有实例
+        context_length 默认使用配置的上下文长度（短上下文实例传入 short_context_length），
+        不超过模型的训练上下文长度（来自 GGUF 文件头），并按内存预算缩小（见 _load_plan）
+        """
+        info = self.models.get(model_path)
+        if context_length is None:
+            context_length = settings.context_length
+        trained_context = info.get("context_length") if info else None
+        if trained_context and context_length > trained_context:
+            logger.debug(f"配置的上下文长度 {context_length} 超过模型训练长度，使用 {trained_context}")
+            context_length = trained_context
+        plan, inference_params, _ = self._load_plan(model_path, info, context_length, settings)
+        return model_path, {
+            "n_ctx": plan.n_ctx,  # 配置的上下文长度（可能因内存预算缩小）
+            "n_gpu_layers": 0,  # 禁用GPU，仅使用CPU
+            "n_threads": settings.threads,  # 从配置文件获取线程数
+            "use_mmap": settings.use_mmap,
+            "use_mlock": settings.use_mlock,
+            **inference_params,  # 批大小、flash attention、KV缓存类型
+            "verbose": False  # 关闭详细输出
+        }
+
+    def _model_specs(self, model_path: str, settings: Settings) -> List[Tuple[str, Dict[str, Any]]]:
+        """预加载时需要准备的模型实例：完整上下文实例，以及开启时的短上下文实例"""
+        model = self._model_spec(model_path, settings)
+        short_model = self._short_model_spec(model, settings)
+        return [model] if short_model is None else [model, short_model]
+
+    def _short_model_spec(self, model, settings: Settings):
+        """
+        短上下文实例的模型参数；未开启，或与完整上下文实例不能同时常驻在 resident_models_max_mb 内时返回 None
+        （两个实例不能同时常驻时，短文本和长文本交替到达会反复加载）
+        """
+        short = settings.short_context_length
+        if short <= 0 or short >= model[1]["n_ctx"]:
+            return None
+        short_model = self._model_spec(model[0], settings, short)
+        if not self.pool.resident.fits([model, short_model], self.pool.size):
+            logger.debug(f"完整上下文和短上下文实例超出常驻模型内存预算，不使用短上下文实例: {os.path.basename(model[0])}")
+            return None
+        return short_model
+
+    def _select_context(self, model, settings: Settings, prompt_tokens: int, output_tokens: int):
+        """
+        上下文大小分级：提示词和 output_tokens 个输出token都放得下时使用短上下文实例
+        （界面上的短文本不必为大上下文的KV缓存付出内存和求值开销），否则使用完整上下文实例
+        """
+        short_model = self._short_model_spec(model, settings)
+        if short_model is None:
+            return model
+        if output_token_limit(short_model[1]["n_ctx"], prompt_tokens, output_tokens) < output_tokens:
+            return model
+        return short_model
+
+    def _load_plan(self, model_path: str, info, context_length: int, settings: Settings):
+        """
+        加载前的内存估算和按模型校验后的推理参数，返回 (LoadPlan, 推理参数, 警告列表)
+        按模型和上下文长度缓存（配置变化时清空），避免可用内存的波动导致参数变化、反复重新加载
+        内存不足以在最小上下文长度下加载时抛出 InsufficientMemoryError
+        """
+        key = (model_path, context_length, self.pool.size)
+        entry = self._load_plans.get(key)
+        if entry is None:
+            inference_params, warnings = resolve_inference_params(settings, info, context_length)
+            speculative, speculative_warnings = self._speculative_spec(settings, model_path, info, context_length)
+            warnings += speculative_warnings
+            plan = plan_load(
+                model_path, info, context_length,
+                instances=self.pool.size,
+                use_mmap=settings.use_mmap,
+                use_mlock=settings.use_mlock,
+                limit_mb=settings.memory_limit_mb,
+                min_ctx=MIN_CONTEXT_LENGTH if settings.auto_reduce_context else context_length,
+                # 该模型已加载的实例会被替换（或共享权重），其占用的内存视为可用
+                reclaimable_bytes=self.pool.resident.model_bytes(model_path),
+                type_k=inference_params.get("type_k", "f16"),
+                type_v=inference_params.get("type_v", "f16"),
+                speculative=speculative
+            )
+            if plan.reduced:
+                # 批大小不能超过缩小后的上下文长度
+                inference_params, _ = resolve_inference_params(settings, info, plan.n_ctx)
+            if speculative:
+                inference_params["speculative"] = speculative
+            logged = {w for (path, _, _), (_, _, ws) in self._load_plans.items() if path == model_path for w in ws}
+            for warning in warnings:
+                if warning not in logged:
+                    logger.warning(f"{os.path.basename(model_path)}: {warning}")
+            entry = self._load_plans[key] = (plan, inference_params, warnings)
+        return entry
+
+    def _speculative_spec(self, settings: Settings, model_path: str, info, context_length: int):
+        """推测解码配置（草稿模型需与主模型词表相同），返回 (speculative 描述或 None, 警告列表)"""
+        draft_path = None
+        draft_info = None
+        if settings.speculative_mode == MODE_DRAFT_MODEL and settings.speculative_draft_model:
+            draft_path = os.path.join(settings.model_dir_path, settings.speculative_draft_model)
+            draft_info = self.models.get(draft_path)
+        return speculative_spec(settings.speculative_mode, settings.speculative_tokens, info, context_length, draft_path, draft_info)
+
+    def _prefix_cache_options(self, settings: Settings, target_display: str, prefix: Optional[str] = None) -> Dict[str, Any]:
+        """推理任务的提示词前缀缓存参数（关闭时为空），prefix 默认为单段翻译的指令部分"""
+        if not settings.prompt_cache_enabled:
+            return {}
+        return {
+            "prefix": prefix or build_prompt_prefix(target_display),
+            "persist_prefix": settings.prompt_cache_persist
+        }
     
     async def translate_with_llama_cpp(self, text: str, source_lang: str = "auto", target_lang: str = "zh") -> Dict[str, str]:
         """
         使用llama-cpp-python加载GGUF模型进行翻译 (仅CPU模式)
+        推理在独立线程中执行，不阻塞事件循环
         """
         try:
-            # 动态导入，避免在没有安装时出错
-            from llama_cpp import Llama
-            import json
-            import os
-            
-            # 从配置文件加载参数
-            config_path = "../config.json"
-            config_file_path = os.path.join(os.path.dirname(__file__), config_path)
-            config = {}
-            if os.path.exists(config_file_path):
-                with open(config_file_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            
-            # 使用配置文件中的参数，如果没有则使用默认值
-            model_dir = config.get("model_dir", "./models")
-            current_model = config.get("current_model", "")
-            context_length = config.get("context_length", 2048)
-            threads = config.get("threads", 4)
-            max_tokens = config.get("max_tokens", 512)
-            temperature = config.get("temperature", 0.1)
-            
-            # 构建模型路径
-            if not os.path.isabs(model_dir):
-                base_dir = os.path.dirname(__file__)
-                model_dir = os.path.join(base_dir, "..", model_dir)
-                model_dir = os.path.normpath(model_dir)
-            
-            # 如果没有指定当前模型，尝试查找第一个 .gguf 文件
-            if not current_model:
-                if os.path.exists(model_dir):
-                    for file in os.listdir(model_dir):
-                        if file.endswith('.gguf'):
-                            current_model = file
-                            break
-            
-            if not current_model:
-                return {
-                    "success": False,
-                    "error": f"模型文件夹中没有找到 .gguf 文件: {model_dir}"
-                }
-            
-            model_path = os.path.join(model_dir, current_model)
-            
-            # 注意：用户需要先下载合适的GGUF翻译模型文件
-            # 这里提供一个通用的翻译提示模板
-            # 实际使用时需要一个专门的翻译模型，如Qwen、Mistral等微调模型
-            
-            # 构建翻译提示（使用混元模型的提示词模板）
-            # 根据目标语言构建提示词
-            target_lang_map = {
-                "zh": "中文",
-                "en": "English",
-                "ja": "日本語",
-                "ko": "한국어",
-                "fr": "Français",
-                "de": "Deutsch",
-                "es": "Español",
-                "ru": "Русский",
-                "ar": "العربية",
-                "it": "Italiano",
-                "pt": "Português",
-                "nl": "Nederlands",
-                "pl": "Polski",
-                "vi": "Tiếng Việt",
-                "th": "ไทย",
-                "tr": "Türkçe",
-                "he": "עברית",
-                "hi": "हिन्दी",
-                "cs": "Čeština",
-                "uk": "Українська",
-                "id": "Bahasa Indonesia",
-                "ms": "Bahasa Melayu",
-                "tl": "Filipino",
-                "bn": "বাংলা",
-                "ta": "தமிழ்",
-                "te": "తెలుగు",
-                "mr": "मराठी",
-                "gu": "ગુજરાતી",
-                "kn": "ಕನ್ನಡ",
-                "ml": "മലയാളം",
-                "si": "සිංහල",
-                "my": "မြန်မာဘာသာ",
-                "km": "ភាសាខ្មែរ",
-                "lo": "ລາວ",
-                "fa": "فارسی",
-                "ur": "اردو",
-                "pa": "ਪੰਜਾਬੀ",
-                "kk": "Қазақ тілі",
-                "uz": "O'zbek tili",
-                "mn": "Монгол хэл",
-                "bo": "བོད་སྐད།",
-                "ug": "ئۇيغۇر تىلى",
-                "yue": "粵語",
-                "zh-Hant": "繁體中文"
-            }
-            
-            target_display = target_lang_map.get(target_lang, target_lang)
-            prompt = f"将以下文本翻译为{target_display}，注意只需要输出翻译后的结果，不要额外解释：\n\n{text}"
+            # 检查依赖，避免在没有安装时出错
+            if importlib.util.find_spec("llama_cpp") is None:
+                raise ImportError("llama_cpp")
             
-            # 构建模型路径
-            if not os.path.isabs(model_dir):
-                base_dir = os.path.dirname(__file__)
-                model_dir = os.path.join(base_dir, "..", model_dir)
-                model_dir = os.path.normpath(model_dir)
-            
-            # 如果没有指定当前模型，尝试查找第一个 .gguf 文件
-            if not current_model:
-                if os.path.exists(model_dir):
-                    for file in os.listdir(model_dir):
-                        if file.endswith('.gguf'):
-                            current_model = file
-                            break
+            # 从缓存的配置中获取参数（配置文件变化时自动重新加载）
+            settings = self.settings.get()
+            max_tokens = settings.max_tokens
+            temperature = settings.temperature
             
-            if not current_model:
+            model_path, error = self._resolve_model_path(settings)
+            if error:
                 return {
                     "success": False,
-                    "error": f"模型文件夹中没有找到 .gguf 文件: {model_dir}"
+                    "error": error
                 }
             
-            model_path = os.path.join(model_dir, current_model)
-            
-            # 检查模型文件是否存在
-            if not os.path.exists(model_path):
-                return {
-                    "success": False,
-                    "error": f"模型文件不存在: {model_path}。请下载合适的GGUF格式翻译模型"
-                }
+            target_display = TARGET_LANG_MAP.get(target_lang, target_lang)
+            prompt = build_translation_prompt(text, target_display)
+            
+            # 请求结束前旧模型不会因热切换被释放
+            with self.pool.track(model_path):
+                # 模型实例由推理线程按需创建（不存在或参数变化时）
+                model = self._model_spec(model_path, settings)
+                context_length = model[1]["n_ctx"]
+                cache_options = self._prefix_cache_options(settings, target_display)
+            
+                # 使用模型分词器计算token数量，超过单次请求的预算则分段翻译
+                # 预算同时考虑提示词模板和预计译文长度（按语言对的膨胀系数估算）
+                tokenizer = await self._get_tokenizer(model_path)
+                source_tokens = await asyncio.to_thread(count_units, text, tokenizer.count)
+                template_tokens = tokenizer.count(build_prompt_prefix(target_display))
+                ratio = expansion_ratio(source_lang, target_lang, settings.expansion_ratios)
+                budget = source_token_budget(context_length, template_tokens, max_tokens, ratio)
+            
+                if source_tokens > budget:
+                    logger.info(f"文本过长（{source_tokens} tokens，单次预算 {budget} tokens），将分段翻译")
+                    return await self._translate_in_chunks(text, tokenizer, budget, target_display, model, settings, source_lang, target_lang, template_tokens, cache_options)
+            
+                # 使用现有模型实例执行翻译（在推理线程中收集流式输出）
+                logger.info(f"开始CPU翻译，文本长度: {len(text)}, 预览: {text[:50]}...")
+                translated_text = await self._generate_with_budget(
+                    prompt, model, settings, source_lang, target_lang, source_tokens, template_tokens, cache_options
+                )
             
-            # 检查模型文件是否存在
-            if not os.path.exists(model_path):
                 return {
-                    "success": False,
-                    "error": f"模型文件不存在: {model_path}。请下载合适的GGUF格式翻译模型"
+                    "success": True,
+                    "translated_text": translated_text,
+                    "source_lang": source_lang,
+                    "target_lang": target_lang
                 }
-            
-            # 如果模型实例不存在或推理模式已更改，则创建新实例
-            if self.llm_instance is None or hasattr(self, '_need_recreate') and self._need_recreate:
-                # CPU推理参数设置 (仅Windows)
-                # 如果已有实例，先清理旧实例
-                if self.llm_instance is not None:
-                    logger.info("清理旧模型实例")
-                    try:
-                        # 尝试清理当前实例
-                        del self.llm_instance
-                    except:
-                        pass
-                    self.llm_instance = None
-                
-                # 创建模型实例
-                logger.info(f"创建CPU模型实例，模型路径: {model_path}，线程数: {threads}")
-                self.llm_instance = Llama(**{
-                    "model_path": model_path,
-                    "n_ctx": context_length,  # 从配置文件获取上下文长度
-                    "n_gpu_layers": 0,  # 禁用GPU，仅使用CPU
-                    "n_threads": threads,  # 从配置文件获取线程数
-                    "verbose": False  # 关闭详细输出
-                })
-                if hasattr(self, '_need_recreate'):
-                    delattr(self, '_need_recreate')
-            
-            # 计算token数量，如果超过上下文窗口则分段翻译
-            # 估算：中文约1.5字符/token，英文约4字符/token
-            estimated_tokens = len(text) // 3  # 保守估计
-            
-            if estimated_tokens > context_length * 0.8:  # 留20%余量
-                logger.info(f"文本过长（估计{estimated_tokens} tokens），将分段翻译")
-                return await self._translate_in_chunks(text, target_display, context_length, max_tokens, temperature)
-            
-            # 使用现有模型实例执行翻译（使用流式输出）
-            logger.info(f"开始CPU翻译，文本长度: {len(text)}, 预览: {text[:50]}...")
-            translated_text = ""
-            
-            # 使用流式生成
-            output = self.llm_instance(
-                prompt,
-                max_tokens=max_tokens,  # 从配置文件获取最大token数
-                temperature=temperature,  # 从配置文件获取温度
-                stop=["###"],  # 停止词 (移除 \n\n 以防截断多段落文本)
-                stream=True  # 启用流式输出
-            )
-            
-            # 收集流式输出
-            for chunk in output:
-                if 'choices' in chunk and len(chunk['choices']) > 0:
-                    delta = chunk['choices'][0].get('text', '')
-                    if delta:
-                        translated_text += delta
-            
-            return {
-                "success": True,
-                "translated_text": translated_text,
-                "source_lang": source_lang,
-                "target_lang": target_lang
-            }
         except ImportError:
             logger.error("llama-cpp-python库未安装，请运行: pip install llama-cpp-python")
             return {
@@ -264,86 +962,149 @@ class Translator:
                 "success": False,
                 "error": str(e)
             }
+
+    def _output_budget(self, settings: Settings, ratio: float, source_tokens: int, prompt_tokens: int, context_length: int) -> int:
+        """单次请求的 max_tokens：开启自适应预算时按原文长度计算，否则使用配置值"""
+        if settings.adaptive_max_tokens:
+            return output_token_budget(source_tokens, ratio, context_length, prompt_tokens, settings.max_tokens)
+        return output_token_limit(context_length, prompt_tokens, settings.max_tokens)
+
+    def _budget_recorder(self, source_lang: str, target_lang: str, ratio: float, source_tokens: int, max_tokens: int, outcome: Optional[Dict[str, Any]] = None):
+        """生成结束回调（在推理线程中执行）：记录预算使用情况"""
+        def on_finish(finish_reason: Optional[str], output_tokens: int):
+            if outcome is not None:
+                outcome["finish_reason"] = finish_reason
+            if finish_reason != "cancelled":
+                self.output_budget_stats.record(source_lang, target_lang, ratio, source_tokens, max_tokens, output_tokens, finish_reason)
+        return on_finish
+
+    async def _generate_with_budget(self, prompt: str, model, settings: Settings, source_lang: str, target_lang: str, source_tokens: int, template_tokens: int, cache_options: Dict[str, Any]) -> str:
+        """
+        按原文长度设置 max_tokens 生成译文
+        自适应预算被用尽（finish_reason 为 length）时，按配置的 max_tokens 重试一次，避免截断译文
+        """
+        ratio = expansion_ratio(source_lang, target_lang, settings.expansion_ratios)
+        prompt_tokens = template_tokens + source_tokens
+        context_length = model[1]["n_ctx"]
+        max_tokens = self._output_budget(settings, ratio, source_tokens, prompt_tokens, context_length)
+        limit = output_token_limit(context_length, prompt_tokens, settings.max_tokens)
+        # 重试所需的输出空间也放得下时使用短上下文实例
+        model = self._select_context(model, settings, prompt_tokens, limit)
+        while True:
+            outcome: Dict[str, Any] = {}
+            translated_text = await self.pool.generate(
+                prompt,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=settings.temperature,  # 从配置文件获取温度
+                stop=["###"],  # 停止词 (移除 \n\n 以防截断多段落文本)
+                on_finish=self._budget_recorder(source_lang, target_lang, ratio, source_tokens, max_tokens, outcome),
+                **cache_options
+            )
+            if outcome.get("finish_reason") != "length" or max_tokens >= limit:
+                return translated_text
+            logger.info(f"输出预算 {max_tokens} tokens 已用尽（原文 {source_tokens} tokens），按 {limit} tokens 重试")
+            max_tokens = limit
+
+    async def translate_stream(self, text: str, source_lang: str = "auto", target_lang: str = "zh", priority: str = PRIORITY_STREAMING):
+        """
+        使用本地模型流式翻译，逐个产出生成的文本片段
+        出错时抛出异常，由调用方转换为错误事件
+        """
+        if importlib.util.find_spec("llama_cpp") is None:
+            raise ImportError("llama-cpp-python库未安装，请运行: pip install llama-cpp-python")
+
+        settings = self.settings.get()
+        temperature = settings.temperature
+
+        model_path, error = self._resolve_model_path(settings)
+        if error:
+            raise RuntimeError(error)
+
+        target_display = TARGET_LANG_MAP.get(target_lang, target_lang)
+        prompt = build_translation_prompt(text, target_display)
+
+        model = self._model_spec(model_path, settings)
+
+        with self.pool.track(model_path):
+            # 流式输出无法重试，自适应预算被用尽时只记录统计
+            tokenizer = await self._get_tokenizer(model_path)
+            source_tokens = await asyncio.to_thread(count_units, text, tokenizer.count)
+            prompt_tokens = tokenizer.count(build_prompt_prefix(target_display)) + source_tokens
+            ratio = expansion_ratio(source_lang, target_lang, settings.expansion_ratios)
+            max_tokens = self._output_budget(settings, ratio, source_tokens, prompt_tokens, model[1]["n_ctx"])
+            model = self._select_context(model, settings, prompt_tokens, max_tokens)
+
+            async for delta in self.pool.stream(
+                prompt,
+                priority=priority,
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=["\n\n", "###"],
+                on_finish=self._budget_recorder(source_lang, target_lang, ratio, source_tokens, max_tokens),
+                **self._prefix_cache_options(settings, target_display)
+            ):
+                yield delta
     
-    async def _translate_in_chunks(self, text: str, target_display: str, context_length: int, max_tokens: int, temperature: float) -> Dict[str, str]:
+    async def _translate_in_chunks(self, text: str, tokenizer: ModelTokenizer, budget: int, target_display: str, model, settings: Settings, source_lang: str, target_lang: str, template_tokens: int, cache_options: Dict[str, Any]) -> Dict[str, str]:
         """
         分段翻译长文本
+        由分段器按行、句子切分并打包，每段的原文token数不超过 budget
+        每一段作为独立的推理任务提交，高优先级请求可以在段与段之间插队
         """
         try:
-            from llama_cpp import Llama
-            import os
-            
-            # 按段落分段（按换行符和句号分割）
-            paragraphs = []
-            current_chunk = ""
-            
-            # 按行分割，保留段落结构
-            lines = text.split('\n')
-            for line in lines:
-                # 估算当前chunk的token数
-                estimated_chunk_tokens = len(current_chunk + line) // 3
-                
-                if estimated_chunk_tokens > context_length * 0.6:  # 留40%余量给prompt
-                    if current_chunk.strip():
-                        paragraphs.append(current_chunk.strip())
-                    current_chunk = line + "\n"
-                else:
-                    current_chunk += line + "\n"
-            
-            # 添加最后一个chunk
-            if current_chunk.strip():
-                paragraphs.append(current_chunk.strip())
+            # 分段在线程中执行（需要逐句计算token数），空行和缩进保留在分段的首尾空白中
+            def split():
+                chunks = list(iter_chunks(text, budget, tokenizer.count))
+                return chunks, [tokenizer.count(chunk.body) for chunk in chunks]
+
+            chunks, chunk_tokens = await asyncio.to_thread(split)
+            paragraphs = [chunk.body for chunk in chunks]
             
             logger.info(f"文本分为{len(paragraphs)}段进行翻译")
             
-            # 确保模型实例存在
-            if self.llm_instance is None:
-                logger.error("模型实例不存在，无法进行分段翻译")
-                return {
-                    "success": False,
-                    "error": "模型实例不存在，无法进行分段翻译"
-                }
-            
-            # 翻译每一段
-            translated_paragraphs = []
-            for i, paragraph in enumerate(paragraphs):
+            # 翻译每一段（各段同时提交，由推理线程池并行处理）
+            semaphore = asyncio.Semaphore(self.batch_concurrency("llama-cpp"))
+
+            failed = []
+
+            async def translate_paragraph(i: int, paragraph: str) -> str:
                 if not paragraph.strip():
-                    translated_paragraphs.append("")
-                    continue
+                    return ""
                 
-                prompt = f"将以下文本翻译为{target_display}，注意只需要输出翻译后的结果，不要额外解释：\n\n{paragraph}"
+                prompt = build_translation_prompt(paragraph, target_display)
                 
                 try:
-                    output = self.llm_instance(
-                        prompt,
-                        max_tokens=max_tokens,
-                        temperature=temperature,
-                        stop=["###"],
-                        stream=True
-                    )
+                    async with semaphore:
+                        translated_text = await self._generate_with_budget(
+                            prompt, model, settings, source_lang, target_lang, chunk_tokens[i], template_tokens, cache_options
+                        )
                     
-                    translated_text = ""
-                    for chunk in output:
-                        if 'choices' in chunk and len(chunk['choices']) > 0:
-                            delta = chunk['choices'][0].get('text', '')
-                            if delta:
-                                translated_text += delta
-                    
-                    translated_paragraphs.append(translated_text)
                     logger.info(f"第{i+1}/{len(paragraphs)}段翻译完成")
+                    return translated_text
                 except Exception as e:
                     logger.error(f"翻译第{i+1}段时出错: {str(e)}")
-                    translated_paragraphs.append(paragraph)  # 翻译失败时保留原文
+                    failed.append(i)
+                    return paragraph  # 翻译失败时保留原文
             
-            # 合并翻译结果
-            final_text = '\n'.join(translated_paragraphs)
+            translated_paragraphs = await asyncio.gather(
+                *(translate_paragraph(i, paragraph) for i, paragraph in enumerate(paragraphs))
+            )
             
-            return {
+            # 合并翻译结果，恢复原文的换行、空行和缩进
+            final_text = ''.join(chunk.render(translated) for chunk, translated in zip(chunks, translated_paragraphs))
+            
+            result = {
                 "success": True,
                 "translated_text": final_text,
-                "source_lang": "auto",
-                "target_lang": "zh"
+                "source_lang": source_lang,
+                "target_lang": target_lang
             }
+            if failed:
+                # 部分分段保留了原文，不写入翻译记忆
+                result["partial"] = True
+            return result
         except Exception as e:
             logger.error(f"分段翻译失败: {str(e)}", exc_info=True)
             return {
@@ -354,23 +1115,14 @@ class Translator:
     async def translate_with_baidu(self, text: str, source_lang: str = "auto", target_lang: str = "zh") -> Dict[str, str]:
         """
         使用百度翻译API进行翻译
+        请求通过共享连接池的异步客户端发送，等待响应时不阻塞事件循环
+        文本按行切分（超过单个请求上限的行再按句子切分），各行按UTF-8字节数打包为尽量少的请求
         """
         try:
-            import requests
-            import random
-            from hashlib import md5
-            import json
-            import os
-            
-            # 从配置文件加载参数
-            config_path = os.path.join(os.path.dirname(__file__), "../config.json")
-            config = {}
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            
-            appid = config.get("baidu_appid", "")
-            appkey = config.get("baidu_appkey", "")
+            # 从缓存的配置中获取参数
+            settings = self.settings.get()
+            appid = settings.baidu_appid
+            appkey = settings.baidu_appkey
             
             if not appid or not appkey:
                 return {
@@ -378,130 +1130,45 @@ class Translator:
                     "error": "百度翻译API配置不完整，请在设置中配置App ID和App Key"
                 }
             
-            # 百度翻译API语言代码映射
-            lang_map = {
-                "zh": "zh",
-                "en": "en",
-                "ja": "jp",
-                "ko": "kor",
-                "fr": "fra",
-                "de": "de",
-                "es": "spa",
-                "ru": "ru",
-                "ar": "ara"
-            }
-            
-            # 转换目标语言代码
-            to_lang = lang_map.get(target_lang, "zh")
-            
-            # 处理源语言
-            if source_lang == "auto":
-                from_lang = "auto"
-            else:
-                from_lang = lang_map.get(source_lang, "auto")
-            
-            # 百度翻译API端点
-            endpoint = 'http://api.fanyi.baidu.com'
-            path = '/api/trans/vip/translate'
-            url = endpoint + path
-            
-            # 检查文本长度，如果太长则分段翻译
-            # 百度API限制：单次请求的URL长度不能超过2048字符
-            # 估算：每个中文字符约2-3字节，英文约1字节
-            # 为了安全，每段不超过1500字符
-            max_chars_per_request = 1500
-            
-            if len(text) > max_chars_per_request:
-                logger.info(f"文本过长（{len(text)}字符），将分段翻译")
-                return await self._translate_baidu_in_chunks(text, appid, appkey, from_lang, to_lang, url, max_chars_per_request)
-            
-            # 生成salt和sign
-            def make_md5(s, encoding='utf-8'):
-                return md5(s.encode(encoding)).hexdigest()
-            
-            salt = random.randint(32768, 65536)
-            sign = make_md5(appid + text + str(salt) + appkey)
-            
-            # 构建请求
-            headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-            payload = {
-                'appid': appid,
-                'q': text,
-                'from': from_lang,
-                'to': to_lang,
-                'salt': salt,
-                'sign': sign
-            }
+            from_lang, to_lang = baidu_lang_codes(source_lang, target_lang)
+            self._configure_baidu(settings)
             
-            # 发送请求
-            logger.info(f"发送百度翻译请求，文本长度: {len(text)}")
-            response = requests.post(url, params=payload, headers=headers, timeout=10)
-            logger.info(f"百度翻译API响应状态码: {response.status_code}")
-            
-            # 检查响应状态
-            if response.status_code != 200:
-                logger.error(f"百度翻译API返回错误状态码: {response.status_code}")
-                return {
-                    "success": False,
-                    "error": f"百度翻译API返回错误状态码: {response.status_code}"
-                }
-            
-            # 检查响应内容
-            response_text = response.text.strip()
-            logger.info(f"百度翻译API响应内容长度: {len(response_text)}")
-            
-            if not response_text:
-                logger.error("百度翻译API返回空响应")
-                return {
-                    "success": False,
-                    "error": "百度翻译API返回空响应"
-                }
-            
-            # 记录响应内容的前500个字符用于调试
-            logger.info(f"百度翻译API响应内容预览: {response_text[:500]}")
-            
-            # 尝试解析JSON
-            try:
-                result = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"百度翻译API返回非JSON格式: {response_text[:200]}")
-                logger.error(f"JSON解析错误详情: {str(e)}")
-                return {
-                    "success": False,
-                    "error": f"百度翻译API返回非JSON格式: {str(e)}"
-                }
-            
-            # 检查错误
-            if 'error_code' in result:
-                error_msg = result.get('error_msg', f"错误代码: {result.get('error_code')}")
-                logger.error(f"百度翻译API错误: {error_msg}")
-                return {
-                    "success": False,
-                    "error": f"百度翻译API错误: {error_msg}"
-                }
-            
-            # 提取翻译结果
-            if 'trans_result' in result and len(result['trans_result']) > 0:
-                translated_text = result['trans_result'][0].get('dst', '')
-                detected_lang = result.get('from', source_lang)
-                
+            # 空行、缩进等空白保留在分段的首尾空白中，只发送正文
+            segments = list(iter_segments(text, MAX_QUERY_BYTES, utf8_len))
+            lines = [segment.body for segment in segments if segment.body]
+            if not lines:
                 return {
                     "success": True,
-                    "translated_text": translated_text,
-                    "source_lang": detected_lang,
+                    "translated_text": text,
+                    "source_lang": source_lang,
                     "target_lang": target_lang
                 }
-            else:
+            
+            translated, detected_lang, error = await self._translate_baidu_in_chunks(lines, appid, appkey, from_lang, to_lang)
+            if error is not None and all(line is None for line in translated):
                 return {
                     "success": False,
-                    "error": "百度翻译API返回结果格式错误"
+                    "error": error
                 }
+            
+            # 合并翻译结果，恢复原文的换行、空行和缩进；翻译失败的行保留原文
+            final_text, complete = _render_lines(segments, iter(translated))
+            result = {
+                "success": True,
+                "translated_text": final_text,
+                "source_lang": detected_lang or source_lang,
+                "target_lang": target_lang
+            }
+            if not complete:
+                # 部分行保留了原文，不写入翻译记忆
+                result["partial"] = True
+            return result
                 
         except ImportError:
-            logger.error("requests库未安装，请运行: pip install requests")
+            logger.error("httpx库未安装，请运行: pip install httpx")
             return {
                 "success": False,
-                "error": "requests库未安装，请运行: pip install requests"
+                "error": "httpx库未安装，请运行: pip install httpx"
             }
         except Exception as e:
             logger.error(f"百度翻译出错: {str(e)}")
@@ -510,113 +1177,81 @@ class Translator:
                 "error": str(e)
             }
     
-    async def _translate_baidu_in_chunks(self, text: str, appid: str, appkey: str, from_lang: str, to_lang: str, url: str, max_chars: int) -> Dict[str, str]:
+    async def _translate_baidu_in_chunks(self, lines: List[str], appid: str, appkey: str, from_lang: str, to_lang: str) -> Tuple[List[Optional[str]], Optional[str], Optional[str]]:
         """
-        分段翻译长文本（百度API）
+        按UTF-8字节数将多行打包为请求（每个请求不超过 MAX_QUERY_BYTES），按 trans_result 的顺序拆回各行
+        返回 (与 lines 一一对应的译文, 识别出的源语言, 第一个错误)；所在请求失败的行为 None
         """
-        try:
-            import requests
-            import random
-            from hashlib import md5
-            import json
-            
-            # 按段落分段（按换行符分割）
-            paragraphs = []
-            current_chunk = ""
-            
-            # 按行分割，保留段落结构
-            lines = text.split('\n')
-            for line in lines:
-                # 估算当前chunk的字符数
-                estimated_chunk_chars = len(current_chunk + line)
-                
-                if estimated_chunk_chars > max_chars * 0.8:  # 留20%余量给其他参数
-                    if current_chunk.strip():
-                        paragraphs.append(current_chunk.strip())
-                    current_chunk = line + "\n"
-                else:
-                    current_chunk += line + "\n"
-            
-            # 添加最后一个chunk
-            if current_chunk.strip():
-                paragraphs.append(current_chunk.strip())
-            
-            logger.info(f"文本分为{len(paragraphs)}段进行翻译")
-            
-            # 翻译每一段
-            translated_paragraphs = []
-            def make_md5(s, encoding='utf-8'):
-                return md5(s.encode(encoding)).hexdigest()
-            
-            for i, paragraph in enumerate(paragraphs):
-                if not paragraph.strip():
-                    translated_paragraphs.append("")
-                    continue
-                
-                try:
-                    # 生成salt和sign
-                    salt = random.randint(32768, 65536)
-                    sign = make_md5(appid + paragraph + str(salt) + appkey)
-                    
-                    # 构建请求
-                    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-                    payload = {
-                        'appid': appid,
-                        'q': paragraph,
-                        'from': from_lang,
-                        'to': to_lang,
-                        'salt': salt,
-                        'sign': sign
-                    }
-                    
-                    # 发送请求
-                    logger.info(f"发送百度翻译请求（第{i+1}/{len(paragraphs)}段），文本长度: {len(paragraph)}")
-                    response = requests.post(url, params=payload, headers=headers, timeout=10)
-                    
-                    # 检查响应状态
-                    if response.status_code != 200:
-                        logger.error(f"翻译第{i+1}段时出错，状态码: {response.status_code}")
-                        translated_paragraphs.append(paragraph)  # 翻译失败时保留原文
-                        continue
-                    
-                    # 解析响应
-                    response_text = response.text.strip()
-                    result = json.loads(response_text)
-                    
-                    # 检查错误
-                    if 'error_code' in result:
-                        logger.error(f"翻译第{i+1}段时出错: {result.get('error_msg')}")
-                        translated_paragraphs.append(paragraph)  # 翻译失败时保留原文
-                        continue
-                    
-                    # 提取翻译结果
-                    if 'trans_result' in result and len(result['trans_result']) > 0:
-                        translated_text = result['trans_result'][0].get('dst', '')
-                        translated_paragraphs.append(translated_text)
-                        logger.info(f"第{i+1}/{len(paragraphs)}段翻译完成")
-                    else:
-                        logger.error(f"翻译第{i+1}段时出错: 返回格式错误")
-                        translated_paragraphs.append(paragraph)  # 翻译失败时保留原文
-                        
-                except Exception as e:
-                    logger.error(f"翻译第{i+1}段时出错: {str(e)}")
-                    translated_paragraphs.append(paragraph)  # 翻译失败时保留原文
-            
-            # 合并翻译结果
-            final_text = '\n'.join(translated_paragraphs)
-            
-            return {
+        groups = plan_queries([utf8_len(line) for line in lines])
+        if len(groups) > 1:
+            logger.info(f"文本共{len(lines)}行，打包为{len(groups)}个请求进行翻译")
+        
+        # 各请求并行发送，由客户端按账户的QPS限额限速
+        semaphore = asyncio.Semaphore(self.baidu.concurrency)
+
+        async def send(i: int, group: List[int]):
+            async with semaphore:
+                logger.info(f"发送百度翻译请求（第{i+1}/{len(groups)}个），{len(group)}行")
+                return await self.baidu.translate_lines(appid, appkey, [lines[j] for j in group], from_lang, to_lang)
+
+        responses = await asyncio.gather(*(send(i, group) for i, group in enumerate(groups)), return_exceptions=True)
+        translated: List[Optional[str]] = [None] * len(lines)
+        detected_lang = None
+        error = None
+        for i, (group, response) in enumerate(zip(groups, responses)):
+            if isinstance(response, BaseException):
+                if isinstance(response, asyncio.CancelledError):
+                    raise response
+                logger.error(f"第{i+1}个百度翻译请求出错: {str(response)}")
+                error = error or str(response)
+                continue
+            results, detected = response
+            for j, result in zip(group, results):
+                translated[j] = result
+            detected_lang = detected_lang or detected
+        return translated, detected_lang, error
+    
+    async def _translate_baidu_pack(self, texts: List[str], source_lang: str, target_lang: str, use_cache: bool) -> Optional[List[Optional[Dict[str, str]]]]:
+        """
+        将多个文本的各行合并为尽量少的百度翻译请求，按行拆回各文本
+        配置不完整时返回 None；某个文本有行翻译失败时该文本的结果为 None，由调用方单独翻译
+        """
+        settings = self.settings.get()
+        appid = settings.baidu_appid
+        appkey = settings.baidu_appkey
+        if not appid or not appkey:
+            return None
+        from_lang, to_lang = baidu_lang_codes(source_lang, target_lang)
+        self._configure_baidu(settings)
+
+        segments = [list(iter_segments(text, MAX_QUERY_BYTES, utf8_len)) for text in texts]
+        lines = [segment.body for text_segments in segments for segment in text_segments if segment.body]
+        translated, _, _ = await self._translate_baidu_in_chunks(lines, appid, appkey, from_lang, to_lang)
+
+        pieces = iter(translated)
+        outputs: List[Optional[str]] = []
+        for text_segments in segments:
+            output, complete = _render_lines(text_segments, pieces)
+            outputs.append(output if complete else None)
+
+        memory, memory_model = self._get_translation_memory("baidu") if use_cache else (None, "")
+        if memory is not None:
+            try:
+                await asyncio.to_thread(
+                    lambda: [memory.put("baidu", memory_model, source_lang, target_lang, text, output) for text, output in zip(texts, outputs) if output is not None]
+                )
+            except Exception as e:
+                logger.warning(f"写入翻译记忆失败: {str(e)}")
+        return [
+            {
                 "success": True,
-                "translated_text": final_text,
-                "source_lang": from_lang,
-                "target_lang": to_lang
-            }
-        except Exception as e:
-            logger.error(f"百度分段翻译失败: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "error": f"百度分段翻译失败: {str(e)}"
-            }
+                "translated_text": output,
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "packed": True
+            } if output is not None else None
+            for output in outputs
+        ]
     
     def set_inference_mode(self, mode: str):
         """
@@ -625,10 +1260,9 @@ class Translator:
         if mode in ["cpu"]:
             if self.inference_mode != mode:
                 self.inference_mode = mode
-                # 重置LLM实例以应用新模式
-                self.llm_instance = None
-                # 标记需要重新创建实例
-                self._need_recreate = True
+                # 释放LLM实例，下一次请求按新模式重新创建
+                self.pool.unload()
+                self.readiness.reset("推理模式已变更")
                 logger.info(f"推理模式已设置为: {mode}")
             else:
                 logger.info(f"推理模式已经是: {mode}")
@@ -653,131 +1287,179 @@ class Translator:
             "using_cpu": True
         }
 
+    def get_translation_memory_stats(self):
+        """
+        获取翻译记忆统计信息
+        """
+        memory, _ = self._get_translation_memory("baidu")
+        if memory is None:
+            return {"enabled": False}
+        stats = memory.stats()
+        stats["enabled"] = True
+        return stats
+
+    def clear_translation_memory(self):
+        """
+        清空翻译记忆
+        """
+        memory, _ = self._get_translation_memory("baidu")
+        if memory is not None:
+            memory.clear()
+
+    def get_scheduler_stats(self):
+        """
+        获取推理调度器的队列深度和等待时间
+        """
+        return self.pool.scheduler.stats()
+
+    def get_memory_info(self):
+        """
+        获取系统内存和各模型的加载内存估算（上下文长度是否因内存预算缩小）
+        """
+        settings = self.settings.get()
+        total, available = system_memory()
+        return {
+            "total_mb": round(total / (1024 * 1024), 1) if total is not None else None,
+            "available_mb": round(available / (1024 * 1024), 1) if available is not None else None,
+            "memory_limit_mb": settings.memory_limit_mb,
+            "use_mmap": settings.use_mmap,
+            "use_mlock": settings.use_mlock,
+            "auto_reduce_context": settings.auto_reduce_context,
+            "plans": [plan.to_dict() for plan, _, _ in self._load_plans.values()]
+        }
+
+    def get_speculative_stats(self):
+        """
+        获取推测解码的统计（各模式的生成速度、候选token的接受率）
+        """
+        settings = self.settings.get()
+        return {
+            "mode": settings.speculative_mode,
+            "draft_model": settings.speculative_draft_model,
+            "modes": self.pool.speculative_stats()
+        }
+
+    def get_packing_stats(self):
+        """
+        获取短文本打包翻译的统计（打包数、退回逐段翻译的次数、省去的模型调用次数）
+        """
+        return self.packing_stats.stats()
+
+    def get_micro_batch_stats(self):
+        """
+        获取微批处理的统计（批大小、请求在批中的等待时间）
+        """
+        return {
+            "enabled": self.settings.get().micro_batching,
+            **self.micro_batcher.stats()
+        }
+
+    def get_baidu_stats(self):
+        """
+        获取百度翻译API客户端的统计（连接池配置、请求数、失败和重试次数、各 appid 的实际QPS）
+        """
+        return self.baidu.stats()
+
+    def get_single_flight_stats(self):
+        """
+        获取相同请求合并的统计（实际执行的请求数、合并的重复请求数）
+        """
+        return self.single_flight.stats()
+
+    def get_prepass_stats(self):
+        """
+        获取翻译前语言识别的统计（跳过的文本数即省去的翻译调用数）
+        """
+        return {
+            "enabled": self.settings.get().language_prepass,
+            **self.prepass_stats.stats()
+        }
+
+    def get_masking_stats(self):
+        """
+        获取片段遮蔽的统计（遮蔽的片段数、还原失败次数）
+        """
+        return {
+            "enabled": self.settings.get().span_masking,
+            **self.masking_stats.stats()
+        }
+
+    def get_resident_models_stats(self):
+        """
+        获取常驻模型的内存占用和加载/淘汰计数
+        """
+        return self.pool.resident_stats()
+
+    def get_prompt_cache_stats(self):
+        """
+        获取提示词前缀缓存的命中统计
+        """
+        return self.pool.prefix_cache_stats()
+
+    def get_readiness(self):
+        """
+        获取模型就绪状态（idle/loading/warming/ready/error）
+        """
+        readiness = self.readiness.to_dict()
+        readiness["model_loaded"] = self.llm_instance is not None
+        return readiness
+
+    def get_output_budget_stats(self):
+        """
+        获取输出预算统计（各语言对的预算用尽比例和实际膨胀系数）
+        """
+        return self.output_budget_stats.stats()
+
     def get_config(self):
         """
         获取配置信息
         优先级：resources/config.json > 用户配置目录 > 默认配置
         """
-        import json
-        import os
-        from pathlib import Path
-        
-        # 优先查找 resources/config.json（打包后的位置或开发模式的位置）
-        # backend 目录在 resources/backend/，所以 ../config.json 就是 resources/config.json
-        resources_config_path = os.path.join(os.path.dirname(__file__), "../config.json")
-        if os.path.exists(resources_config_path):
-            try:
-                with open(resources_config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    # 兼容旧的配置格式：如果有 model_path，转换为 model_dir 和 current_model
-                    if "model_path" in config and "model_dir" not in config:
-                        old_model_path = config["model_path"]
-                        # 提取目录和文件名
-                        model_dir = os.path.dirname(old_model_path)
-                        model_name = os.path.basename(old_model_path)
-                        # 如果是相对路径，转换为相对于 resources 的路径
-                        if not os.path.isabs(model_dir):
-                            base_dir = os.path.dirname(__file__)
-                            model_dir = os.path.join(base_dir, "..", model_dir)
-                            model_dir = os.path.normpath(model_dir)
-                        config["model_dir"] = model_dir
-                        config["current_model"] = model_name
-                        # 删除旧的 model_path
-                        del config["model_path"]
-                        # 保存更新后的配置
-                        self.update_config(config)
-                    return config
-            except Exception as e:
-                logger.warning(f"读取 resources/config.json 失败: {str(e)}")
-        
-        # 如果 resources/config.json 不存在，尝试使用用户配置目录（如果 appdirs 可用）
+        return self.settings.get().to_dict()
+
+    def get_inference_params(self):
+        """
+        获取当前模型实际使用的推理参数（按模型校验后的批大小、KV缓存类型等）及校验警告
+        """
+        settings = self.settings.get()
+        model_path, error = self._resolve_model_path(settings)
+        if error:
+            return {"model": None, "error": error}
         try:
-            import appdirs
-            data_dir = appdirs.user_data_dir("TranslatorApp", "Translator")
-            user_config_path = Path(data_dir) / "config.json"
-            
-            if user_config_path.exists():
-                with open(user_config_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except ImportError:
-            # appdirs 不可用，跳过用户配置目录
-            pass
+            specs = self._model_specs(model_path, settings)
         except Exception as e:
-            logger.warning(f"读取用户配置失败: {str(e)}")
-        
-        # 如果都没有找到，返回默认配置
+            return {"model": os.path.basename(model_path), "error": str(e)}
+        warnings = []
+        for (path, _, _), (_, _, plan_warnings) in list(self._load_plans.items()):
+            if path == model_path:
+                warnings.extend(w for w in plan_warnings if w not in warnings)
         return {
-            "model_dir": "./models",
-            "current_model": "",
-            "context_length": 2048,
-            "threads": 4,
-            "max_tokens": 512,
-            "temperature": 0.1,
-            "api_base_url": "http://127.0.0.1:8000",
-            "timeout": 5000,
-            "auto_copy": False,
-            "dark_mode": False,
-            "theme_color": "#6366f1"
+            "model": os.path.basename(model_path),
+            "classes": {
+                name: describe_params({k: v for k, v in params.items() if k != "verbose"})
+                for name, (_, params) in zip(("long", "short"), specs)
+            },
+            "warnings": warnings
         }
 
     def update_config(self, new_config):
         """
         更新配置信息
         优先保存到 resources/config.json（打包后的位置或开发模式的位置）
+        推理参数无效时不保存
         """
-        import json
-        import os
-        from pathlib import Path
-        
-        # 优先保存到 resources/config.json（与读取保持一致）
-        config_path = os.path.join(os.path.dirname(__file__), "../config.json")
-        try:
-            # 确保目录存在
-            config_dir = os.path.dirname(config_path)
-            if config_dir and not os.path.exists(config_dir):
-                os.makedirs(config_dir, exist_ok=True)
-            
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(new_config, f, indent=2, ensure_ascii=False)
-            return {"success": True, "message": "配置已保存到 resources/config.json"}
-        except Exception as e:
-            logger.error(f"保存配置到 resources/config.json 失败: {str(e)}")
-            # 如果保存失败，尝试保存到用户配置目录
-            try:
-                import appdirs
-                data_dir = appdirs.user_data_dir("TranslatorApp", "Translator")
-                user_config_path = Path(data_dir) / "config.json"
-                user_config_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                with open(user_config_path, 'w', encoding='utf-8') as f:
-                    json.dump(new_config, f, indent=2, ensure_ascii=False)
-                return {"success": True, "message": "配置已保存到用户配置目录"}
-            except ImportError:
-                # appdirs 不可用
-                pass
-            except Exception as e2:
-                logger.error(f"保存配置到用户目录也失败: {str(e2)}")
-            
-            return {"success": False, "error": str(e)}
+        errors = check_settings(Settings.from_dict(new_config))
+        if errors:
+            return {"success": False, "error": "；".join(errors)}
+        return self.settings.save(new_config)
     
     def get_models_list(self):
         """
         获取模型文件夹中的模型列表
-        返回所有 .gguf 文件
+        返回所有 .gguf 文件及其文件头信息（架构、参数量、量化类型、上下文长度等）
         """
-        import os
-        from pathlib import Path
-        
         try:
-            config = self.get_config()
-            model_dir = config.get("model_dir", "./models")
-            
-            # 如果路径是相对路径，转换为绝对路径
-            if not os.path.isabs(model_dir):
-                # 相对于 backend 目录
-                base_dir = os.path.dirname(__file__)
-                model_dir = os.path.join(base_dir, "..", model_dir)
-                model_dir = os.path.normpath(model_dir)
+            model_dir = self.settings.get().model_dir_path
             
             if not os.path.exists(model_dir):
                 return {
@@ -786,21 +1468,8 @@ class Translator:
                     "models": []
                 }
             
-            # 查找所有 .gguf 文件
-            models = []
-            for file in os.listdir(model_dir):
-                if file.endswith('.gguf'):
-                    file_path = os.path.join(model_dir, file)
-                    file_size = os.path.getsize(file_path)
-                    models.append({
-                        "name": file,
-                        "path": file_path,
-                        "size": file_size,
-                        "size_mb": round(file_size / (1024 * 1024), 2)
-                    })
-            
-            # 按文件名排序
-            models.sort(key=lambda x: x["name"])
+            # 模型索引只解析新增或修改过的文件，按文件名排序
+            models = self.models.scan(model_dir)
             
             return {
                 "success": True,
@@ -815,23 +1484,15 @@ class Translator:
                 "models": []
             }
     
-    def switch_model(self, model_name):
+    async def switch_model(self, model_name):
         """
         切换模型
-        如果模型已加载，需要重新加载
+        目标模型已常驻内存时直接切换；否则在后台线程中加载并预热新模型，旧模型继续服务，
+        新模型就绪后再切换配置，等待旧模型上的任务完成（进度见 get_switch_status）
         """
-        import os
-        
         try:
-            config = self.get_config()
-            model_dir = config.get("model_dir", "./models")
-            
-            # 如果路径是相对路径，转换为绝对路径
-            if not os.path.isabs(model_dir):
-                base_dir = os.path.dirname(__file__)
-                model_dir = os.path.join(base_dir, "..", model_dir)
-                model_dir = os.path.normpath(model_dir)
-            
+            settings = self.settings.get()
+            model_dir = settings.model_dir_path
             model_path = os.path.join(model_dir, model_name)
             
             if not os.path.exists(model_path):
@@ -840,25 +1501,29 @@ class Translator:
                     "error": f"模型文件不存在: {model_path}"
                 }
             
-            # 更新配置中的当前模型
-            config["current_model"] = model_name
-            self.update_config(config)
-            
-            # 标记需要重新创建模型实例
-            if self.llm_instance is not None:
-                try:
-                    del self.llm_instance
-                except:
-                    pass
-                self.llm_instance = None
-                self._need_recreate = True
+            serving_path, _ = self._resolve_model_path(settings)
+            if self.llm_instance is None or serving_path == model_path or importlib.util.find_spec("llama_cpp") is None:
+                # 没有正在服务的模型（或切换到同一模型）：直接更新配置，按需加载
+                self._save_current_model(model_name)
+                self.swap.update(SWAP_DONE, model=model_name, previous=None, message=f"已切换到模型: {model_name}", progress=1.0)
+                logger.info(f"已切换到模型: {model_name}")
+                return {
+                    "success": True,
+                    "message": f"已切换到模型: {model_name}",
+                    "model_path": model_path,
+                    "swap": self.swap.to_dict()
+                }
             
-            logger.info(f"已切换到模型: {model_name}")
+            if self._swap_task is not None and not self._swap_task.done():
+                self._swap_task.cancel()
+            self.swap.update(SWAP_LOADING, model=model_name, previous=os.path.basename(serving_path), message=f"正在后台加载模型: {model_name}", progress=0.0)
+            self._swap_task = asyncio.get_running_loop().create_task(self._hot_swap(model_name, model_path, serving_path))
             
             return {
                 "success": True,
-                "message": f"已切换到模型: {model_name}",
-                "model_path": model_path
+                "message": f"正在后台加载模型: {model_name}，加载完成后自动切换",
+                "model_path": model_path,
+                "swap": self.swap.to_dict()
             }
         except Exception as e:
             logger.error(f"切换模型失败: {str(e)}")
@@ -867,9 +1532,72 @@ class Translator:
                 "error": str(e)
             }
 
-    async def translate_pdf_stream(self, pdf_path: str, source_lang: str, target_lang: str, provider: str, save_path: str, smart_layout: bool = True):
+    def _save_current_model(self, model_name: str):
+        config = self.settings.get().to_dict()
+        config["current_model"] = model_name
+        self.update_config(config)
+
+    async def _hot_swap(self, model_name: str, model_path: str, serving_path: str):
+        """
+        后台加载 -> 原子切换 -> 等待旧模型排空
+        加载期间旧模型不会因内存预算被淘汰；切换后如果超出预算，旧模型排空后释放
+        """
+        current_priority.set(PRIORITY_BATCH)
+        started = time.monotonic()
+        try:
+            settings = self.settings.get()
+            specs = self._model_specs(model_path, settings)
+            warmup_prompt = build_translation_prompt(WARMUP_TEXT, TARGET_LANG_MAP["zh"])
+
+            for index, (model_file, params) in enumerate(specs):
+                def on_progress(done: int, total: int, index=index):
+                    done += index * total
+                    total *= len(specs)
+                    self.swap.update(message=f"已加载 {done}/{total} 个模型实例", progress=0.9 * done / total)
+
+                await asyncio.to_thread(
+                    self.pool.preload, model_file, params, warmup_prompt,
+                    protect=lambda entry: entry.model_path == serving_path,
+                    on_progress=on_progress
+                )
+            await self._get_tokenizer(model_path)
+
+            # 切换配置：此后的新请求使用新模型（推理线程直接切换到已加载的常驻实例）
+            self.swap.update(SWAP_SWAPPING, message="正在切换模型", progress=0.9)
+            self._swap_target = model_path
+            try:
+                self._save_current_model(model_name)
+            finally:
+                self._swap_target = None
+            self.readiness.update(STATE_READY, model=model_name, message="模型已就绪", progress=1.0)
+
+            # 等待仍在使用旧模型的任务完成
+            self.swap.update(SWAP_DRAINING, message="等待旧模型上的任务完成", progress=0.95)
+            while self.pool.inflight(serving_path) > 0:
+                await asyncio.sleep(0.05)
+            if self.pool.resident.over_budget():
+                released = self.pool.resident.evict_model(serving_path)
+                logger.info(f"旧模型已排空，释放 {released} 个实例: {serving_path}")
+
+            elapsed = round(time.monotonic() - started, 2)
+            self.swap.update(SWAP_DONE, message=f"已切换到模型: {model_name}（{elapsed} 秒）", progress=1.0)
+            logger.info(f"已切换到模型: {model_name}，用时 {elapsed} 秒")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"后台加载模型失败: {str(e)}")
+            self.swap.update(SWAP_ERROR, message=f"后台加载模型失败: {str(e)}，继续使用原模型")
+
+    def get_switch_status(self, since: int = 0):
+        """
+        获取模型切换进度（since 之后的事件）
+        """
+        return self.swap.to_dict(since)
+
+    async def translate_pdf_stream(self, pdf_path: str, source_lang: str, target_lang: str, provider: str, save_path: str, smart_layout: bool = True, priority: str = PRIORITY_BATCH):
         """
         流式翻译PDF文件(保持排版)，产生进度事件
+        每个文本块（或打包的一组短文本块）单独提交推理任务，交互请求可以在任务之间插队
         """
         import os
         import json
@@ -940,11 +1668,9 @@ class Translator:
                      fontname = "custom-font"
                      fontfile = font_path
 
-                # 逐个块处理
+                # 提取本页所有文本块及其字号
+                page_items = []
                 for i, block in enumerate(text_blocks):
-                    bbox = block["bbox"]
-                    x0, y0, x1, y1 = bbox
-                    
                     # 提取文本并分析各行字体
                     block_text = ""
                     font_sizes = []
@@ -960,75 +1686,89 @@ class Translator:
                     text = block_text.strip()
                     if not text:
                         continue
-                     
-                    # 发送当前块开始翻译事件
-                    msg = f"正在翻译第 {page_num + 1}/{total_pages} 页 (块 {i+1}/{total_blocks})..."
-                    if i % 5 == 0:
-                        logger.info(msg)
-                    
-                    yield json.dumps({
-                        "type": "progress", 
-                        "stage": "translating", 
-                        "current_page": page_num + 1, 
-                        "total_pages": total_pages,
-                        "current_segment": i + 1,
-                        "total_segments": total_blocks,
-                        "message": f"正在翻译第 {page_num + 1}/{total_pages} 页 (块 {i+1}/{total_blocks})..."
-                    }) + "\n"
+                    page_items.append((i, block["bbox"], text, font_sizes))
+
+                # 本页所有块同时提交翻译，由推理线程池并行处理（短文本块打包翻译）；结果按阅读顺序写回
+                tasks = self.submit_many([item[2] for item in page_items], source_lang, target_lang, provider, priority=priority)
+
+                # 逐个块处理
+                try:
+                    for (i, bbox, text, font_sizes), task in zip(page_items, tasks):
+                        x0, y0, x1, y1 = bbox
+                         
+                        # 发送当前块开始翻译事件
+                        msg = f"正在翻译第 {page_num + 1}/{total_pages} 页 (块 {i+1}/{total_blocks})..."
+                        if i % 5 == 0:
+                            logger.info(msg)
                         
-                    # 翻译文本块
-                    try:
-                        result = await self.translate(text, source_lang, target_lang, provider)
-                        if result["success"]:
-                            translated_text = result["translated_text"]
+                        yield json.dumps({
+                            "type": "progress", 
+                            "stage": "translating", 
+                            "current_page": page_num + 1, 
+                            "total_pages": total_pages,
+                            "current_segment": i + 1,
+                            "total_segments": total_blocks,
+                            "message": f"正在翻译第 {page_num + 1}/{total_pages} 页 (块 {i+1}/{total_blocks})..."
+                        }) + "\n"
                             
-                            # 替换文本
-                            # 1. 删除原内容
-                            rect = fitz.Rect(x0, y0, x1, y1)
-                            page.add_redact_annot(rect, fill=(1, 1, 1)) # 使用白色填充删除区域
-                            page.apply_redactions()
+                        # 等待文本块翻译结果
+                        try:
+                            result = await task
+                            if result["success"]:
+                                translated_text = result["translated_text"]
                             
-                            # 2. 写入新文本
-                            # 需要注册字体
-                            if fontfile:
-                                page.insert_font(fontname=fontname, fontfile=fontfile)
+                                # 替换文本
+                                # 1. 删除原内容
+                                rect = fitz.Rect(x0, y0, x1, y1)
+                                page.add_redact_annot(rect, fill=(1, 1, 1)) # 使用白色填充删除区域
+                                page.apply_redactions()
                             
-                            # 确定目标字号
-                            target_fontsize = 10 # 默认
-                            if smart_layout and font_sizes:
-                                # 取出现次数最多的字号作为基准
-                                try:
-                                    target_fontsize = max(set(font_sizes), key=font_sizes.count)
-                                    # 翻译为中文通常更紧凑，稍微减小一点点以防溢出，但如果是标题(>14)则保留
-                                    if target_fontsize < 14:
-                                        target_fontsize = max(6, target_fontsize - 1)
-                                except:
-                                    pass
+                                # 2. 写入新文本
+                                # 需要注册字体
+                                if fontfile:
+                                    page.insert_font(fontname=fontname, fontfile=fontfile)
                             
-                            # 尝试多次插入，调节字体大小
-                            inserted = False
-                            # 尝试从目标字号开始向下尝试
-                            start_size = int(target_fontsize) if smart_layout else 10
-                            # 确保至少尝试到 6
-                            sizes_to_try = list(range(start_size, 5, -1))
-                            if not sizes_to_try: # if start_size is small
-                                sizes_to_try = [start_size]
+                                # 确定目标字号
+                                target_fontsize = 10 # 默认
+                                if smart_layout and font_sizes:
+                                    # 取出现次数最多的字号作为基准
+                                    try:
+                                        target_fontsize = max(set(font_sizes), key=font_sizes.count)
+                                        # 翻译为中文通常更紧凑，稍微减小一点点以防溢出，但如果是标题(>14)则保留
+                                        if target_fontsize < 14:
+                                            target_fontsize = max(6, target_fontsize - 1)
+                                    except:
+                                        pass
                             
-                            for fontsize in sizes_to_try:
-                                ret = page.insert_textbox(rect, translated_text, fontname=fontname, fontsize=fontsize, align=0, color=(0, 0, 0))
-                                if ret >= 0:
-                                    inserted = True
-                                    break
+                                # 尝试多次插入，调节字体大小
+                                inserted = False
+                                # 尝试从目标字号开始向下尝试
+                                start_size = int(target_fontsize) if smart_layout else 10
+                                # 确保至少尝试到 6
+                                sizes_to_try = list(range(start_size, 5, -1))
+                                if not sizes_to_try: # if start_size is small
+                                    sizes_to_try = [start_size]
                             
-                            if not inserted:
-                                logger.warning(f"Page {page_num+1} Block {i} 文本过长无法完整放入框内: {translated_text[:20]}...")
-                                # forcefully insert with smallest font
-                                page.insert_textbox(rect, translated_text, fontname=fontname, fontsize=5, align=0, color=(0, 0, 0))
+                                for fontsize in sizes_to_try:
+                                    ret = page.insert_textbox(rect, translated_text, fontname=fontname, fontsize=fontsize, align=0, color=(0, 0, 0))
+                                    if ret >= 0:
+                                        inserted = True
+                                        break
                             
-                        else:
-                            logger.error(f"Page {page_num+1} Block {i} translation failed: {result.get('error')}")
-                    except Exception as e:
-                        logger.error(f"Page {page_num+1} Block {i} error: {e}")
+                                if not inserted:
+                                    logger.warning(f"Page {page_num+1} Block {i} 文本过长无法完整放入框内: {translated_text[:20]}...")
+                                    # forcefully insert with smallest font
+                                    page.insert_textbox(rect, translated_text, fontname=fontname, fontsize=5, align=0, color=(0, 0, 0))
+                            
+                            else:
+                                logger.error(f"Page {page_num+1} Block {i} translation failed: {result.get('error')}")
+                        except Exception as e:
+                            logger.error(f"Page {page_num+1} Block {i} error: {e}")
+                finally:
+                    # 生成器提前结束时取消尚未完成的翻译任务
+                    for task in tasks:
+                        if not task.done():
+                            task.cancel()
             
             # 3. 保存新文件
             yield json.dumps({
@@ -1083,6 +1823,18 @@ class Translator:
     # extract_and_segment_pdf 和 create_pdf_from_text 不再被翻译流程主要调用
 
 
+def _copy_result(source: asyncio.Future, target: asyncio.Future):
+    """将 source 的结果（或异常、取消）复制到 target"""
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(dict(source.result()))
+
+
 # 全局翻译器实例
 translator = Translator()
 